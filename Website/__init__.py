@@ -4,50 +4,106 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from flask_bcrypt import Bcrypt
-from flask_migrate import Migrate 
 from dotenv import load_dotenv
+import click
 import os
+from .startup import StartupProfile
 
 db = SQLAlchemy() #Initialize the db, do not assign yet 
 bcrypt = Bcrypt() #Initialize without passing app yet
 
-load_dotenv() # Load the .env file to access the keys 
+SCHEMA_MODES = ('create_all', 'migrations')
 
 def create_app(test_config=None):
+    profile = StartupProfile() # Time spent in each phase below; see `flask startup-profile`
+    load_dotenv() # Load the .env file to access the keys 
     app = Flask(__name__, template_folder='templates')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False 
     app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY')
+    # 'create_all' creates missing tables on every boot; 'migrations' leaves the schema to `flask db upgrade`,
+    # so workers start without connecting to the database (bootstrap an empty database with `flask init-schema`)
+    app.config['SCHEMA_MANAGEMENT'] = os.getenv('SCHEMA_MANAGEMENT', 'create_all')
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12)) # Cost of new password hashes; older hashes are upgraded at login
+    app.config['PASSWORD_HASH_WORKERS'] = 2 # Hashes computed at once per process; 0 hashes inside the request thread
+    app.config['PASSWORD_HASH_QUEUE'] = 16 # Logins allowed to wait for a hashing thread before the rest are turned away
+    app.config['SUPABASE_URL'] = os.getenv('SUPABASE_URL')
+    app.config['SUPABASE_API_KEY'] = os.getenv('SUPABASE_API_KEY')
+    app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND') # 'supabase' or 'local'; defaults to Supabase when SUPABASE_URL is set
+    app.config['STORAGE_TIMEOUT'] = (5, 60) # (connect, read) seconds for storage requests
+    app.config['STORAGE_RETRIES'] = 3
+    app.config['STORAGE_RETRY_BACKOFF'] = 0.5 # Seconds before the first retry, doubled each time
+    app.config['STORAGE_POOL_SIZE'] = 10 # Keep-alive connections to the storage API
+    app.config['MEDIA_WORKERS'] = 4 # Background upload threads per process; 0 uploads inside the request
+    app.config['MEDIA_QUEUE_SIZE'] = 32 # Jobs allowed to wait for a worker before requests upload inline
+    app.config['MEDIA_JOB_RETRIES'] = 3
+    app.config['MEDIA_JOB_BACKOFF'] = 1.0
+    app.config['MAX_PHOTO_SIZE'] = 20 * 1024 * 1024
+    app.config['MAX_MEDIA_SIZE'] = 500 * 1024 * 1024 # Exercise videos
+    app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_MEDIA_SIZE'] + 1024 * 1024 # Room for the other form fields
+    app.config['SQL_STATS'] = True # Count and time the statements of each request; see sql_stats.py
+    app.config['SERVER_TIMING'] = True # Send those numbers back in a Server-Timing header
+    app.config['N_PLUS_ONE_THRESHOLD'] = 5 # Runs of one statement in a request before a warning is logged
+    app.config['METRICS'] = True # Prometheus metrics at /metrics; see metrics.py
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN') # When set, /metrics requires "Authorization: Bearer <token>"
     
     if test_config is not None:
         app.config.update(test_config)
     
-    app.config['UPLOADS_BASE_DIR'] = os.path.join(app.root_path, 'static', 'uploads')
+    app.config.setdefault('UPLOADS_BASE_DIR', os.getenv('UPLOADS_BASE_DIR') or os.path.join(app.root_path, 'static', 'uploads'))
+    app.config.setdefault('MEDIA_STAGING_DIR', os.path.join(app.instance_path, 'staging')) # Uploads waiting for a worker
     app.config['UPLOADED_PHOTOS_DEST'] = os.path.join(app.config['UPLOADS_BASE_DIR'], 'progress_photos')
     app.config['UPLOADED_EXERCISES_DEST'] = os.path.join(app.config['UPLOADS_BASE_DIR'], 'exercises')
+    from .engine import engine_options
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI'])) # Pool, pre-ping, timeouts
+    if app.config['SCHEMA_MANAGEMENT'] not in SCHEMA_MODES:
+        raise ValueError(f"Unknown SCHEMA_MANAGEMENT '{app.config['SCHEMA_MANAGEMENT']}'")
+    profile.mark('config')
     
-    migrate = Migrate(app, db)
     db.init_app(app) # Connect database to the app
     bcrypt.init_app(app) # Passsing app to bcrypt
+
+    from .passwords import password_hasher
+    password_hasher.init_app(app)
+
+    from .sql_stats import init_sql_stats
+    init_sql_stats(app)
+
+    from .metrics import init_metrics
+    init_metrics(app)
+    profile.mark('extensions')
+
+    from .cache import init_cache, load_user_snapshot
+    init_cache(app)
+
+    from .storage import init_storage, get_storage
+    init_storage(app)
+
+    from .media_jobs import media_jobs, media_urls
+    media_jobs.init_app(app)
+    profile.mark('storage and media jobs')
     
-    from .models import User, ExerciseLog, WeightLog, ExerciseMedia, Note, Challenge, UserChallenge, UserBadges, Session # Import the models
+    from .models import User, ExerciseLog, WeightLog, ExerciseMedia, Note, Challenge, UserChallenge, UserBadges, Session, DailyRollup, MediaObject # Import the models
+    profile.mark('models')
     
-    with app.app_context():
-        # Note.__table__.drop(db.engine, checkfirst=True)
-        # Note.__table__.create(db.engine)
-        # Challenge.__table__.drop(db.engine, checkfirst=True)
-        # UserChallenge.__table__.drop(db.engine, checkfirst=True)
-        # UserBadges.__table__.drop(db.engine, checkfirst=True)
-        # ExerciseLog.__table__.drop(db.engine, checkfirst=True)
-        # Session.__table__.drop(db.engine, checkfirst=True)
-        # User.__table__.drop(db.engine, checkfirst=True)
-        # Challenge.__table__.create(db.engine)
-        # UserChallenge.__table__.create(db.engine)
-        # UserBadges.__table__.create(db.engine)
-        # ExerciseLog.__table__.create(db.engine)
-        # Session.__table__.create(db.engine)
-        # User.__table__.create(db.engine)
-        db.create_all() #Creates a database table for our data models
+    if app.config['SCHEMA_MANAGEMENT'] == 'create_all':
+        with app.app_context():
+            # Note.__table__.drop(db.engine, checkfirst=True)
+            # Note.__table__.create(db.engine)
+            # Challenge.__table__.drop(db.engine, checkfirst=True)
+            # UserChallenge.__table__.drop(db.engine, checkfirst=True)
+            # UserBadges.__table__.drop(db.engine, checkfirst=True)
+            # ExerciseLog.__table__.drop(db.engine, checkfirst=True)
+            # Session.__table__.drop(db.engine, checkfirst=True)
+            # User.__table__.drop(db.engine, checkfirst=True)
+            # Challenge.__table__.create(db.engine)
+            # UserChallenge.__table__.create(db.engine)
+            # UserBadges.__table__.create(db.engine)
+            # ExerciseLog.__table__.create(db.engine)
+            # Session.__table__.create(db.engine)
+            # User.__table__.create(db.engine)
+            db.create_all() #Creates a database table for our data models
+    profile.mark('schema')
 
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -55,7 +111,7 @@ def create_app(test_config=None):
     
     @login_manager.user_loader
     def load_user(user_id): 
-        return User.query.get(int(user_id))
+        return load_user_snapshot(int(user_id)) # Cached; see cache.py
     
     @app.context_processor
     def inject_theme():
@@ -67,22 +123,50 @@ def create_app(test_config=None):
     @app.context_processor
     def inject_supabase_photo_url():
         def supabase_photo_url(filename):
-            supabase_url = os.getenv('SUPABASE_URL')
             bucket_name = 'progress-photos'
-            return f"{supabase_url}/storage/v1/object/public/{bucket_name}/user_{current_user.id}/{filename}"
+            return get_storage().public_url(bucket_name, f"user_{current_user.id}/{filename}")
         return dict(supabase_photo_url=supabase_photo_url)
 
     @app.context_processor
     def inject_supabase_exercise_url():
         def supabase_exercise_url(filename):
-            supabase_url = os.getenv('SUPABASE_URL')
             bucket_name = 'exercise-media'
-            return f"{supabase_url}/storage/v1/object/public/{bucket_name}/user_{current_user.id}/{filename}"
+            return get_storage().public_url(bucket_name, f"user_{current_user.id}/{filename}")
         return dict(supabase_exercise_url=supabase_exercise_url)
+
+    @app.context_processor
+    def inject_media_urls():
+        def photo_urls(photo):
+            return media_urls('photo', photo, current_user.id)
+        def exercise_media_urls(media):
+            return media_urls('exercise', media, current_user.id)
+        return dict(photo_urls=photo_urls, exercise_media_urls=exercise_media_urls)
+    
+    profile.mark('login and templates')
     
     from .views import main
     app.register_blueprint(main) # Connect blueprint to app so we can use in .views
-    
+    profile.mark('views')
+
+    from .commands import explain_queries_command, backfill_rollups_command, import_data_command, retry_media_command, \
+        reconcile_storage_command, init_schema_command, startup_profile_command, seed_command
+    app.cli.add_command(explain_queries_command)
+    app.cli.add_command(backfill_rollups_command)
+    app.cli.add_command(import_data_command)
+    app.cli.add_command(retry_media_command)
+    app.cli.add_command(reconcile_storage_command)
+    app.cli.add_command(init_schema_command)
+    app.cli.add_command(startup_profile_command)
+    app.cli.add_command(seed_command)
+
+    # Flask-Migrate imports all of Alembic (~150 ms), which only the `flask db` commands use, so it is set up when
+    # the flask command builds the app and skipped in gunicorn workers and tests
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    profile.mark('commands')
+
+    app.extensions['startup_profile'] = profile
     return app
 
 
@@ -0,0 +1,97 @@
+# Analytics engine: every chart series for the analytics page from a single round trip
+# All date bucketing is done in Python, so the same code runs on every SQLAlchemy dialect
+
+import datetime
+from . import db
+from .models import User, DailyRollup
+from .rollups import EXERCISE_TYPES, parse_day
+
+RANGE_DAYS = {'7d': 7, '30d': 30, '90d': 90, '1y': 365}
+DAY_LABELS = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+def date_window(date_range, now=None):
+    end_date = now or datetime.datetime.now()
+    start_date = end_date - datetime.timedelta(days=RANGE_DAYS.get(date_range, 365)) # Anything unknown means the last year
+    return start_date, end_date
+
+def analytics_query(user_id, start_date, end_date):
+    # One UNION ALL statement: the user's daily rollup rows plus the site-wide sign-ups per day.
+    # Every branch returns (kind, day, sessions, strength, cardio, flexibility, hiit, volume, joined, completed)
+    rollup_rows = db.select(
+        db.literal('rollup').label('kind'),
+        DailyRollup.day.label('day'),
+        DailyRollup.session_count,
+        DailyRollup.strength_count,
+        DailyRollup.cardio_count,
+        DailyRollup.flexibility_count,
+        DailyRollup.hiit_count,
+        DailyRollup.total_volume,
+        DailyRollup.challenges_joined,
+        DailyRollup.challenges_completed
+    ).filter(
+        DailyRollup.user_id == user_id,
+        DailyRollup.day.between(start_date.date(), end_date.date())
+    )
+
+    signup_day = db.func.date(User.created_at)
+    zero = db.literal(0)
+    growth_rows = db.select(
+        db.literal('growth'), signup_day, db.func.count(User.id),
+        zero, zero, zero, zero, db.literal(0.0), zero, zero
+    ).filter(
+        User.created_at.between(start_date, end_date)
+    ).group_by(signup_day)
+
+    return db.union_all(rollup_rows, growth_rows)
+
+def bucket_rows(rows):
+    # Turns the rows from analytics_query into the chart data used by analytics.html
+    growth = {}
+    frequency = [0] * 7
+    completion = [0, 0, 0]
+    distribution = [0] * len(EXERCISE_TYPES)
+    volume = {}
+
+    for kind, day, sessions, strength, cardio, flexibility, hiit, total_volume, joined, completed in rows:
+        day = parse_day(day)
+        if kind == 'growth':
+            growth[day] = sessions # The count column carries the number of sign-ups
+            continue
+
+        frequency[(day.weekday() + 1) % 7] += sessions # Sunday first, like the labels
+        completion[0] += completed
+        completion[1] += joined - completed
+        for index, count in enumerate((strength, cardio, flexibility, hiit)):
+            distribution[index] += count
+        if total_volume:
+            volume[day] = total_volume
+
+    growth_days = sorted(growth)
+    volume_days = sorted(volume)
+    return {
+        'user_growth': {
+            'labels': [str(day) for day in growth_days],
+            'data': [growth[day] for day in growth_days]
+        },
+        'workout_frequency': {
+            'labels': DAY_LABELS,
+            'data': frequency
+        },
+        'challenge_completion': {
+            'labels': ['Completed', 'In Progress', 'Not Started'],
+            'data': completion
+        },
+        'exercise_distribution': {
+            'labels': ['Strength', 'Cardio', 'Flexibility', 'HIIT'],
+            'data': distribution
+        },
+        'volume': {
+            'labels': [str(day) for day in volume_days],
+            'data': [volume[day] for day in volume_days]
+        }
+    }
+
+def build_analytics_data(user_id, date_range):
+    start_date, end_date = date_window(date_range)
+    rows = db.session.execute(analytics_query(user_id, start_date, end_date)).all()
+    return bucket_rows(rows)
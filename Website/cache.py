@@ -0,0 +1,134 @@
+# In-process result cache for per-user pages (analytics)
+# Entries are tagged with the user's data_version, which lives in the database, so a write handled by
+# any gunicorn worker invalidates the cached results in every worker without an external cache server
+#
+# The logged-in user is cached here too: load_user returns a read-only UserSnapshot from a short-TTL LRU cache
+# instead of querying the user table on every request. A change made in one worker is dropped from that worker's
+# cache at once and reaches the others when their entry expires (USER_CACHE_TTL). With USER_SNAPSHOT_COOKIE the
+# snapshot also travels in the signed session cookie, so requests that only read the user never touch the database.
+
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, session, has_request_context
+from flask_login import UserMixin
+from . import db
+from .models import User
+
+SNAPSHOT_SESSION_KEY = '_user_snapshot'
+
+class ResultCache:
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl # Seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (version, expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        # key -> token of the latest computation in flight. discard(key) drops the token, so a value computed from data
+        # older than the discard is not stored; computations for other keys are not affected
+        self._computing = {}
+
+    def get_or_compute(self, key, version, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            token = self._computing[key] = object()
+
+        try:
+            value = compute() # Computed outside the lock so one slow user does not block the others
+        except BaseException:
+            with self._lock:
+                if self._computing.get(key) is token:
+                    del self._computing[key]
+            raise
+        with self._lock:
+            if self._computing.get(key) is not token: # Discarded meanwhile, or a newer computation will store it
+                return value
+            del self._computing[key]
+            self._entries[key] = (version, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._computing.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._computing.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+class UserSnapshot(UserMixin):
+    # The User columns pages read through current_user. Shared between requests and never attached to a session,
+    # so it is read-only: routes that change the user load the row, commit, then call invalidate_user()
+    FIELDS = ('id', 'username', 'email', 'theme', 'notification_email', 'display_name')
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            object.__setattr__(self, field, values.get(field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"current_user is a cached snapshot; update the User row instead of setting '{name}'")
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{field: getattr(user, field) for field in cls.FIELDS})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+analytics_cache = ResultCache()
+user_cache = ResultCache(max_entries=4096, ttl=30)
+
+def init_cache(app):
+    analytics_cache.max_entries = app.config.get('ANALYTICS_CACHE_SIZE', 1024)
+    analytics_cache.ttl = app.config.get('ANALYTICS_CACHE_TTL', 300)
+    user_cache.max_entries = app.config.get('USER_CACHE_SIZE', 4096)
+    user_cache.ttl = app.config.get('USER_CACHE_TTL', 30) # 0 turns the cache off
+    user_cache.clear()
+
+def load_user_snapshot(user_id):
+    # Flask-Login user_loader: the session cookie's snapshot (if enabled and fresh), then the cache, then the database
+    cookie_mode = current_app.config.get('USER_SNAPSHOT_COOKIE', False)
+    if cookie_mode:
+        stored = session.get(SNAPSHOT_SESSION_KEY)
+        if stored and stored['user'].get('id') == user_id and \
+                time.time() - stored['at'] < current_app.config.get('USER_SNAPSHOT_MAX_AGE', 300):
+            return UserSnapshot(**stored['user'])
+
+    def load():
+        user = db.session.get(User, user_id)
+        return UserSnapshot.from_user(user) if user is not None else None
+    snapshot = user_cache.get_or_compute(user_id, None, load)
+    if cookie_mode and snapshot is not None:
+        session[SNAPSHOT_SESSION_KEY] = {'user': snapshot.to_dict(), 'at': time.time()}
+    return snapshot
+
+def invalidate_user(user_id):
+    # Called after any commit that changes the user's row (settings, password)
+    user_cache.discard(user_id)
+    if has_request_context():
+        session.pop(SNAPSHOT_SESSION_KEY, None)
+
+def current_data_version(user_id):
+    # Read from the database, not current_user: the cached snapshot would let analytics serve results from before a write
+    return db.session.scalar(db.select(User.data_version).filter_by(id=user_id))
+
+def bump_data_version(user_id):
+    # Called in the same transaction as any change to the user's sessions, exercises or challenges
+    db.session.execute(db.update(User).where(User.id == user_id).values(data_version=User.data_version + 1))
@@ -0,0 +1,185 @@
+# Flask CLI commands (run with `flask <command>`)
+
+import click
+import datetime
+import os
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from . import db, rollups, SCHEMA_MODES
+from .importer import import_file
+from .media_jobs import media_jobs, retry_failed, owned_by, MEDIA_MODELS, MEDIA_BUCKETS
+from .reconcile import reconcile, ORPHAN_MIN_AGE
+from .storage import BULK_DELETE_LIMIT
+from .startup import profile_startup
+from .seed import seed, PRESETS, BATCH_USERS, SEED_PASSWORD, username
+from .models import Session, ExerciseLog, WeightLog, Photo, ExerciseMedia, Note, Challenge, UserChallenge, MediaObject
+
+def route_queries(user_id, session_id=1, exercise_id=1, challenge_id=1):
+    # The hot per-user queries issued by the routes in views.py, keyed by route name
+    end_date = datetime.datetime.now()
+    start_date = end_date - datetime.timedelta(days=365)
+    content_hash = '0' * 64 # Any SHA-256 digest; uploads look up earlier copies of the same file
+    return {
+        'dashboard': db.select(Session).filter_by(user_id=user_id).order_by(Session.date.desc()),
+        'session_details': db.select(ExerciseLog).filter_by(session_id=session_id),
+        'exercise_details': db.select(ExerciseMedia).filter_by(exercise_id=exercise_id).order_by(ExerciseMedia.upload_date.desc()),
+        'weightlog': db.select(WeightLog).filter_by(user_id=user_id).order_by(WeightLog.date.desc()),
+        'progressphotos': db.select(Photo).filter_by(user_id=user_id).order_by(Photo.uploaded_at.desc(), Photo.id.desc()),
+        'notes': db.select(Note).filter_by(user_id=user_id).order_by(Note.updated_at.desc()),
+        'join_challenge': db.select(UserChallenge).filter_by(user_id=user_id, challenge_id=challenge_id),
+        'my_challenges': db.select(UserChallenge).filter_by(user_id=user_id).join(Challenge),
+        'analytics': db.select(Session.id).filter(Session.user_id == user_id, Session.date.between(start_date, end_date)),
+        'media_dedup': db.select(MediaObject).filter_by(user_id=user_id, bucket=MEDIA_BUCKETS['photo'], content_hash=content_hash),
+        'photo_reupload': db.select(Photo).filter(owned_by('photo', user_id), Photo.content_hash == content_hash),
+        'exercise_media_reupload': db.select(ExerciseMedia).filter(owned_by('exercise', user_id),
+                                                                   ExerciseMedia.content_hash == content_hash),
+    }
+
+def explain(statement):
+    # Returns the query plan rows for a statement on the current database
+    dialect = db.engine.dialect
+    compiled = statement.compile(dialect=dialect)
+    params = compiled.params
+    if compiled.positional: # SQLite uses ? placeholders
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as connection:
+        return connection.exec_driver_sql(prefix + str(compiled), params).fetchall()
+
+@click.command('explain-queries')
+@click.option('--user-id', default=1, show_default=True, help='User to build the route queries for.')
+@with_appcontext
+def explain_queries_command(user_id):
+    """Print the query plan of every per-user route query."""
+    click.echo(f"Database: {db.engine.dialect.name}")
+    for route, statement in route_queries(user_id).items():
+        click.echo(f"\n== {route} ==")
+        for row in explain(statement):
+            click.echo('  ' + ' | '.join(str(value) for value in row))
+
+@click.command('backfill-rollups')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user (default: everyone).')
+@with_appcontext
+def backfill_rollups_command(user_id):
+    """Rebuild the analytics daily rollups from the raw tables."""
+    rows = rollups.backfill(user_id)
+    click.echo(f"Wrote {rows} daily rollup rows.")
+
+@click.command('import-data')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True, help='User that receives the imported history.')
+@with_appcontext
+def import_data_command(path, user_id):
+    """Bulk import sessions, exercises and weigh-ins from a CSV or JSON file."""
+    with open(path, 'rb') as stream:
+        result = import_file(user_id, stream, path)
+    click.echo(f"Imported {result.sessions} sessions, {result.exercises} exercises and {result.weights} weigh-ins.")
+    if result.duplicates:
+        click.echo(f"Skipped {result.duplicates} rows that were already imported.")
+    for row, message in result.errors:
+        click.echo(f"  row {row}: {message}")
+    if result.error_count > len(result.errors):
+        click.echo(f"  ... and {result.error_count - len(result.errors)} more errors")
+
+@click.command('retry-media')
+@with_appcontext
+def retry_media_command():
+    """Upload again any photos or exercise media that failed to reach storage."""
+    for kind in MEDIA_MODELS:
+        click.echo(f"Requeued {retry_failed(kind)} {kind} uploads.")
+    media_jobs.wait()
+
+@click.command('reconcile-storage')
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted.')
+@click.option('--delete-missing-rows', is_flag=True,
+              help='Also delete photo and media rows whose original file is gone (they are only reported otherwise).')
+@click.option('--kind', type=click.Choice(list(MEDIA_MODELS)), default=None, help='Only check this bucket (default: both).')
+@click.option('--batch-size', type=click.IntRange(1, BULK_DELETE_LIMIT), default=BULK_DELETE_LIMIT, show_default=True,
+              help='Objects removed per bulk delete request.')
+@click.option('--min-age', type=click.IntRange(0), default=int(ORPHAN_MIN_AGE.total_seconds() // 60), show_default=True,
+              help='Minutes an unreferenced object must have existed before it counts as an orphan.')
+@with_appcontext
+def reconcile_storage_command(dry_run, delete_missing_rows, kind, batch_size, min_age):
+    """Delete bucket objects that no media row uses, and report media rows whose file is gone."""
+    for media_kind in [kind] if kind else MEDIA_MODELS:
+        result = reconcile(media_kind, dry_run=dry_run, batch_size=batch_size, min_age=datetime.timedelta(minutes=min_age),
+                           delete_missing_rows=delete_missing_rows)
+        click.echo(f"{result.bucket}: {result.objects} objects, {result.orphan_count} orphaned, "
+                   f"{result.missing_count} rows missing their file, {result.skipped} too new to judge")
+        for key in result.orphans:
+            click.echo(f"  orphan {key}")
+        for row_id, key in result.missing:
+            click.echo(f"  missing {key} ({media_kind} {row_id})")
+        if result.orphan_count + result.missing_count > len(result.orphans) + len(result.missing):
+            click.echo("  ...")
+        if dry_run:
+            click.echo("  Dry run, nothing deleted.")
+        else:
+            click.echo(f"  Deleted {result.deleted_objects} objects and {result.deleted_rows} rows.")
+            if result.missing_count and not delete_missing_rows:
+                click.echo("  Rows missing their file were kept; rerun with --delete-missing-rows to delete them.")
+
+@click.command('init-schema')
+@with_appcontext
+def init_schema_command():
+    """Create the tables on an empty database and mark it as up to date with the migrations."""
+    # The first migrations expect the tables create_all() made, so an empty database starts from the models and
+    # is stamped at the latest revision; from then on `flask db upgrade` manages it (SCHEMA_MANAGEMENT=migrations)
+    tables = set(inspect(db.engine).get_table_names())
+    if 'alembic_version' in tables:
+        click.echo("The schema is already managed by migrations; run `flask db upgrade` to update it.")
+        return
+    if tables:
+        raise click.ClickException("The database has tables but no migration history. "
+                                   "Record the revision it matches with `flask db stamp <revision>` instead.")
+    from flask_migrate import Migrate, stamp
+    if 'migrate' not in current_app.extensions:
+        Migrate(current_app, db)
+    db.create_all()
+    stamp()
+    click.echo(f"Created {len(db.metadata.tables)} tables and stamped the database at the latest migration.")
+
+@click.command('startup-profile')
+@click.option('--runs', default=3, show_default=True, help='Cold starts to take the median of.')
+@click.option('--schema', type=click.Choice(SCHEMA_MODES), default=None,
+              help='SCHEMA_MANAGEMENT for the profiled starts (default: the current setting).')
+@click.option('--top', default=10, show_default=True, help='Number of slowest imports to list.')
+@with_appcontext
+def startup_profile_command(runs, schema, top):
+    """Time a cold start of the app: importing it and each phase of create_app()."""
+    env = dict(os.environ, DATABASE_URL=str(current_app.config['SQLALCHEMY_DATABASE_URI']),
+               SCHEMA_MANAGEMENT=schema or current_app.config['SCHEMA_MANAGEMENT'])
+    profile = profile_startup(runs, env)
+    total = profile['import'] + sum(seconds for _, seconds in profile['phases'])
+    click.echo(f"Cold start ({env['SCHEMA_MANAGEMENT']}, median of {runs}): {total * 1000:.1f} ms")
+    click.echo(f"  {'import Website':<28}{profile['import'] * 1000:8.1f} ms")
+    for phase, seconds in profile['phases']:
+        click.echo(f"  {phase:<28}{seconds * 1000:8.1f} ms")
+    click.echo("Slowest imports (cumulative):")
+    for module, seconds in sorted(profile['modules'].items(), key=lambda item: -item[1])[:top]:
+        click.echo(f"  {module:<28}{seconds * 1000:8.1f} ms")
+
+@click.command('seed')
+@click.option('--preset', type=click.Choice(list(PRESETS)), default='small', show_default=True,
+              help='Users and days of history: ' + ', '.join(f'{name} {u} users x {d} days' for name, (u, d) in PRESETS.items()) + '.')
+@click.option('--users', type=click.IntRange(1), default=None, help='Seed users wanted in total (overrides the preset).')
+@click.option('--days', type=click.IntRange(14), default=None, help='Days of history (overrides the preset).')
+@click.option('--seed', 'seed_value', default=42, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--last-day', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day of the history (default: today).')
+@click.option('--batch-users', type=click.IntRange(1), default=BATCH_USERS, show_default=True, help='Users inserted per transaction.')
+@with_appcontext
+def seed_command(preset, users, days, seed_value, last_day, batch_users):
+    """Fill the database with realistic, reproducible demo users and training history."""
+    started = datetime.datetime.now()
+    def progress(number, result):
+        elapsed = (datetime.datetime.now() - started).total_seconds()
+        click.echo(f"  {username(number)}: {result.total:,} rows in {elapsed:.0f}s ({result.total / max(elapsed, 0.001):,.0f} rows/s)")
+
+    result = seed(preset, users, days, seed_value, last_day, batch_users, progress)
+    if not result.rows['users']:
+        click.echo("The seed users are already there; pass a larger --users or --preset to add more.")
+        return
+    click.echo("Added " + ', '.join(f"{count:,} {name.replace('_', ' ')}" for name, count in result.rows.items()) + '.')
+    click.echo(f"Log in as {username(1)} with the password '{SEED_PASSWORD}'.")
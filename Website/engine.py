@@ -0,0 +1,34 @@
+# SQLAlchemy engine settings for production
+# Unless SQLALCHEMY_ENGINE_OPTIONS is passed in, the options come from the environment:
+# - a bounded pool sized for the threads of one gunicorn worker (gunicorn.conf.py sets DB_POOL_SIZE to match)
+# - pool_pre_ping, so a connection dropped by the database or a proxy is replaced instead of failing a request
+# - pool_recycle below the idle limits of managed Postgres
+# - a statement timeout, so one runaway query cannot hold a worker thread indefinitely
+# SQLite (tests, local development) keeps SQLAlchemy's own pool.
+
+import os
+from . import db
+
+def engine_options(database_url, environ=os.environ):
+    if not database_url or database_url.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 5)), # Extra connections for bursts, closed when returned
+        'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 10)), # Seconds to wait for a free connection
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+    if database_url.startswith('postgresql'):
+        options['connect_args'] = {
+            'connect_timeout': int(environ.get('DB_CONNECT_TIMEOUT', 10)),
+            'options': f"-c statement_timeout={int(environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))}",
+        }
+    return options
+
+def dispose_engines(app):
+    # Called in each gunicorn worker after fork when the app was preloaded in the master: the inherited pooled
+    # connections are dropped without being closed (the master's copies still use those sockets)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
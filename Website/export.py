@@ -0,0 +1,157 @@
+# Streaming export of a user's full history (CSV, NDJSON or Parquet)
+# Rows are read with yield_per (server-side cursors where the driver supports them) and encoded in small
+# chunks, so memory use stays flat no matter how much history the user has
+
+import csv
+import datetime
+import io
+import json
+import zlib
+from . import db
+from .models import Session, ExerciseLog, WeightLog, Note, Challenge, UserChallenge
+
+YIELD_PER = 1000 # Rows fetched from the database at a time
+CHUNK_SIZE = 64 * 1024 # Bytes buffered before a chunk is sent to the client
+
+# Every record type shares one flat set of columns so CSV and Parquet get a single schema
+EXPORT_FIELDS = [
+    ('record_type', 'str'), ('id', 'int'), ('session_id', 'int'), ('date', 'datetime'),
+    ('title', 'str'), ('feeling_before', 'int'), ('feeling_after', 'int'), ('notes', 'str'),
+    ('exercise', 'str'), ('exercise_type', 'str'), ('sets', 'int'), ('reps', 'int'), ('weight', 'float'), ('rpe', 'int'),
+    ('content', 'str'), ('tags', 'str'),
+    ('challenge', 'str'), ('current_value', 'int'), ('completed', 'bool'), ('completed_date', 'datetime'),
+    ('achievement_tier', 'str'), ('earned_points', 'int'),
+]
+FIELD_NAMES = [name for name, _ in EXPORT_FIELDS]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+def export_queries(user_id):
+    # (record_type, select) pairs; columns are labelled with their EXPORT_FIELDS names
+    return [
+        ('session', db.select(
+            Session.id, Session.date, Session.title, Session.feeling_before, Session.feeling_after, Session.notes
+        ).filter(Session.user_id == user_id).order_by(Session.id)),
+        ('exercise', db.select(
+            ExerciseLog.id, ExerciseLog.session_id, ExerciseLog.date, ExerciseLog.exercise, ExerciseLog.exercise_type,
+            ExerciseLog.sets, ExerciseLog.reps, ExerciseLog.weight, ExerciseLog.rpe
+        ).join(Session, ExerciseLog.session_id == Session.id).filter(Session.user_id == user_id).order_by(ExerciseLog.id)),
+        ('weight', db.select(
+            WeightLog.id, WeightLog.date, WeightLog.weight
+        ).filter(WeightLog.user_id == user_id).order_by(WeightLog.id)),
+        ('note', db.select(
+            Note.id, Note.session_id, Note.updated_at.label('date'), Note.title, Note.content, Note.tags
+        ).filter(Note.user_id == user_id).order_by(Note.id)),
+        ('challenge', db.select(
+            UserChallenge.id, UserChallenge.created_at.label('date'), Challenge.title.label('challenge'),
+            UserChallenge.current_value, UserChallenge.completed, UserChallenge.completed_date,
+            UserChallenge.achievement_tier, UserChallenge.earned_points
+        ).join(Challenge, UserChallenge.challenge_id == Challenge.id).filter(UserChallenge.user_id == user_id).order_by(UserChallenge.id)),
+    ]
+
+def export_records(user_id):
+    # Yields one dict per row across every table
+    for record_type, query in export_queries(user_id):
+        result = db.session.execute(query.execution_options(yield_per=YIELD_PER))
+        for row in result.mappings():
+            record = dict(row)
+            record['record_type'] = record_type
+            yield record
+
+def json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def to_ndjson(records):
+    buffer = io.StringIO()
+    for record in records:
+        buffer.write(json.dumps(record, default=json_default, separators=(',', ':')))
+        buffer.write('\n')
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def to_csv(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELD_NAMES)
+    for record in records:
+        writer.writerow([record.get(name) for name in FIELD_NAMES])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+class ChunkSink(io.RawIOBase):
+    # File-like object that hands whatever Parquet writes back to the generator instead of keeping it
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def parquet_available():
+    try:
+        import pyarrow # noqa: F401 (optional dependency)
+        return True
+    except ImportError:
+        return False
+
+def to_parquet(records, batch_size=YIELD_PER * 10):
+    # Requires pyarrow; one row group is written (and sent) per batch
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(), 'datetime': pa.timestamp('us')}
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in EXPORT_FIELDS])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            batch = []
+            yield sink.drain()
+    if batch:
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    writer.close()
+    yield sink.drain()
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits=31 writes a gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(records, export_format, compress=True):
+    encoders = {'csv': to_csv, 'ndjson': to_ndjson, 'parquet': to_parquet}
+    chunks = encoders[export_format](records)
+    if compress and export_format != 'parquet': # Parquet is already compressed internally
+        chunks = gzip_chunks(chunks)
+    return chunks
@@ -1,10 +1,11 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, IntegerField, FloatField, FileField, SelectField, TextAreaField, DateField
+from wtforms import Form, StringField, PasswordField, SubmitField, IntegerField, FloatField, FileField, SelectField, TextAreaField, DateField, FieldList, FormField
 from flask_wtf.file import FileAllowed #For the PhotoUploading feature
-from wtforms.validators import InputRequired, Length, ValidationError, EqualTo, Regexp, StopValidation, DataRequired, Email
+from wtforms.validators import InputRequired, Length, ValidationError, EqualTo, Regexp, StopValidation, DataRequired, Email, NumberRange
 from flask import current_app, flash # To avoid circular imports
-from . import db, bcrypt
+from . import db
 from .models import User
+from .passwords import check_password
 
 class RegisterForm(FlaskForm):
     username = StringField(validators=[InputRequired(), Length(min=4, max=20)], render_kw={"placeholder": "Username"})
@@ -20,12 +21,15 @@ class RegisterForm(FlaskForm):
     confirmPassword = PasswordField(validators=[InputRequired(), EqualTo('password', message="Passwords must match")], render_kw={"placeholder": "Confirm Password"})
     submit = SubmitField("Register")
     
+    existing_user = None # Set when the username is taken and the password matches; the view sends them to log in
+
     def validate_username(self, username): # Method to ensure user is notified if already registered
         with current_app.app_context(): # Ensures access to database; if function is called before app is initialized, we can still acesss (app_context)
             existing_user = db.session.execute(db.select(User).filter_by(username=username.data)).scalar() #.scalar() --> ensures only one record or NONE is returned
             if existing_user: # Query for an existering user, if True, then return error message
-                if bcrypt.check_password_hash(existing_user.password, self.password.data):
+                if check_password(existing_user.password, self.password.data): # The only hash on this request
                     flash("Account already exists, log in.", "info")
+                    self.existing_user = existing_user
                     raise StopValidation
                 else:
                     raise ValidationError("That username already exists. Please choose a different one.")
@@ -49,6 +53,23 @@ class WorkoutLog(FlaskForm):
     rpe = IntegerField('RPE', validators=[InputRequired()])
     submit = SubmitField('Log Exercise')
     
+class ExerciseRowForm(Form): # One row of BatchWorkoutLog; plain Form because the CSRF token lives on the parent
+    exercise = StringField('Exercise', validators=[InputRequired(), Length(max=50)])
+    exercise_type = SelectField('Type', choices=[
+        ('strength', 'Strength'),
+        ('cardio', 'Cardio'),
+        ('flexibility', 'Flexibility'),
+        ('hiit', 'HIIT')
+    ], default='strength', validators=[InputRequired()])
+    sets = IntegerField('Sets', validators=[InputRequired(), NumberRange(min=0)])
+    reps = IntegerField('Reps', validators=[InputRequired(), NumberRange(min=0)])
+    weight = FloatField('Weight (lbs)', validators=[InputRequired(), NumberRange(min=0)])
+    rpe = IntegerField('RPE', validators=[InputRequired(), NumberRange(min=0, max=10)])
+    
+class BatchWorkoutLog(FlaskForm): # Logs a whole workout (including repeated sets of one exercise) in one request
+    exercises = FieldList(FormField(ExerciseRowForm), min_entries=1, max_entries=50)
+    submit = SubmitField('Log Exercises')
+    
 class WeightLogForm(FlaskForm):
     weight = FloatField('Weight (lbs)', validators=[DataRequired()])
     submit = SubmitField('Log Weight')
@@ -72,6 +93,13 @@ class ExerciseMediaForm(FlaskForm):
     notes = StringField('Notes')
     submit = SubmitField('Upload')
     
+class ImportForm(FlaskForm):
+    data_file = FileField('Import History', validators=[
+        FileAllowed(['csv', 'json', 'ndjson', 'jsonl'], 'CSV or JSON files only!'),
+        DataRequired()
+    ])
+    submit = SubmitField('Import')
+    
 class SettingsForm(FlaskForm):
     email = StringField('Email', vaidators=[DataRequired(), Email()])
     theme = SelectField('Theme', choices=[('light', 'Light'), ('dark', 'Dark'), ('system', 'System Default')])
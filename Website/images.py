@@ -0,0 +1,75 @@
+# Image derivatives for uploaded photos
+# Runs in the media worker before the upload: the staged original is rewritten upright with its metadata (EXIF, GPS)
+# removed, and WebP thumbnails are written next to it for the gallery srcset
+
+import glob
+import os
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+THUMBNAIL_WIDTHS = (320, 640, 1280) # Gallery tiles are ~250-300px wide, so these cover 1x-4x screens
+WEBP_QUALITY = 80
+JPEG_QUALITY = 90
+REWRITE_FORMATS = {'JPEG': 'JPEG', 'MPO': 'JPEG', 'PNG': 'PNG', 'WEBP': 'WEBP'} # Originals we can re-encode losslessly enough
+
+def variant_name(filename, width):
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}_{width}w.webp"
+
+def open_upright(path):
+    # Returns (image, format) with EXIF orientation applied, or (None, None) if the file is not an image we can read
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            upright = ImageOps.exif_transpose(image)
+            upright.load()
+            return upright, image_format
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None, None
+
+def strip_metadata(image, image_format, path):
+    # Re-saves the original without EXIF (camera, GPS) or text chunks; the colour profile is kept
+    save_format = REWRITE_FORMATS.get(image_format)
+    if save_format is None:
+        return
+    options = {'icc_profile': image.info.get('icc_profile')}
+    if save_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        options.update(quality=JPEG_QUALITY, optimize=True)
+    elif save_format == 'WEBP':
+        options.update(quality=JPEG_QUALITY)
+    image.save(path, save_format, **options)
+
+def make_thumbnails(image, path):
+    # Returns {width: file path}; never upscales, but small images still get one WebP copy at their own size
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    widths = [width for width in THUMBNAIL_WIDTHS if width < image.width] or [image.width]
+    thumbnails = {}
+    for width in widths:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((width, image.height), Image.LANCZOS)
+        thumbnail_path = f"{path}-{width}.webp"
+        thumbnail.save(thumbnail_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+        thumbnails[width] = thumbnail_path
+    return thumbnails
+
+def existing_thumbnails(path):
+    return {int(name[len(path) + 1:-len('.webp')]): name for name in glob.glob(glob.escape(path) + '-*.webp')}
+
+def process_image(path):
+    # Rewrites the staged file in place and returns (width, height, {width: thumbnail path}), or None for non-images.
+    # A retried upload finds its thumbnails already on disk and does not re-encode the original a second time
+    thumbnails = existing_thumbnails(path)
+    if thumbnails:
+        with Image.open(path) as image:
+            return image.width, image.height, thumbnails
+    image, image_format = open_upright(path)
+    if image is None:
+        return None
+    strip_metadata(image, image_format, path)
+    return image.width, image.height, make_thumbnails(image, path)
+
+def remove_thumbnails(path):
+    for thumbnail_path in existing_thumbnails(path).values():
+        os.remove(thumbnail_path)
@@ -0,0 +1,323 @@
+# Bulk import of historical workouts and weigh-ins from CSV or JSON files
+# Rows are parsed as a stream, validated in chunks and written with executemany batches inside one transaction.
+# Accepts the same columns the export produces: a record_type of session, exercise or weight plus its fields.
+# Exercises without a session are grouped into one session per (day, title), reusing the user's session with that
+# day and title if there is one; rows that are already stored are skipped, so an import can safely be repeated.
+
+import csv
+import datetime
+import io
+import json
+from collections import Counter
+from . import db, rollups
+from .models import Session, ExerciseLog, WeightLog
+from .cache import bump_data_version
+
+CHUNK_ROWS = 1000 # Rows validated and inserted per batch
+MAX_REPORTED_ERRORS = 100
+DEFAULT_SESSION_TITLE = 'Imported Workout'
+KG_TO_LBS = 1 / 0.453592
+
+class ImportResult:
+    def __init__(self):
+        self.sessions = 0
+        self.exercises = 0
+        self.weights = 0
+        self.duplicates = 0 # Rows already in the database, e.g. from importing the same file before
+        self.error_count = 0
+        self.errors = [] # (row number, message), capped at MAX_REPORTED_ERRORS
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+
+    @property
+    def imported(self):
+        return self.sessions + self.exercises + self.weights
+
+def read_rows(stream, filename):
+    # Yields dicts from a binary file stream without reading it all into memory (except JSON arrays)
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if filename.lower().endswith('.csv'):
+        yield from csv.DictReader(text)
+        return
+
+    first = text.read(1)
+    while first and first.isspace():
+        first = text.read(1)
+    if first == '[': # A plain JSON array has to be parsed in one go
+        yield from json.loads(first + text.read())
+        return
+
+    # Newline-delimited JSON, one object per line
+    pending = first
+    for line in text:
+        line = (pending + line).strip()
+        pending = ''
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield line # Reported as a bad row by validate_row
+
+def parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    if not value:
+        raise ValueError("date is required")
+    return datetime.datetime.fromisoformat(str(value).strip().replace('Z', ''))
+
+def parse_number(row, name, kind, required=True, default=None):
+    value = row.get(name)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f"{name} is required")
+        return default
+    number = kind(float(value)) if kind is int else kind(value)
+    if number < 0:
+        raise ValueError(f"{name} cannot be negative")
+    return number
+
+def record_type_of(row):
+    # Rows from other apps may not say what they are, so infer it from the columns present
+    record_type = (row.get('record_type') or '').strip().lower()
+    if record_type:
+        return record_type
+    if row.get('exercise'):
+        return 'exercise'
+    if row.get('weight') not in (None, '') and not row.get('sets'):
+        return 'weight'
+    return 'session'
+
+def validate_row(row):
+    # Returns (record_type, values) or raises ValueError with a message for the user
+    if not isinstance(row, dict):
+        raise ValueError("row is not a JSON object")
+    record_type = record_type_of(row)
+    date = parse_date(row.get('date'))
+
+    if record_type == 'weight':
+        weight = parse_number(row, 'weight', float)
+        if (row.get('unit') or 'lbs').strip().lower() == 'kg': # Weights are stored in lbs
+            weight = round(weight * KG_TO_LBS, 1)
+        return 'weight', {'date': date, 'weight': weight}
+
+    title = (row.get('title') or DEFAULT_SESSION_TITLE).strip()[:100]
+
+    if record_type == 'session':
+        return 'session', {
+            'date': date,
+            'title': title,
+            'feeling_before': parse_number(row, 'feeling_before', int, required=False),
+            'feeling_after': parse_number(row, 'feeling_after', int, required=False),
+            'notes': row.get('notes') or None
+        }
+
+    if record_type == 'exercise':
+        exercise = (row.get('exercise') or '').strip()
+        if not exercise:
+            raise ValueError("exercise is required")
+        if len(exercise) > 50:
+            raise ValueError("exercise name is longer than 50 characters")
+        exercise_type = (row.get('exercise_type') or 'strength').strip().lower()
+        if exercise_type not in rollups.EXERCISE_TYPES:
+            raise ValueError(f"unknown exercise_type '{exercise_type}'")
+        return 'exercise', {
+            'date': date,
+            'title': title,
+            'exercise': exercise,
+            'exercise_type': exercise_type,
+            'sets': parse_number(row, 'sets', int),
+            'reps': parse_number(row, 'reps', int),
+            'weight': parse_number(row, 'weight', float, required=False, default=0.0),
+            'rpe': parse_number(row, 'rpe', int, required=False, default=0)
+        }
+
+    raise ValueError(f"unknown record_type '{record_type}'")
+
+def session_key(values):
+    return values['date'].date(), values['title']
+
+def exercise_fingerprint(session_id, values):
+    return (session_id, values['exercise'], values['date'], values['sets'], values['reps'], float(values['weight']), values['rpe'])
+
+class ImportState:
+    # What one import knows about the user's sessions, carried from chunk to chunk.
+    # Sessions already in the database (and their exercises and the user's weigh-ins) are looked up once per chunk,
+    # so importing the same file again adds nothing
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.session_ids = {} # (day, title) -> session id
+        self.existing = set() # Keys of sessions that were in the database before this import
+        self.placeholders = set() # Keys of sessions created for exercises; a later session row fills in their details
+        self.logged = {} # Existing session id -> Counter of its exercise fingerprints
+        self.weighed = Counter() # (date, weight) of weigh-ins in the database, for the days seen so far
+        self.weighed_days = set()
+        self.merged = 0 # Placeholder sessions given their details by a later session row
+
+    def find_sessions(self, keys):
+        # Adds the user's stored sessions for keys not seen yet
+        keys = {key for key in keys if key not in self.session_ids}
+        if not keys:
+            return
+        days = [day for day, _ in keys]
+        statement = db.select(Session.id, Session.date, Session.title).filter(
+            Session.user_id == self.user_id,
+            Session.title.in_({title for _, title in keys}),
+            Session.date >= datetime.datetime.combine(min(days), datetime.time()),
+            Session.date < datetime.datetime.combine(max(days) + datetime.timedelta(days=1), datetime.time())
+        ).order_by(Session.id)
+        for session_id, date, title in db.session.execute(statement):
+            key = (date.date(), title)
+            if key in keys and key not in self.session_ids:
+                self.session_ids[key] = session_id
+                self.existing.add(key)
+
+    def load_exercises(self, session_ids):
+        session_ids = [session_id for session_id in session_ids if session_id not in self.logged]
+        for session_id in session_ids:
+            self.logged[session_id] = Counter()
+        if session_ids:
+            statement = db.select(ExerciseLog.session_id, ExerciseLog.exercise, ExerciseLog.date, ExerciseLog.sets,
+                                  ExerciseLog.reps, ExerciseLog.weight, ExerciseLog.rpe).filter(ExerciseLog.session_id.in_(session_ids))
+            for session_id, exercise, date, sets, reps, weight, rpe in db.session.execute(statement):
+                self.logged[session_id][(session_id, exercise, date, sets, reps, float(weight), rpe)] += 1
+
+    def load_weights(self, days):
+        days = set(days) - self.weighed_days
+        if not days:
+            return
+        self.weighed_days |= days
+        statement = db.select(WeightLog.date, WeightLog.weight).filter(
+            WeightLog.user_id == self.user_id,
+            WeightLog.date >= datetime.datetime.combine(min(days), datetime.time()),
+            WeightLog.date < datetime.datetime.combine(max(days) + datetime.timedelta(days=1), datetime.time())
+        )
+        for date, weight in db.session.execute(statement):
+            if date.date() in days:
+                self.weighed[(date, float(weight))] += 1
+
+    @staticmethod
+    def already_stored(counter, fingerprint):
+        # Each stored row matches one imported row, so a set logged twice is imported twice
+        if counter[fingerprint]:
+            counter[fingerprint] -= 1
+            return True
+        return False
+
+def insert_sessions(state, session_rows):
+    # Inserts sessions that do not exist yet and remembers their ids for the exercises that follow
+    new_rows = [row for key, row in session_rows.items() if key not in state.session_ids]
+    if not new_rows:
+        return 0
+    result = db.session.execute(
+        db.insert(Session).returning(Session.id, sort_by_parameter_order=True),
+        [{'user_id': state.user_id, **row} for row in new_rows]
+    )
+    for row, session_id in zip(new_rows, result.scalars()):
+        state.session_ids[session_key(row)] = session_id
+    return len(new_rows)
+
+def flush_chunk(chunk, state, result):
+    session_rows = {} # Explicit session records win over the placeholder an exercise would create
+    explicit = set()
+    exercises = []
+    weights = []
+    state.find_sessions(session_key(values) for _, record_type, values in chunk if record_type != 'weight')
+    state.load_exercises({state.session_ids[key] for key in state.existing})
+    state.load_weights(values['date'].date() for _, record_type, values in chunk if record_type == 'weight')
+
+    for row_number, record_type, values in chunk:
+        if record_type == 'weight':
+            if state.already_stored(state.weighed, (values['date'], float(values['weight']))):
+                result.duplicates += 1
+            else:
+                weights.append({'user_id': state.user_id, **values})
+            continue
+
+        key = session_key(values)
+        if record_type == 'session':
+            if key in state.existing:
+                result.duplicates += 1
+            elif key in state.placeholders:
+                # Created for earlier exercises in this file; the session row brings its time, feelings and notes
+                db.session.execute(db.update(Session).filter_by(id=state.session_ids[key]).values(**values))
+                state.placeholders.discard(key)
+                state.merged += 1
+            elif key in explicit or key in state.session_ids:
+                result.add_error(row_number, f"duplicate session '{key[1]}' on {key[0].isoformat()}")
+            else:
+                session_rows[key] = values
+                explicit.add(key)
+            continue
+
+        if key in state.existing and \
+                state.already_stored(state.logged[state.session_ids[key]], exercise_fingerprint(state.session_ids[key], values)):
+            result.duplicates += 1
+            continue
+        if key not in state.session_ids and key not in session_rows:
+            session_rows[key] = {
+                'date': datetime.datetime.combine(key[0], datetime.time()),
+                'title': key[1],
+                'feeling_before': None,
+                'feeling_after': None,
+                'notes': None
+            }
+        exercises.append((key, values))
+
+    result.sessions += insert_sessions(state, session_rows)
+    state.placeholders.update(key for key in session_rows if key not in explicit)
+    if exercises:
+        db.session.execute(db.insert(ExerciseLog), [
+            {
+                'session_id': state.session_ids[key],
+                'exercise': values['exercise'],
+                'exercise_type': values['exercise_type'],
+                'sets': values['sets'],
+                'reps': values['reps'],
+                'weight': values['weight'],
+                'rpe': values['rpe'],
+                'date': values['date']
+            } for key, values in exercises
+        ])
+        result.exercises += len(exercises)
+    if weights:
+        db.session.execute(db.insert(WeightLog), weights)
+        result.weights += len(weights)
+
+def import_rows(user_id, rows):
+    # Validates and inserts every row in a single transaction; invalid rows are reported and skipped
+    result = ImportResult()
+    state = ImportState(user_id)
+    chunk = []
+    row_number = 0
+
+    try:
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                chunk.append((row_number, *validate_row(row)))
+            except (ValueError, TypeError) as e:
+                result.add_error(row_number, str(e))
+            if len(chunk) >= CHUNK_ROWS:
+                flush_chunk(chunk, state, result)
+                chunk = []
+    except (ValueError, csv.Error, UnicodeDecodeError) as e: # The file itself is malformed
+        result.add_error(row_number + 1, f"could not read file: {e}")
+
+    try:
+        if chunk:
+            flush_chunk(chunk, state, result)
+        if result.exercises or result.sessions:
+            # Imported history can land on any day, so this user's rollups are rebuilt in the same transaction
+            rollups.backfill(user_id, commit=False)
+        if result.imported or state.merged:
+            bump_data_version(user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+def import_file(user_id, stream, filename):
+    return import_rows(user_id, read_rows(stream, filename))
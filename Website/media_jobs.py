@@ -0,0 +1,274 @@
+# Background uploads and deletes for progress photos and exercise media
+# The request copies the upload to a staging file, saves the row as 'pending' and returns; a bounded thread pool
+# then sends it to storage (with retries) and marks the row 'stored' or 'failed'. Pages poll /api/media_status.
+# Failed uploads keep their staging file so `flask retry-media` can try them again.
+# Images get their metadata stripped and WebP thumbnails made (see images.py) before they are uploaded.
+# Uploads are hashed while they are staged; a user's re-upload of the same file reuses the stored object through
+# MediaObject.ref_count instead of being sent again, and storage is only cleared when the last reference is deleted.
+
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import Photo, ExerciseMedia, MediaObject, ExerciseLog, Session
+from .storage import get_storage, StorageError, UPLOAD_CHUNK_SIZE
+from .images import process_image, remove_thumbnails, variant_name
+
+MEDIA_MODELS = {'photo': Photo, 'exercise': ExerciseMedia}
+MEDIA_BUCKETS = {'photo': 'progress-photos', 'exercise': 'exercise-media'}
+
+class MediaJobs:
+    def __init__(self):
+        self.executor = None
+        self.slots = None
+        self.futures = set()
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        if self.executor is not None: # A new app (tests create several) gets its own pool
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        workers = app.config['MEDIA_WORKERS']
+        if workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media')
+            # Running plus queued jobs; when every slot is taken the request does the work itself
+            self.slots = threading.BoundedSemaphore(workers + app.config['MEDIA_QUEUE_SIZE'])
+        os.makedirs(app.config['MEDIA_STAGING_DIR'], exist_ok=True)
+
+    def submit(self, function, *args):
+        app = current_app._get_current_object()
+        if self.executor is None or not self.slots.acquire(blocking=False):
+            return function(app, *args)
+
+        def run():
+            try:
+                function(app, *args)
+            finally:
+                self.slots.release()
+        future = self.executor.submit(run)
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self.discard)
+        return future
+
+    def discard(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def wait(self, timeout=None):
+        # Blocks until every submitted job has finished (used by tests and on shutdown)
+        with self.lock:
+            pending = list(self.futures)
+        wait(pending, timeout=timeout)
+
+media_jobs = MediaJobs()
+
+def staging_path(kind, record_id):
+    return os.path.join(current_app.config['MEDIA_STAGING_DIR'], f"{kind}-{record_id}")
+
+def owner_id(kind, record):
+    return record.user_id if kind == 'photo' else record.exercise.session.user_id
+
+def owned_by(kind, user_id):
+    # Filter for one user's rows; exercise media only knows its owner through the exercise's session
+    if kind == 'photo':
+        return Photo.user_id == user_id
+    return ExerciseMedia.exercise_id.in_(
+        db.select(ExerciseLog.id).join(Session, ExerciseLog.session_id == Session.id).filter(Session.user_id == user_id))
+
+def object_path(kind, record, filename=None):
+    return f"user_{owner_id(kind, record)}/{filename or record.filename}"
+
+def media_urls(kind, record, user_id):
+    # Original URL plus the smallest thumbnail and a srcset for galleries; records without thumbnails only get 'url'
+    storage = get_storage()
+    bucket = MEDIA_BUCKETS[kind]
+    urls = {'url': storage.public_url(bucket, f"user_{user_id}/{record.filename}"), 'thumbnail': None, 'srcset': None}
+    variants = sorted((int(width), name) for width, name in (record.variants or {}).items())
+    if variants:
+        urls['thumbnail'] = storage.public_url(bucket, f"user_{user_id}/{variants[0][1]}")
+        urls['srcset'] = ', '.join(f"{storage.public_url(bucket, f'user_{user_id}/{name}')} {width}w" for width, name in variants)
+    return urls
+
+def stored_paths(kind, record):
+    # The original plus every thumbnail recorded for it
+    return [object_path(kind, record)] + [object_path(kind, record, name) for name in (record.variants or {}).values()]
+
+def remove_staged(staged):
+    remove_thumbnails(staged)
+    if os.path.exists(staged):
+        os.remove(staged)
+
+def stage_upload(stream, path):
+    # Copies the upload to the staging file and hashes it in the same pass; returns the SHA-256 hex digest
+    digest = hashlib.sha256()
+    with open(path, 'wb') as staged:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            staged.write(chunk)
+    return digest.hexdigest()
+
+def acquire_object(user_id, bucket, content_hash, filename):
+    # Returns (media_object, created); an existing object gains a reference instead of a second upload
+    add_reference = db.update(MediaObject).filter_by(user_id=user_id, bucket=bucket, content_hash=content_hash).\
+        values(ref_count=MediaObject.ref_count + 1)
+    if db.session.execute(add_reference).rowcount == 0:
+        try:
+            with db.session.begin_nested(): # Savepoint, so losing an insert race only undoes the insert
+                media_object = MediaObject(user_id=user_id, bucket=bucket, content_hash=content_hash, filename=filename)
+                db.session.add(media_object)
+            return media_object, True
+        except IntegrityError: # The same file was uploaded by another request at the same time
+            db.session.execute(add_reference)
+    media_object = db.session.scalars(db.select(MediaObject).filter_by(
+        user_id=user_id, bucket=bucket, content_hash=content_hash)).one()
+    return media_object, False
+
+def release_object(kind, record):
+    # Drops one reference; True when nothing else uses the stored files (or the row predates deduplication)
+    if record.content_hash is None:
+        return True
+    match = dict(user_id=owner_id(kind, record), bucket=MEDIA_BUCKETS[kind], content_hash=record.content_hash)
+    db.session.execute(db.update(MediaObject).filter_by(**match).values(ref_count=MediaObject.ref_count - 1))
+    deleted = db.session.execute(db.delete(MediaObject).filter_by(**match).filter(MediaObject.ref_count <= 0))
+    return deleted.rowcount > 0
+
+def queue_upload(kind, record, stream, content_type):
+    # record must already be committed with status 'pending'
+    model = MEDIA_MODELS[kind]
+    staged = staging_path(kind, record.id)
+    content_hash = stage_upload(stream, staged)
+    user_id = owner_id(kind, record)
+    media_object, created = acquire_object(user_id, MEDIA_BUCKETS[kind], content_hash, record.filename)
+    record.content_hash = content_hash
+
+    if not created:
+        # A re-upload: point at the existing object and copy what is known about it
+        record.filename = media_object.filename
+        sibling = db.session.scalars(db.select(model).filter(
+            owned_by(kind, user_id), model.content_hash == content_hash, model.filename == media_object.filename,
+            model.id != record.id, model.status != 'failed'
+        ).order_by(model.status.desc())).first() # 'stored' before 'pending'
+        if sibling is not None:
+            record.status = sibling.status # A pending sibling's upload finishes this row too
+            record.width, record.height, record.variants = sibling.width, sibling.height, sibling.variants
+            db.session.commit()
+            remove_staged(staged)
+            return None
+
+    db.session.commit()
+    return media_jobs.submit(store_media, kind, record.id, user_id, object_path(kind, record), content_type, content_hash)
+
+def queue_delete(kind, record):
+    # Called before the row is deleted; removes any staged copy, and the stored objects once nothing references them
+    paths = stored_paths(kind, record)
+    last_reference = release_object(kind, record)
+    if record.status != 'pending': # A pending upload notices the row is gone and cleans up after itself
+        remove_staged(staging_path(kind, record.id))
+        if last_reference:
+            return media_jobs.submit(remove_media, MEDIA_BUCKETS[kind], paths)
+
+def store_media(app, kind, record_id, user_id, path, content_type, content_hash=None):
+    with app.app_context():
+        retries = app.config['MEDIA_JOB_RETRIES']
+        bucket = MEDIA_BUCKETS[kind]
+        staged = staging_path(kind, record_id)
+        if not os.path.exists(staged): # Deleted while waiting in the queue
+            return
+
+        # (local file, object path, content type) for the original and each thumbnail
+        image = None
+        if not content_type.startswith('video/'):
+            try:
+                image = process_image(staged)
+            except (OSError, ValueError): # Upload the original as it is rather than not at all
+                app.logger.warning("Could not make thumbnails for %s/%s", bucket, path, exc_info=True)
+        files = [(staged, path, content_type)]
+        variants = {}
+        if image is not None:
+            directory, filename = path.rsplit('/', 1)
+            for width, thumbnail_path in sorted(image[2].items()):
+                variants[str(width)] = variant_name(filename, width)
+                files.append((thumbnail_path, f"{directory}/{variants[str(width)]}", 'image/webp'))
+
+        error = None
+        for attempt in range(retries + 1):
+            try:
+                for local_path, object_key, file_type in files:
+                    with open(local_path, 'rb') as f:
+                        # Retries overwrite, in case an earlier attempt stored the object before failing
+                        get_storage().upload(bucket, object_key, f, file_type, upsert=attempt > 0)
+                error = None
+                break
+            except StorageError as e:
+                error = e
+                if attempt < retries:
+                    time.sleep(app.config['MEDIA_JOB_BACKOFF'] * (2 ** attempt))
+
+        model = MEDIA_MODELS[kind]
+        filename = path.rsplit('/', 1)[1]
+        if content_hash is None: # Uploaded before deduplication
+            records = [record for record in [db.session.get(model, record_id)] if record is not None]
+            referenced = bool(records)
+        else:
+            # Re-uploads made while this one was pending share the object and finish with it
+            records = db.session.scalars(db.select(model).filter(owned_by(kind, user_id),
+                model.content_hash == content_hash, model.filename == filename, model.status != 'stored')).all()
+            referenced = db.session.scalars(db.select(MediaObject.id).filter_by(
+                user_id=user_id, bucket=bucket, content_hash=content_hash, filename=filename)).first() is not None
+        if not referenced: # Deleted while it was uploading
+            if error is None:
+                remove_media(app, bucket, [object_key for _, object_key, _ in files])
+            remove_staged(staged)
+            return
+
+        for record in records:
+            record.status = 'stored' if error is None else 'failed'
+            if image is not None:
+                record.width, record.height = image[0], image[1]
+                record.variants = variants
+        db.session.commit()
+        if error is None:
+            remove_staged(staged)
+            for record in records: # Failed copies of the same file are not needed any more
+                remove_staged(staging_path(kind, record.id))
+        else:
+            app.logger.error("Upload of %s/%s failed after %d attempts: %s", bucket, path, retries + 1, error)
+
+def remove_media(app, bucket, paths):
+    with app.app_context():
+        retries = app.config['MEDIA_JOB_RETRIES']
+        for path in paths:
+            for attempt in range(retries + 1):
+                try:
+                    get_storage().delete(bucket, path)
+                    break
+                except StorageError as e:
+                    if attempt == retries:
+                        app.logger.error("Failed to delete %s/%s from storage: %s", bucket, path, e)
+                        break
+                    time.sleep(app.config['MEDIA_JOB_BACKOFF'] * (2 ** attempt))
+
+def retry_failed(kind):
+    # Requeues failed (and stuck pending) uploads whose staging file is still on disk; returns how many
+    count = 0
+    model = MEDIA_MODELS[kind]
+    records = db.session.scalars(db.select(model).filter(model.status.in_(['pending', 'failed']))).all()
+    for record in records:
+        if not os.path.exists(staging_path(kind, record.id)):
+            continue
+        record.status = 'pending'
+        db.session.commit()
+        content_type = mimetypes.guess_type(record.filename)[0] or 'application/octet-stream'
+        media_jobs.submit(store_media, kind, record.id, owner_id(kind, record), object_path(kind, record), content_type,
+                          record.content_hash)
+        count += 1
+    return count
@@ -0,0 +1,92 @@
+# Prometheus metrics, served as text at /metrics
+# - request latency per endpoint (histogram) and status (counter), and requests in flight per endpoint
+# - database pool checkouts, connections checked out and connections opened
+# - storage API call timings and retries (fed by StorageMetrics in storage.py)
+#
+# Each gunicorn worker is a separate process with its own counters. When PROMETHEUS_MULTIPROC_DIR is set (by
+# gunicorn.conf.py, before the app is imported) every process writes its values to memory-mapped files in that
+# directory, and /metrics adds up the files of all workers, whichever worker serves the scrape.
+
+import os
+import time
+from flask import g, request
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest, \
+    CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+UNMATCHED_ENDPOINT = 'unmatched' # 404s share one label instead of one per URL
+
+request_seconds = Histogram('http_request_duration_seconds', 'Time spent serving a request', ['method', 'endpoint'])
+requests_total = Counter('http_requests_total', 'Requests served', ['method', 'endpoint', 'status'])
+requests_in_progress = Gauge('http_requests_in_progress', 'Requests being served', ['endpoint'],
+                             multiprocess_mode='livesum')
+
+db_pool_checkouts = Counter('db_pool_checkouts_total', 'Connections taken from the database pool')
+db_pool_checked_out = Gauge('db_pool_checked_out', 'Pooled connections currently in use',
+                            multiprocess_mode='livesum')
+db_pool_connects = Counter('db_pool_connects_total', 'New database connections opened by the pool')
+
+storage_seconds = Histogram('storage_request_duration_seconds', 'Time spent in storage API calls, retries included',
+                            ['operation', 'outcome'])
+storage_retries = Counter('storage_retries_total', 'Storage API requests retried', ['operation'])
+
+def observe_storage(operation, seconds, ok=True, retries=0):
+    storage_seconds.labels(operation, 'ok' if ok else 'error').observe(seconds)
+    if retries:
+        storage_retries.labels(operation).inc(retries)
+
+def pool_connect(dbapi_connection, connection_record):
+    db_pool_connects.inc()
+
+def pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    db_pool_checkouts.inc()
+    db_pool_checked_out.inc()
+
+def pool_checkin(dbapi_connection, connection_record):
+    db_pool_checked_out.dec()
+
+def listen():
+    # Registered on the Pool class, so the pools of every engine are covered
+    if not event.contains(Pool, 'checkout', pool_checkout):
+        event.listen(Pool, 'connect', pool_connect)
+        event.listen(Pool, 'checkout', pool_checkout)
+        event.listen(Pool, 'checkin', pool_checkin)
+
+def multiprocess_dir():
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+def render_metrics():
+    # Returns (body, content type) for /metrics
+    if multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def init_metrics(app):
+    if not app.config['METRICS']:
+        return
+    listen()
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_endpoint = request.endpoint or UNMATCHED_ENDPOINT
+        g.metrics_started = time.perf_counter()
+        requests_in_progress.labels(g.metrics_endpoint).inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_started' in g:
+            request_seconds.labels(request.method, g.metrics_endpoint).observe(time.perf_counter() - g.metrics_started)
+            requests_total.labels(request.method, g.metrics_endpoint, response.status_code).inc()
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exception=None):
+        # Runs even when a request fails before its response exists
+        if 'metrics_started' in g:
+            requests_in_progress.labels(g.pop('metrics_endpoint')).dec()
+            g.pop('metrics_started')
@@ -1,8 +1,13 @@
 # Database models
+# Collections (and the references pages show in lists) are lazy='raise_on_sql': touching one that was not loaded
+# raises instead of quietly running one query per row. Routes load what their templates use with selectinload,
+# joinedload or contains_eager. Plain many-to-one references stay lazy; they are usually found in the identity map.
 from . import db 
 from flask_login import UserMixin
 from datetime import datetime
 
+NO_LAZY_SQL = 'raise_on_sql'
+
 class User(db.Model, UserMixin): #Table for db
     id = db.Column(db.Integer, primary_key=True) #Identity for user
     username = db.Column(db.String(20), nullable=False, unique=True) #Username, 20 character limit, cannot be empty 
@@ -14,23 +19,27 @@ class User(db.Model, UserMixin): #Table for db
     theme = db.Column(db.String(20), default='light')
     notification_email = db.Column(db.Boolean, default=True)
     display_name = db.Column(db.String(50))
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Bumped on every workout/challenge change; invalidates cached analytics
     
-    sessions = db.relationship('Session', backref='user', lazy=True)
-    weight_logs = db.relationship('WeightLog', back_populates="user", lazy=True) # Establishing a connection with WeightLogs so instances of User are accurate with the inputted data 
+    sessions = db.relationship('Session', backref='user', lazy=NO_LAZY_SQL)
+    weight_logs = db.relationship('WeightLog', back_populates="user", lazy=NO_LAZY_SQL) # Establishing a connection with WeightLogs so instances of User are accurate with the inputted data 
 
 class Session(db.Model):
+    # Dashboard, notes and analytics all filter by user and sort/range on date
+    __table_args__ = (db.Index('ix_session_user_id_date', 'user_id', 'date'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
-    date = db.Column(db.DateTime, default=datetime.today)
+    date = db.Column(db.DateTime, default=datetime.today, nullable=False) # Feed pages on (date, id)
     feeling_before = db.Column(db.Integer) # Scale 1-10
     feeling_after = db.Column(db.Integer) # Scale 1-10
     notes = db.Column(db.Text, nullable=True)
-    exercises = db.relationship('ExerciseLog', backref='session', lazy=True)
+    exercises = db.relationship('ExerciseLog', backref='session', lazy=NO_LAZY_SQL)
 
 class ExerciseLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=False, index=True)
     exercise = db.Column(db.String(50), nullable=False)
     exercise_type = db.Column(db.String(20), nullable=False)  # strength, cardio, flexibility, hiit
     sets = db.Column(db.Integer, nullable=False)
@@ -41,6 +50,8 @@ class ExerciseLog(db.Model):
     # db.relationship('User', backref='logs', lazy=True) #Defines a One-to-Many relationship between Exercise and User
     
 class WeightLog(db.Model):
+    __table_args__ = (db.Index('ix_weight_log_user_id_date', 'user_id', 'date'),)
+
     id = db.Column(db.Integer, primary_key=True) # To identify users
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # References user.id
     weight = db.Column(db.Float, nullable=False) # Float value for weight, must have valid entry
@@ -51,27 +62,44 @@ class WeightLog(db.Model):
     user = db.relationship('User', back_populates='weight_logs')
     
 class Photo(db.Model):
+    __table_args__ = (
+        db.Index('ix_photo_user_id_uploaded_at', 'user_id', 'uploaded_at'), # Gallery pages, newest first
+        db.Index('ix_photo_user_id_content_hash', 'user_id', 'content_hash'), # Finding re-uploads of the same file
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     filename = db.Column(db.String(120), nullable=False)
-    uploaded_at = db.Column(db.DateTime, default=datetime.today)
+    uploaded_at = db.Column(db.DateTime, default=datetime.today, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='stored', server_default='stored') # pending, stored or failed
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    variants = db.Column(db.JSON) # {"320": "<name>_320w.webp", ...} thumbnails stored next to the original
+    content_hash = db.Column(db.String(64)) # SHA-256 of the upload; rows with the same hash share one MediaObject
     
-    user = db.relationship('User', backref=db.backref('photos', lazy=True))
+    user = db.relationship('User', backref=db.backref('photos', lazy=NO_LAZY_SQL))
     
     def __repr__(self): # So we can see the photo 
         return f"<Photo {self.filename}>"
     
 class ExerciseMedia(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise_log.id'), nullable=False)
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercise_log.id'), nullable=False, index=True)
     filename = db.Column(db.String(100), nullable=False)
     media_type = db.Column(db.String(10), nullable=False)
     notes = db.Column(db.Text)
-    upload_date = db.Column(db.DateTime, default=datetime.today)
+    upload_date = db.Column(db.DateTime, default=datetime.today, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='stored', server_default='stored') # pending, stored or failed
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    variants = db.Column(db.JSON) # Thumbnails for photos; videos have none
+    content_hash = db.Column(db.String(64)) # Looked up per user, through the exercise's session
     # Establish a relationship
-    exercise = db.relationship('ExerciseLog', backref='media')
+    exercise = db.relationship('ExerciseLog', backref=db.backref('media', lazy=NO_LAZY_SQL))
     
 class Note(db.Model):
+    __table_args__ = (db.Index('ix_note_user_id_updated_at', 'user_id', 'updated_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
@@ -79,8 +107,8 @@ class Note(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.today)
     updated_at = db.Column(db.DateTime, default=datetime.today, onupdate=datetime.today)
     session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=True)
-    user = db.relationship('User', backref=db.backref('notes', lazy=True))
-    session = db.relationship('Session', backref=db.backref('linked_notes', lazy=True))
+    user = db.relationship('User', backref=db.backref('notes', lazy=NO_LAZY_SQL))
+    session = db.relationship('Session', backref=db.backref('linked_notes', lazy=NO_LAZY_SQL), lazy=NO_LAZY_SQL)
     tags = db.Column(db.String(200), nullable=True)
     
 class Challenge(db.Model):
@@ -114,9 +142,12 @@ class Challenge(db.Model):
         else:
             tier_multiplier = 0.25 # Participant 
 
-        return int(self.base_points * difficulty_multiplier(self.difficulty) * tier_multiplier)
+        return int(self.base_points * difficulty_multiplier[self.difficulty] * tier_multiplier)
     
 class UserChallenge(db.Model): # User's progress on specific challenges 
+    # A user can only join a challenge once; the constraint also indexes the (user_id, challenge_id) lookup
+    __table_args__ = (db.UniqueConstraint('user_id', 'challenge_id', name='uq_user_challenge_user_id_challenge_id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     challenge_id = db.Column(db.Integer, db.ForeignKey('challenge.id'), nullable=False)
@@ -150,8 +181,8 @@ class UserChallenge(db.Model): # User's progress on specific challenges
         return self.achievement_tier, self.earned_points
     
     # Establish relationships
-    user = db.relationship('User', backref='challenges') # Backref allows any user instance to access all related UserChallenge instances 
-    challenge = db.relationship('Challenge') # One sided relationship; can access Challenge from UserChallenge but not vice versa 
+    user = db.relationship('User', backref=db.backref('challenges', lazy=NO_LAZY_SQL)) # Backref allows any user instance to access all related UserChallenge instances 
+    challenge = db.relationship('Challenge', lazy=NO_LAZY_SQL) # One sided relationship; can access Challenge from UserChallenge but not vice versa 
 
 class UserBadges(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -162,5 +193,34 @@ class UserBadges(db.Model):
     earned_date = db.Column(db.DateTime, default=datetime.today)
     achievement_tier = db.Column(db.String(20), nullable=False)
 
-    user = db.relationship('User', backref=db.backref('badges', lazy=True)) # Creates relationship with UserBadges and Users --> allows for things like user.badges
-    challenge = db.relationship('Challenge') # one-way relationship to Challenge
\ No newline at end of file
+    user = db.relationship('User', backref=db.backref('badges', lazy=NO_LAZY_SQL)) # Creates relationship with UserBadges and Users --> allows for things like user.badges
+    challenge = db.relationship('Challenge', lazy=NO_LAZY_SQL) # one-way relationship to Challenge
+
+class DailyRollup(db.Model): # Per-user daily totals that back the analytics page; kept up to date by the write routes (see rollups.py)
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='uq_daily_rollup_user_id_day'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    strength_count = db.Column(db.Integer, nullable=False, default=0) # Exercise counts by exercise_type
+    cardio_count = db.Column(db.Integer, nullable=False, default=0)
+    flexibility_count = db.Column(db.Integer, nullable=False, default=0)
+    hiit_count = db.Column(db.Integer, nullable=False, default=0)
+    total_volume = db.Column(db.Float, nullable=False, default=0) # Sum of sets * reps * weight
+    challenges_joined = db.Column(db.Integer, nullable=False, default=0) # Bucketed by the day the challenge was joined
+    challenges_completed = db.Column(db.Integer, nullable=False, default=0)
+
+class MediaObject(db.Model): # One stored file (and its thumbnails) shared by every Photo/ExerciseMedia row of a user with the same content
+    __table_args__ = (
+        # Its index leads with (user_id, content_hash), which every dedup lookup filters on
+        db.UniqueConstraint('user_id', 'content_hash', 'bucket', name='uq_media_object_user_id_content_hash_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    bucket = db.Column(db.String(50), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    filename = db.Column(db.String(120), nullable=False) # Object name under user_<id>/ in the bucket
+    ref_count = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.today)
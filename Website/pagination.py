@@ -0,0 +1,71 @@
+# Keyset (cursor) pagination helpers; pages are found through the index instead of OFFSET scans
+
+import base64
+import datetime
+from sqlalchemy import and_, or_
+from . import db
+from .models import Session, WeightLog, Photo, ExerciseMedia
+
+SESSIONS_PAGE_SIZE = 20
+WEIGHT_LOGS_PAGE_SIZE = 30
+PHOTOS_PAGE_SIZE = 24
+MEDIA_PAGE_SIZE = 12
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(date, row_id):
+    # Cursor is the (date, id) of the last row on the page, made URL safe
+    raw = f"{date.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    # Returns (date, id) or raises ValueError for a malformed cursor
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        date, row_id = raw.rsplit('|', 1)
+        return datetime.datetime.fromisoformat(date), int(row_id)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def keyset_page(query, date_column, id_column, after=None, limit=SESSIONS_PAGE_SIZE):
+    # Newest rows first, ordered by (date, id) so ties on date are still stable
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    if after:
+        date, row_id = decode_cursor(after)
+        query = query.filter(or_(
+            date_column < date,
+            and_(date_column == date, id_column < row_id)
+        ))
+
+    query = query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1) # One extra row tells us if there is another page
+    rows = db.session.execute(query).scalars().all()
+
+    next_cursor = None
+    extra_row = None
+    if len(rows) > limit:
+        extra_row = rows[limit]
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, date_column.key), getattr(last, id_column.key))
+    return rows, next_cursor, extra_row
+
+def session_page(user_id, after=None, limit=SESSIONS_PAGE_SIZE):
+    query = db.select(Session).filter(Session.user_id == user_id)
+    sessions, next_cursor, _ = keyset_page(query, Session.date, Session.id, after, limit)
+    return sessions, next_cursor
+
+def weight_log_page(user_id, after=None, limit=WEIGHT_LOGS_PAGE_SIZE):
+    # Also returns the first row of the next page so the last row on this page can show its trend
+    query = db.select(WeightLog).filter(WeightLog.user_id == user_id)
+    return keyset_page(query, WeightLog.date, WeightLog.id, after, limit)
+
+def photo_page(user_id, after=None, limit=PHOTOS_PAGE_SIZE):
+    query = db.select(Photo).filter(Photo.user_id == user_id)
+    photos, next_cursor, _ = keyset_page(query, Photo.uploaded_at, Photo.id, after, limit)
+    return photos, next_cursor
+
+def exercise_media_page(exercise_id, after=None, limit=MEDIA_PAGE_SIZE):
+    query = db.select(ExerciseMedia).filter(ExerciseMedia.exercise_id == exercise_id)
+    media, next_cursor, _ = keyset_page(query, ExerciseMedia.upload_date, ExerciseMedia.id, after, limit)
+    return media, next_cursor
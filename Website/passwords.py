@@ -0,0 +1,56 @@
+# Password hashing for login and registration
+# bcrypt is deliberately slow (~0.25 s per hash at 12 rounds), so hashes run on a small bounded thread pool: a process
+# never works on more than PASSWORD_HASH_WORKERS hashes at once, and once PASSWORD_HASH_QUEUE more are waiting further
+# logins are turned away (PasswordHashBusy) instead of tying up every worker thread while other routes wait.
+# BCRYPT_LOG_ROUNDS sets the cost of new hashes; a login with a hash of a different cost re-hashes the password.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from . import bcrypt
+
+class PasswordHashBusy(Exception):
+    pass
+
+class PasswordHasher:
+    def __init__(self):
+        self.executor = None
+        self.slots = None
+
+    def init_app(self, app):
+        if self.executor is not None: # A new app (tests create several) gets its own pool
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        if workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+            self.slots = threading.BoundedSemaphore(workers + app.config['PASSWORD_HASH_QUEUE'])
+
+    def run(self, function, *args):
+        if self.executor is None:
+            return function(*args)
+        if not self.slots.acquire(blocking=False):
+            raise PasswordHashBusy()
+        try:
+            return self.executor.submit(function, *args).result()
+        finally:
+            self.slots.release()
+
+password_hasher = PasswordHasher()
+
+def hash_password(password):
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    return password_hasher.run(bcrypt.generate_password_hash, password, rounds).decode('utf-8')
+
+def check_password(password_hash, password):
+    return password_hasher.run(bcrypt.check_password_hash, password_hash, password)
+
+def hash_rounds(password_hash):
+    # bcrypt hashes look like $2b$12$<salt and digest>; the second field is the cost
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(password_hash):
+    return hash_rounds(password_hash) != current_app.config['BCRYPT_LOG_ROUNDS']
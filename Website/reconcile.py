@@ -0,0 +1,155 @@
+# Storage reconciliation (`flask reconcile-storage`)
+# Finds objects in the media buckets that no row refers to (orphans) and stored rows whose original file is gone.
+# Each bucket is walked one user folder at a time: the folder listing arrives page by page in name order and is merged
+# against that user's expected object names from the database, so neither side is ever loaded whole.
+# Orphans are removed with bulk deletes. Rows without a file are only reported, unless delete_missing_rows is set;
+# then they are deleted along with their MediaObject.
+
+import datetime
+from . import db
+from .models import Photo, ExerciseMedia, ExerciseLog, Session, MediaObject
+from .media_jobs import MEDIA_MODELS, MEDIA_BUCKETS
+from .storage import get_storage, StorageError, BULK_DELETE_LIMIT
+
+ORPHAN_MIN_AGE = datetime.timedelta(hours=1) # Newer objects may belong to an upload whose row is not committed yet
+MAX_REPORTED = 100
+
+class ReconcileResult:
+    def __init__(self, kind):
+        self.kind = kind
+        self.bucket = MEDIA_BUCKETS[kind]
+        self.objects = 0
+        self.orphan_count = 0
+        self.orphans = [] # Object keys, capped at MAX_REPORTED
+        self.missing_count = 0
+        self.missing = [] # (row id, object key), capped at MAX_REPORTED
+        self.skipped = 0 # Unreferenced objects younger than the minimum age
+        self.deleted_objects = 0
+        self.deleted_rows = 0
+
+    def add_orphan(self, key):
+        self.orphan_count += 1
+        if len(self.orphans) < MAX_REPORTED:
+            self.orphans.append(key)
+
+    def add_missing(self, row_id, key):
+        self.missing_count += 1
+        if len(self.missing) < MAX_REPORTED:
+            self.missing.append((row_id, key))
+
+def merge(left, right):
+    # Walks two sequences of (name, value) sorted by name together; yields (name, left value, right value) with
+    # None for the side the name is missing from
+    left, right = iter(left), iter(right)
+    a, b = next(left, None), next(right, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            yield a[0], a[1], None
+            a = next(left, None)
+        elif a is None or b[0] < a[0]:
+            yield b[0], None, b[1]
+            b = next(right, None)
+        else:
+            yield a[0], a[1], b[1]
+            a, b = next(left, None), next(right, None)
+
+def in_order(entries, what):
+    # The merge relies on the listing being sorted; stop rather than report everything after a misordered name
+    previous = None
+    for name, entry in entries:
+        if previous is not None and name <= previous:
+            raise StorageError(f"Listing of {what} is not in name order ({previous!r} before {name!r})")
+        previous = name
+        yield name, entry
+
+def user_folders(kind):
+    # (folder name, user id) for every user with media rows, in folder name order
+    if kind == 'photo':
+        user_ids = db.session.scalars(db.select(Photo.user_id).distinct())
+    else:
+        user_ids = db.session.scalars(db.select(Session.user_id).join(ExerciseLog).join(ExerciseMedia).distinct())
+    return sorted((f"user_{user_id}", user_id) for user_id in user_ids)
+
+def expected_objects(kind, user_id):
+    # Returns (sorted [(object name, ids of stored rows using it as their original)], {original: thumbnail names}).
+    # Thumbnails and pending or failed uploads are expected, but only stored originals can be reported missing
+    model = MEDIA_MODELS[kind]
+    statement = db.select(model.id, model.filename, model.status, model.variants)
+    if kind == 'photo':
+        statement = statement.filter(model.user_id == user_id)
+    else:
+        statement = statement.join(model.exercise).join(ExerciseLog.session).filter(Session.user_id == user_id)
+    expected = {}
+    thumbnails = {}
+    for row_id, filename, status, variants in db.session.execute(statement):
+        row_ids = expected.setdefault(filename, [])
+        if status == 'stored':
+            row_ids.append(row_id)
+        for name in (variants or {}).values():
+            expected.setdefault(name, [])
+            thumbnails.setdefault(filename, set()).add(name)
+    return sorted(expected.items()), thumbnails
+
+def delete_rows(kind, user_id, missing):
+    # missing: {original filename: [row ids]}; the rows go, and so does the MediaObject that counted them
+    model = MEDIA_MODELS[kind]
+    row_ids = [row_id for ids in missing.values() for row_id in ids]
+    db.session.execute(db.delete(model).filter(model.id.in_(row_ids)))
+    db.session.execute(db.delete(MediaObject).filter(
+        MediaObject.user_id == user_id, MediaObject.bucket == MEDIA_BUCKETS[kind], MediaObject.filename.in_(list(missing))))
+    db.session.commit()
+    return len(row_ids)
+
+def reconcile(kind, dry_run=False, batch_size=BULK_DELETE_LIMIT, min_age=ORPHAN_MIN_AGE, delete_missing_rows=False):
+    storage = get_storage()
+    result = ReconcileResult(kind)
+    bucket = result.bucket
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - min_age
+    batch = []
+
+    def flush():
+        if not dry_run:
+            for start in range(0, len(batch), batch_size):
+                storage.delete_many(bucket, batch[start:start + batch_size])
+            result.deleted_objects += len(batch)
+        batch.clear()
+
+    # The user folders (one name per user) are all read before anything is deleted: a folder that is emptied stops
+    # being listed, which would shift the offsets of the later root pages and skip a folder
+    folders = list(in_order(((entry['name'], entry) for entry in storage.list(bucket) if entry['folder']), bucket))
+    for folder, listed, user_id in merge(folders, user_folders(kind)):
+        if user_id is None:
+            if not folder.startswith('user_') or not folder[5:].isdigit(): # Not written by this app
+                continue
+            user_id = int(folder[5:])
+        # The rows are read before the listing: a row is committed before its upload starts, so a stored row's
+        # object is always listed, and an upload that races the listing is protected by min_age
+        expected, thumbnails = expected_objects(kind, user_id)
+        files = []
+        if listed is not None:
+            files = ((entry['name'], entry) for entry in storage.list(bucket, folder) if not entry['folder'])
+        missing = {}
+        for name, entry, row_ids in merge(in_order(files, f"{bucket}/{folder}"), expected):
+            key = f"{folder}/{name}"
+            if entry is not None:
+                result.objects += 1
+            if row_ids is None:
+                if entry['created_at'] is not None and entry['created_at'] > cutoff:
+                    result.skipped += 1
+                    continue
+                result.add_orphan(key)
+                batch.append(key)
+            elif entry is None and row_ids:
+                for row_id in row_ids:
+                    result.add_missing(row_id, key)
+                missing[name] = row_ids
+
+        if missing and delete_missing_rows and not dry_run:
+            result.deleted_rows += delete_rows(kind, user_id, missing)
+            # Their thumbnails were listed as expected; they are not any more
+            batch.extend(f"{folder}/{name}" for original in missing for name in sorted(thumbnails.get(original, ())))
+        # Deletes wait for the end of a folder, because they would shift the offsets of the folder's later pages
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return result
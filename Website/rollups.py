@@ -0,0 +1,119 @@
+# Incrementally maintained per-user daily totals (DailyRollup) used by the analytics page
+
+import datetime
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .cache import bump_data_version
+from .models import DailyRollup, Session, ExerciseLog, UserChallenge
+
+EXERCISE_TYPES = ['strength', 'cardio', 'flexibility', 'hiit']
+COUNTERS = ['session_count', 'strength_count', 'cardio_count', 'flexibility_count', 'hiit_count',
+            'total_volume', 'challenges_joined', 'challenges_completed']
+
+def to_day(value):
+    if value is None:
+        return datetime.date.today()
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+def parse_day(value):
+    # func.date() comes back as a string on SQLite and a date on PostgreSQL
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    return value
+
+def bump(user_id, day, **deltas):
+    # Adds deltas to a user's row for that day inside the caller's transaction.
+    # The UPDATE is done in SQL (col = col + delta) so concurrent workers never lose an increment
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+    bump_data_version(user_id) # Anything that changes a rollup changes the cached analytics
+
+    values = {name: getattr(DailyRollup, name) + value for name, value in deltas.items()}
+    update = db.update(DailyRollup).where(DailyRollup.user_id == user_id, DailyRollup.day == day).values(**values)
+    if db.session.execute(update).rowcount:
+        return
+
+    try:
+        with db.session.begin_nested(): # Savepoint, so losing an insert race only undoes the insert
+            db.session.execute(db.insert(DailyRollup).values(user_id=user_id, day=day, **{name: 0 for name in COUNTERS} | deltas))
+    except IntegrityError: # Another request created the row first
+        db.session.execute(update)
+
+def exercise_deltas(exercise, sign=1):
+    deltas = {'total_volume': sign * exercise.sets * exercise.reps * exercise.weight}
+    if exercise.exercise_type in EXERCISE_TYPES:
+        deltas[f'{exercise.exercise_type}_count'] = sign
+    return deltas
+
+def record_session(session):
+    bump(session.user_id, to_day(session.date), session_count=1)
+
+def record_exercise(exercise, session, sign=1):
+    # Exercises are bucketed on their session's date, like the analytics page has always done; sign=-1 for deletes
+    bump(session.user_id, to_day(session.date), **exercise_deltas(exercise, sign))
+
+def record_exercises(exercises, session):
+    # Several exercises from one session in a single rollup update
+    totals = {}
+    for exercise in exercises:
+        for name, value in exercise_deltas(exercise).items():
+            totals[name] = totals.get(name, 0) + value
+    bump(session.user_id, to_day(session.date), **totals)
+
+def record_challenge_join(user_challenge):
+    bump(user_challenge.user_id, to_day(user_challenge.created_at), challenges_joined=1)
+
+def record_challenge_completion(user_challenge):
+    bump(user_challenge.user_id, to_day(user_challenge.created_at), challenges_completed=1)
+
+def backfill(user_id=None, user_ids=None, commit=True):
+    # Rebuilds the rollup rows from the raw tables (for one user, a list of users or everyone); returns the number of rows written.
+    # commit=False leaves the rebuild in the caller's transaction
+    if user_id is not None:
+        user_ids = [user_id]
+
+    def for_user(query, column):
+        return query if user_ids is None else query.where(column.in_(user_ids))
+
+    db.session.execute(for_user(db.delete(DailyRollup), DailyRollup.user_id))
+
+    totals = {}
+    def add(uid, day, **deltas):
+        row = totals.setdefault((uid, to_day(day)), dict.fromkeys(COUNTERS, 0))
+        for name, value in deltas.items():
+            row[name] += value or 0
+
+    session_day = db.func.date(Session.date)
+    sessions = for_user(db.select(Session.user_id, session_day, db.func.count(Session.id)), Session.user_id).\
+        group_by(Session.user_id, session_day)
+    for uid, day, count in db.session.execute(sessions):
+        add(uid, parse_day(day), session_count=count)
+
+    exercises = for_user(db.select(
+        Session.user_id, session_day, ExerciseLog.exercise_type,
+        db.func.count(ExerciseLog.id), db.func.sum(ExerciseLog.sets * ExerciseLog.reps * ExerciseLog.weight)
+    ).join(Session, ExerciseLog.session_id == Session.id), Session.user_id).\
+        group_by(Session.user_id, session_day, ExerciseLog.exercise_type)
+    for uid, day, exercise_type, count, volume in db.session.execute(exercises):
+        deltas = {'total_volume': volume}
+        if exercise_type in EXERCISE_TYPES:
+            deltas[f'{exercise_type}_count'] = count
+        add(uid, parse_day(day), **deltas)
+
+    joined_day = db.func.date(UserChallenge.created_at)
+    challenges = for_user(db.select(
+        UserChallenge.user_id, joined_day, db.func.count(UserChallenge.id),
+        db.func.sum(db.case((UserChallenge.completed == True, 1), else_=0))
+    ), UserChallenge.user_id).group_by(UserChallenge.user_id, joined_day)
+    for uid, day, joined, completed in db.session.execute(challenges):
+        add(uid, parse_day(day), challenges_joined=joined, challenges_completed=completed)
+
+    if totals:
+        db.session.execute(db.insert(DailyRollup), [
+            {'user_id': uid, 'day': day, **counters} for (uid, day), counters in totals.items()
+        ])
+    if commit:
+        db.session.commit()
+    return len(totals)
+
@@ -0,0 +1,294 @@
+# Deterministic demo data for development and load testing (`flask seed`)
+# Seeded users are named seed000001, seed000002... and all share the password SEED_PASSWORD. Each user gets a
+# weekly training schedule, a program of splits whose working weights climb over time (with deload weeks),
+# a bodyweight trend with daily noise, tagged notes and a few challenges. Every user draws from their own random
+# generator seeded with (seed, user number), so a user's history is the same whichever run or batch creates it,
+# and running the command again with more users only tops up the missing ones.
+# Rows go in with bulk Core inserts, a batch of users per transaction, and the analytics rollups are rebuilt for
+# each batch. Photos and exercise media are not seeded: their rows would point at files that are not in storage.
+
+import datetime
+import math
+import random
+from . import db, rollups
+from .models import User, Session, ExerciseLog, WeightLog, Note, Challenge, UserChallenge, UserBadges
+from .passwords import hash_password
+
+PRESETS = { # Users and days of history; a user averages ~600 rows a year, so 'large' is about 10 million rows
+    'tiny': (10, 90),
+    'small': (100, 365),
+    'medium': (1000, 365),
+    'large': (17000, 365),
+}
+SEED_PASSWORD = 'seedpassword'
+BATCH_USERS = 100 # Users generated and committed together
+
+# (exercise, type, starting weight in lbs for an average lifter); cardio and mobility log minutes as reps
+SPLITS = {
+    'Push': [('Bench Press', 'strength', 135), ('Overhead Press', 'strength', 85), ('Incline Dumbbell Press', 'strength', 45),
+             ('Dips', 'strength', 0), ('Tricep Pushdown', 'strength', 40)],
+    'Pull': [('Deadlift', 'strength', 225), ('Barbell Row', 'strength', 115), ('Pull-ups', 'strength', 0),
+             ('Face Pull', 'strength', 35), ('Bicep Curl', 'strength', 25)],
+    'Legs': [('Squat', 'strength', 185), ('Romanian Deadlift', 'strength', 135), ('Leg Press', 'strength', 270),
+             ('Walking Lunges', 'strength', 30), ('Calf Raise', 'strength', 90)],
+    'Upper': [('Bench Press', 'strength', 135), ('Barbell Row', 'strength', 115), ('Overhead Press', 'strength', 85),
+              ('Pull-ups', 'strength', 0)],
+    'Lower': [('Squat', 'strength', 185), ('Deadlift', 'strength', 225), ('Leg Press', 'strength', 270),
+              ('Calf Raise', 'strength', 90)],
+    'Full Body': [('Squat', 'strength', 185), ('Bench Press', 'strength', 135), ('Barbell Row', 'strength', 115),
+                  ('Plank', 'flexibility', 0)],
+    'Cardio': [('Running', 'cardio', 0), ('Cycling', 'cardio', 0), ('Rowing', 'cardio', 0)],
+    'HIIT': [('Burpees', 'hiit', 0), ('Kettlebell Swings', 'hiit', 35), ('Box Jumps', 'hiit', 0), ('Mountain Climbers', 'hiit', 0)],
+    'Mobility': [('Yoga', 'flexibility', 0), ('Stretching', 'flexibility', 0)],
+}
+PROGRAMS = [
+    ['Push', 'Pull', 'Legs'],
+    ['Upper', 'Lower'],
+    ['Full Body', 'Cardio'],
+    ['Push', 'Pull', 'Legs', 'HIIT'],
+    ['Full Body', 'Mobility', 'Cardio'],
+    ['Cardio', 'HIIT'],
+]
+SESSION_TITLES = {'Push': 'Push Day', 'Pull': 'Pull Day', 'Legs': 'Leg Day', 'Upper': 'Upper Body', 'Lower': 'Lower Body',
+                  'Full Body': 'Full Body', 'Cardio': 'Cardio', 'HIIT': 'HIIT Circuit', 'Mobility': 'Mobility'}
+
+NOTE_TAGS = ['pr', 'form', 'recovery', 'sleep', 'nutrition', 'injury', 'motivation', 'deload', 'technique', 'cardio']
+NOTE_LINES = ['Felt strong today.', 'Lower back was tight during warm-ups.', 'Hit a new rep PR!',
+              'Need to work on bracing.', 'Slept badly, kept the weights conservative.', 'Great pump, good energy.',
+              'Shoulder felt a bit off, skipped the last set.', 'Ate well before training.', 'Focus on depth next time.',
+              'Tempo work felt good.', 'Rest times were too short.', 'Everything moved fast today.']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn', 'Drew', 'Kai']
+
+# (title, type, category, goal, metric, difficulty, badge, badge image, points, days until it ends from the last day)
+CHALLENGES = [
+    ('100 Push-ups a Day', 'daily', 'Strength', 100, 'reps', 'Beginner', 'Push-up Pro', '💪', 50, 20),
+    ('Squat Your Bodyweight', 'monthly', 'Strength', 20, 'sessions', 'Intermediate', 'Squat Master', '🏋️', 150, 45),
+    ('Run 50 Miles', 'monthly', 'Cardio', 50, 'miles', 'Intermediate', 'Road Runner', '🏃', 150, -30),
+    ('Train 4x a Week', 'weekly', 'Consistency', 4, 'sessions', 'Beginner', 'Consistent', '📅', 40, 5),
+    ('30-Day Streak', 'monthly', 'Consistency', 30, 'days', 'Advanced', 'Unstoppable', '🔥', 300, 60),
+    ('10,000 lb Week', 'weekly', 'Strength', 10000, 'lbs', 'Advanced', 'Heavy Hitter', '🏆', 200, -10),
+    ('Morning Mobility', 'daily', 'Flexibility', 15, 'minutes', 'Beginner', 'Limber', '🧘', 30, 90),
+    ('HIIT Month', 'monthly', 'HIIT', 12, 'sessions', 'Intermediate', 'Interval King', '⚡', 120, -60),
+]
+
+class SeedResult:
+    def __init__(self):
+        self.rows = dict.fromkeys(['users', 'sessions', 'exercises', 'weight_logs', 'notes', 'user_challenges',
+                                   'badges', 'rollups'], 0)
+
+    def add(self, name, count):
+        self.rows[name] += count
+
+    @property
+    def total(self):
+        return sum(self.rows.values())
+
+def username(number):
+    return f'seed{number:06d}'
+
+def seeded_users():
+    # Highest seed user number already in the database
+    last = db.session.execute(db.select(db.func.max(User.username)).where(User.username.like('seed______'))).scalar()
+    return int(last[4:]) if last else 0
+
+def ensure_challenges(last_day):
+    # Creates the challenge catalogue once; returns the challenge rows in catalogue order
+    existing = {c.title: c for c in Challenge.query.filter(Challenge.title.in_([c[0] for c in CHALLENGES]))}
+    for title, type_, category, goal, metric, difficulty, badge, image, points, ends_in in CHALLENGES:
+        if title not in existing:
+            existing[title] = Challenge(title=title, description=f"{title}: reach {goal} {metric} before the end date.",
+                                        type=type_, category=category, goal_value=goal, metric=metric,
+                                        difficulty=difficulty, badge_name=badge, badge_image=image, base_points=points,
+                                        start_date=last_day - datetime.timedelta(days=120),
+                                        end_date=last_day + datetime.timedelta(days=ends_in))
+            db.session.add(existing[title])
+    db.session.commit()
+    return [existing[c[0]] for c in CHALLENGES]
+
+def round_weight(value, step=5):
+    return float(max(step, round(value / step) * step))
+
+class UserHistory:
+    # Generates one user's rows; sessions are kept with their exercises until the session ids are known
+    def __init__(self, number, seed_value, first_day, last_day, challenges):
+        self.rng = random.Random(seed_value * 1_000_003 + number)
+        self.number = number
+        self.first_day = first_day
+        self.last_day = last_day
+        self.challenges = challenges
+
+    def user_row(self, password):
+        rng = self.rng
+        self.joined = self.first_day + datetime.timedelta(days=rng.randint(0, max(0, (self.last_day - self.first_day).days - 14)))
+        return {'username': username(self.number), 'email': f'{username(self.number)}@fit.test', 'password': password,
+                'created_at': self.joined, 'theme': rng.choice(['light', 'light', 'dark']),
+                'notification_email': rng.random() < 0.7, 'display_name': f'{rng.choice(FIRST_NAMES)} {self.number}'}
+
+    def days(self):
+        day = self.joined.replace(hour=0, minute=0, second=0)
+        while day <= self.last_day:
+            yield day
+            day += datetime.timedelta(days=1)
+
+    def training(self):
+        # Yields (session row, exercise rows, note row or None) in date order
+        rng = self.rng
+        program = rng.choice(PROGRAMS)
+        frequency = rng.choice([2, 3, 3, 4, 4, 5, 6]) # Sessions per week
+        weekdays = set(rng.sample(range(7), frequency))
+        adherence = rng.uniform(0.7, 0.95)
+        strength = rng.uniform(0.6, 1.5) # Scales every starting weight
+        hour = rng.choice([6, 7, 12, 17, 18, 19])
+        working = {} # Exercise -> current working weight
+        split_index = 0
+        for day in self.days():
+            if day.weekday() not in weekdays or rng.random() > adherence:
+                continue
+            split = program[split_index % len(program)]
+            split_index += 1
+            week = (day - self.joined).days // 7
+            deload = week % 6 == 5 # Every sixth week is lighter
+            date = day + datetime.timedelta(hours=hour, minutes=rng.randint(0, 59))
+            feeling_before = rng.randint(3, 9)
+            session = {'title': SESSION_TITLES[split], 'date': date, 'feeling_before': feeling_before,
+                       'feeling_after': min(10, feeling_before + rng.randint(-1, 3)),
+                       'notes': rng.choice(NOTE_LINES) if rng.random() < 0.2 else None}
+            exercises = [self.exercise(name, kind, base, strength, working, deload, date) for name, kind, base in SPLITS[split]
+                         if rng.random() < 0.9]
+            note = None
+            if rng.random() < 0.15:
+                note = {'title': f"{session['title']} notes", 'content': ' '.join(rng.sample(NOTE_LINES, rng.randint(1, 4))),
+                        'tags': ','.join(rng.sample(NOTE_TAGS, rng.randint(1, 3))), 'created_at': date, 'updated_at': date}
+            yield session, exercises, note
+
+    def exercise(self, name, kind, base, strength, working, deload, date):
+        rng = self.rng
+        row = {'exercise': name, 'exercise_type': kind, 'date': date}
+        if kind in ('cardio', 'flexibility'):
+            return row | {'sets': 1, 'reps': rng.randint(15, 50), 'weight': 0.0, 'rpe': rng.randint(4, 8)} # Minutes
+        if kind == 'hiit':
+            return row | {'sets': rng.randint(3, 6), 'reps': rng.randint(10, 20), 'weight': float(base), 'rpe': rng.randint(7, 10)}
+        if not base: # Bodyweight: reps go up instead
+            reps = working[name] = working.get(name, rng.randint(4, 10)) + (rng.random() < 0.3)
+            return row | {'sets': 3, 'reps': min(reps, 25), 'weight': 0.0, 'rpe': rng.randint(6, 9)}
+        # Progressive overload: a small jump on most sessions, slowing as the lifter gets stronger
+        weight = working.get(name, base * strength)
+        if rng.random() < 0.6:
+            weight += 5 * math.exp(-(weight / (base * strength * 1.8) - 0.55) * 2)
+        working[name] = weight
+        return row | {'sets': rng.randint(3, 5), 'reps': rng.choice([5, 6, 8, 8, 10, 12]),
+                      'weight': round_weight(weight * (0.85 if deload else 1), 2.5), 'rpe': rng.randint(6 if deload else 7, 10)}
+
+    def weights(self, user_id):
+        # Bodyweight drifting toward a goal with daily noise, logged on about half the days
+        rng = self.rng
+        weight = rng.uniform(120, 240)
+        trend = rng.uniform(-0.15, 0.08) # lbs per day
+        rows = []
+        for day in self.days():
+            weight += trend * rng.uniform(0.5, 1.5)
+            if rng.random() < 0.45:
+                rows.append({'user_id': user_id, 'weight': round(weight + rng.gauss(0, 1.2), 1),
+                             'date': day + datetime.timedelta(hours=7, minutes=rng.randint(0, 45))})
+        return rows
+
+    def challenge_rows(self, user_id):
+        # Returns (user challenge rows, badge rows) for the challenges this user joined
+        rng = self.rng
+        joined, badges = [], []
+        for challenge in rng.sample(self.challenges, rng.randint(0, 4)):
+            created = max(self.joined, challenge.start_date) + datetime.timedelta(days=rng.randint(0, 20))
+            if created > self.last_day:
+                continue
+            value = int(challenge.goal_value * min(1.0, rng.uniform(0.1, 1.4)))
+            percentage = value / challenge.goal_value * 100
+            tier = 'Gold' if percentage >= 100 else 'Silver' if percentage >= 75 else 'Bronze' if percentage >= 50 else 'Participant'
+            completed = percentage >= 100
+            completed_date = min(self.last_day, created + datetime.timedelta(days=rng.randint(3, 30))) if completed else None
+            joined.append({'user_id': user_id, 'challenge_id': challenge.id, 'current_value': value, 'completed': completed,
+                           'completed_date': completed_date, 'achievement_tier': tier, 'badge_earned': completed,
+                           'earned_points': challenge.calculate_points(percentage), 'created_at': created})
+            if completed:
+                badges.append({'user_id': user_id, 'challenge_id': challenge.id, 'badge_name': challenge.badge_name,
+                               'badge_image': challenge.badge_image, 'earned_date': completed_date, 'achievement_tier': tier})
+        return joined, badges
+
+class IdAllocator:
+    # Primary keys for the users and sessions are assigned here, so exercises and notes can point at their session
+    # without reading ids back; seeding assumes nothing else is writing to the database meanwhile
+    def __init__(self):
+        self.next = {model: (db.session.execute(db.select(db.func.max(model.id))).scalar() or 0) + 1 for model in (User, Session)}
+
+    def assign(self, model, rows):
+        start = self.next[model]
+        self.next[model] += len(rows)
+        for offset, row in enumerate(rows):
+            row['id'] = start + offset
+        return [row['id'] for row in rows]
+
+def insert(model, rows):
+    # Core executemany on the table, skipping the ORM's per-row bookkeeping
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
+    return len(rows)
+
+def sync_sequences():
+    # PostgreSQL sequences do not see explicit ids; move them past the rows inserted
+    if db.engine.dialect.name == 'postgresql':
+        for model in (User, Session):
+            table = model.__table__.name
+            db.session.execute(db.text(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                                       f"(SELECT max(id) FROM \"{table}\"))"))
+
+def seed_batch(numbers, seed_value, first_day, last_day, challenges, password, ids, result):
+    histories = [UserHistory(number, seed_value, first_day, last_day, challenges) for number in numbers]
+    users = [history.user_row(password) for history in histories]
+    user_ids = ids.assign(User, users)
+    result.add('users', insert(User, users))
+
+    sessions, exercises, notes, weights, user_challenges, badges = [], [], [], [], [], []
+    for history, user_id in zip(histories, user_ids):
+        for session, session_exercises, note in history.training():
+            sessions.append((session | {'user_id': user_id}, session_exercises, note))
+        weights += history.weights(user_id)
+        joined, earned = history.challenge_rows(user_id)
+        user_challenges += joined
+        badges += earned
+
+    session_ids = ids.assign(Session, [session for session, _, _ in sessions])
+    result.add('sessions', insert(Session, [session for session, _, _ in sessions]))
+    for session_id, (session, session_exercises, note) in zip(session_ids, sessions):
+        exercises += [exercise | {'session_id': session_id} for exercise in session_exercises]
+        if note:
+            notes.append(note | {'user_id': session['user_id'], 'session_id': session_id})
+    result.add('exercises', insert(ExerciseLog, exercises))
+    result.add('weight_logs', insert(WeightLog, weights))
+    result.add('notes', insert(Note, notes))
+    result.add('user_challenges', insert(UserChallenge, user_challenges))
+    result.add('badges', insert(UserBadges, badges))
+    sync_sequences()
+    db.session.commit()
+    result.add('rollups', rollups.backfill(user_ids=user_ids)) # Commits
+    return user_ids
+
+def seed(preset='small', users=None, days=None, seed_value=42, last_day=None, batch_users=BATCH_USERS, progress=None):
+    # Tops the database up to the requested number of seed users; returns a SeedResult for the rows added
+    preset_users, preset_days = PRESETS[preset]
+    users = preset_users if users is None else users
+    days = preset_days if days is None else days
+    last_day = last_day or datetime.datetime.combine(datetime.date.today(), datetime.time())
+    first_day = last_day - datetime.timedelta(days=days)
+
+    result = SeedResult()
+    start = seeded_users() + 1
+    if start > users:
+        return result
+    challenges = ensure_challenges(last_day)
+    password = hash_password(SEED_PASSWORD) # One hash shared by every seed user
+    ids = IdAllocator()
+    for batch_start in range(start, users + 1, batch_users):
+        numbers = range(batch_start, min(users, batch_start + batch_users - 1) + 1)
+        seed_batch(numbers, seed_value, first_day, last_day, challenges, password, ids, result)
+        if progress:
+            progress(numbers[-1], result)
+    return result
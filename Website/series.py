@@ -0,0 +1,42 @@
+# Downsampling for long time series so charts get a fixed number of points
+
+def lttb(points, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, from each bucket in between,
+    # the point forming the largest triangle with the previously kept point and the next bucket's average.
+    # points is a list of (x, y) tuples sorted by x
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0 # Index of the last kept point
+
+    for i in range(threshold - 2):
+        bucket_start = int(i * bucket_size) + 1
+        bucket_end = int((i + 1) * bucket_size) + 1
+
+        # Average of the next bucket (or the last point for the final bucket)
+        next_start = bucket_end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(p[0] for p in points[next_start:next_end]) / count
+        avg_y = sum(p[1] for p in points[next_start:next_end]) / count
+
+        ax, ay = points[a]
+        max_area = -1
+        max_index = bucket_start
+        for j in range(bucket_start, bucket_end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                max_index = j
+
+        sampled.append(points[max_index])
+        a = max_index
+
+    sampled.append(points[-1])
+    return sampled
@@ -0,0 +1,77 @@
+# Per-request SQL statistics
+# SQLAlchemy's cursor events count and time every statement run while a request is handled. The totals are sent
+# back in a Server-Timing header (shown in the browser's network panel), and a statement that runs
+# N_PLUS_ONE_THRESHOLD or more times in one request is logged as a warning. That pattern usually means a lazy
+# relationship is loaded inside a loop, e.g. user_challenge.challenge in my_challenges.html.
+# Statements from CLI commands and background threads are not counted; they run outside a request.
+
+import re
+import time
+from collections import Counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+START_KEY = 'sql_stats_started' # Start times of the statements running on a connection
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter() # Normalised statement -> times run
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.fingerprints.most_common() if count >= threshold]
+
+def fingerprint(statement):
+    # Bound parameters already keep values out of the SQL; literals and expanded IN lists are folded as well, so
+    # the same query for different rows has one fingerprint
+    statement = ' '.join(statement.split())
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'(?<![\w.])\d+(?:\.\d+)?\b', '?', statement)
+    statement = re.sub(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)', '(?)', statement)
+    return statement
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(START_KEY, []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info[START_KEY].pop()
+    if has_request_context() and 'sql_stats' in g:
+        g.sql_stats.record(statement, time.perf_counter() - started)
+
+def listen():
+    # Registered on the Engine class, so every engine the app creates is covered
+    if not event.contains(Engine, 'after_cursor_execute', after_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+def server_timing(stats, total_seconds):
+    return f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries", total;dur={total_seconds * 1000:.1f}'
+
+def init_sql_stats(app):
+    if not app.config['SQL_STATS']:
+        return
+    listen()
+
+    @app.before_request
+    def start_sql_stats():
+        g.sql_stats = QueryStats()
+        g.sql_stats_started = time.perf_counter()
+
+    @app.after_request
+    def report_sql_stats(response):
+        stats = g.get('sql_stats')
+        if stats is None:
+            return response
+        if app.config['SERVER_TIMING']:
+            response.headers.add('Server-Timing', server_timing(stats, time.perf_counter() - g.sql_stats_started))
+        for statement, count in stats.repeated(app.config['N_PLUS_ONE_THRESHOLD']):
+            app.logger.warning("Possible N+1 query on %s %s: %d x %s", request.method, request.endpoint or request.path,
+                               count, statement)
+        return response
@@ -0,0 +1,62 @@
+# Cold start timing for `flask startup-profile`
+# create_app() marks the end of each setup phase on a StartupProfile (kept in app.extensions['startup_profile']).
+# The command starts a fresh interpreter under `python -X importtime`, the way a new gunicorn worker starts, and reports
+# the median time of each phase plus the slowest imports.
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROFILE_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import Website
+imported = time.perf_counter() - start
+app = Website.create_app()
+print(json.dumps({'import': imported, 'phases': app.extensions['startup_profile'].phases}))
+'''
+
+class StartupProfile:
+    def __init__(self):
+        self.phases = [] # (phase, seconds) in the order they ran
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+def parse_importtime(output):
+    # `-X importtime` writes "import time: self [us] | cumulative | name", indented two spaces per nesting level.
+    # Returns {module: cumulative seconds} for modules imported directly by the script or by create_app()
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if depth <= 1 and name.strip() != 'Website':
+            modules[name.strip()] = int(cumulative) / 1e6
+    return modules
+
+def run_once(env):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT],
+                               cwd=root, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Profiled startup failed:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['modules'] = parse_importtime(completed.stderr)
+    return result
+
+def profile_startup(runs=3, env=None):
+    # Returns {'import': s, 'phases': [(phase, s)], 'modules': {module: s}}, each the median over the runs
+    results = [run_once(env or dict(os.environ)) for _ in range(runs)]
+    phases = [(name, statistics.median(result['phases'][i][1] for result in results))
+              for i, (name, _) in enumerate(results[0]['phases'])]
+    modules = {name: statistics.median(result['modules'].get(name, 0) for result in results)
+               for name in results[0]['modules']}
+    return {'import': statistics.median(result['import'] for result in results), 'phases': phases, 'modules': modules}
@@ -0,0 +1,63 @@
+// Polls /api/media_status while uploads are still being stored and swaps the placeholder for the media once ready
+function watchPendingMedia(statusUrl, interval = 2000) {
+    function pendingItems() {
+        return Array.from(document.querySelectorAll('[data-media-status="pending"]'));
+    }
+
+    function showMedia(item, media) {
+        const placeholder = item.querySelector('.media-placeholder');
+        let element;
+        if (placeholder.dataset.mediaType === 'video') {
+            element = document.createElement('video');
+            element.controls = true;
+            element.preload = 'metadata';
+            const source = document.createElement('source');
+            source.src = media.url;
+            source.type = 'video/mp4';
+            element.appendChild(source);
+            element.className = placeholder.dataset.className || '';
+        } else {
+            // Thumbnail in the gallery, original on click
+            const image = document.createElement('img');
+            image.src = media.thumbnail || media.url;
+            if (media.srcset) {
+                image.srcset = media.srcset;
+                image.sizes = placeholder.dataset.sizes || '300px';
+            }
+            image.loading = 'lazy';
+            image.alt = placeholder.dataset.alt || '';
+            image.className = placeholder.dataset.className || '';
+            element = document.createElement('a');
+            element.href = media.url;
+            element.target = '_blank';
+            element.rel = 'noopener';
+            element.appendChild(image);
+        }
+        placeholder.replaceWith(element);
+    }
+
+    async function poll() {
+        const items = pendingItems();
+        if (!items.length) return;
+        try {
+            const ids = items.map(item => item.dataset.mediaId).join(',');
+            const response = await fetch(`${statusUrl}?ids=${ids}`);
+            const data = await response.json();
+            items.forEach(item => {
+                const media = data.media[item.dataset.mediaId];
+                if (!media || media.status === 'pending') return;
+                item.dataset.mediaStatus = media.status;
+                if (media.status === 'stored') {
+                    showMedia(item, media);
+                } else {
+                    item.querySelector('.media-placeholder').textContent = 'Upload failed';
+                }
+            });
+        } catch (error) {
+            console.error('Could not check upload status:', error);
+        }
+        setTimeout(poll, interval);
+    }
+
+    setTimeout(poll, interval);
+}
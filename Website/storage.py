@@ -0,0 +1,351 @@
+# Object storage for progress photos and exercise media
+# Two backends share one interface (upload, delete, delete_many, list, public_url):
+#   SupabaseStorage - Supabase Storage over a pooled requests.Session with timeouts and retries
+#   LocalStorage    - files under UPLOADS_BASE_DIR, served by the media_file route (no network calls)
+# Uploads are sent straight from the (disk-spooled) request file in fixed-size chunks instead of being read into memory;
+# large files use Supabase's resumable (TUS) endpoint so a dropped connection only resends the current chunk
+
+import base64
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app, url_for
+from .metrics import observe_storage
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024 # 1 MB per read for simple uploads
+RESUMABLE_CHUNK_SIZE = 6 * 1024 * 1024 # Supabase's TUS endpoint expects 6 MB chunks
+RESUMABLE_THRESHOLD = 6 * 1024 * 1024 # Files larger than this use the resumable endpoint
+RESUMABLE_RETRIES = 5
+TUS_VERSION = '1.0.0'
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+LIST_PAGE_SIZE = 1000 # Entries per listing request
+BULK_DELETE_LIMIT = 1000 # Supabase removes at most this many objects per request
+
+class StorageError(Exception):
+    pass
+
+def parse_timestamp(value):
+    # Supabase returns ISO 8601 timestamps ending in Z; folders have none
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def stream_size(stream):
+    # Size of a seekable file without reading it
+    position = stream.tell()
+    stream.seek(0, 2)
+    size = stream.tell() - position
+    stream.seek(position)
+    return size
+
+class ChunkedReader:
+    # Iterable request body that reads the stream one chunk at a time; __len__ lets requests send a Content-Length
+    def __init__(self, stream, size, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.stream = stream
+        self.size = size
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        remaining = self.size
+        while remaining > 0:
+            chunk = self.stream.read(min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+class StorageMetrics:
+    # Per-operation call counts, failures, retries and time spent, shared by every request thread
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def record(self, operation, seconds, ok=True, retries=0):
+        with self.lock:
+            stats = self.operations.setdefault(operation, {'calls': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0})
+            stats['calls'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['retries'] += retries
+            stats['seconds'] += seconds
+        observe_storage(operation, seconds, ok, retries) # Exported at /metrics
+
+    def snapshot(self):
+        with self.lock:
+            return {operation: dict(stats) for operation, stats in self.operations.items()}
+
+class SupabaseStorage:
+    name = 'supabase'
+
+    def __init__(self, url, api_key, timeout=(5, 60), retries=3, backoff=0.5, pool_size=10):
+        self.url = url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = StorageMetrics()
+        # One keep-alive connection pool shared by all requests instead of a new connection per call
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        self.http.headers.update({
+            "apikey": api_key,
+            "Authorization": f"Bearer {api_key}",
+        })
+
+    def object_url(self, bucket, path):
+        return f"{self.url}/storage/v1/object/{bucket}/{path}"
+
+    def public_url(self, bucket, path):
+        return f"{self.url}/storage/v1/object/public/{bucket}/{path}"
+
+    def wait(self, attempt):
+        # Exponential backoff with jitter: 0.5s, 1s, 2s... (scaled by up to 50%)
+        if self.backoff:
+            time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random() / 2))
+
+    def request(self, method, url, rewind=None, **kwargs):
+        # Sends a request, retrying connection errors and 5xx/429 responses; returns (response, retries)
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            if rewind is not None:
+                rewind()
+            try:
+                response = self.http.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response, attempt
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries:
+                    raise StorageError(f"{method} {url} failed after {attempt + 1} attempts: {e}")
+            self.wait(attempt)
+            attempt += 1
+
+    def upload(self, bucket, path, stream, content_type='application/octet-stream', upsert=False):
+        # Uploads a seekable file object; raises StorageError if storage rejects it
+        start = time.perf_counter()
+        retries = 0
+        try:
+            size = stream_size(stream)
+            if size > RESUMABLE_THRESHOLD:
+                retries = self.resumable_upload(bucket, path, stream, size, content_type, upsert)
+            else:
+                position = stream.tell()
+                response, retries = self.request(
+                    'PUT' if upsert else 'POST', # PUT replaces an existing object, POST only creates
+                    self.object_url(bucket, path),
+                    rewind=lambda: stream.seek(position),
+                    headers={"Content-Type": content_type},
+                    data=ChunkedReader(stream, size)
+                )
+                # A 409 after a retry means an earlier attempt got through
+                if response.status_code not in (200, 201) and not (retries and response.status_code == 409):
+                    raise StorageError(f"Upload failed ({response.status_code}): {response.text}")
+        except StorageError:
+            self.metrics.record('upload', time.perf_counter() - start, ok=False, retries=retries)
+            raise
+        self.metrics.record('upload', time.perf_counter() - start, retries=retries)
+
+    def resumable_upload(self, bucket, path, stream, size, content_type, upsert=False):
+        response, retries = self.request('POST', f"{self.url}/storage/v1/upload/resumable", headers={
+            "Tus-Resumable": TUS_VERSION,
+            "Upload-Length": str(size),
+            "Upload-Metadata": tus_metadata(bucketName=bucket, objectName=path, contentType=content_type),
+            "x-upsert": 'true' if upsert else 'false',
+        })
+        if response.status_code != 201 or 'Location' not in response.headers:
+            raise StorageError(f"Could not start resumable upload ({response.status_code}): {response.text}")
+        location = response.headers['Location']
+
+        start = stream.tell()
+        offset = 0
+        failures = 0
+        while offset < size:
+            stream.seek(start + offset)
+            chunk = stream.read(min(RESUMABLE_CHUNK_SIZE, size - offset))
+            try:
+                response = self.http.patch(location, data=chunk, timeout=self.timeout, headers={
+                    "Tus-Resumable": TUS_VERSION,
+                    "Upload-Offset": str(offset),
+                    "Content-Type": 'application/offset+octet-stream',
+                })
+                if response.status_code == 204:
+                    offset = int(response.headers['Upload-Offset'])
+                    failures = 0
+                    continue
+                error = f"{response.status_code}: {response.text}"
+            except requests.RequestException as e:
+                error = str(e)
+
+            # Ask the server how much it actually received and carry on from there
+            failures += 1
+            retries += 1
+            if failures > RESUMABLE_RETRIES:
+                raise StorageError(f"Resumable upload failed after {RESUMABLE_RETRIES} retries ({error})")
+            self.wait(failures - 1)
+            try:
+                response = self.http.head(location, headers={"Tus-Resumable": TUS_VERSION}, timeout=self.timeout)
+                offset = int(response.headers.get('Upload-Offset', offset))
+            except (requests.RequestException, ValueError):
+                pass
+        return retries
+
+    def delete(self, bucket, path):
+        # Deleting an object that is already gone counts as success
+        start = time.perf_counter()
+        try:
+            response, retries = self.request('DELETE', self.object_url(bucket, path))
+        except StorageError:
+            self.metrics.record('delete', time.perf_counter() - start, ok=False)
+            raise
+        ok = response.status_code in (200, 204, 404)
+        self.metrics.record('delete', time.perf_counter() - start, ok=ok, retries=retries)
+        if not ok:
+            raise StorageError(f"Delete failed ({response.status_code}): {response.text}")
+
+    def delete_many(self, bucket, paths):
+        # Bulk delete, up to BULK_DELETE_LIMIT objects per request; objects that are already gone are skipped
+        for start_index in range(0, len(paths), BULK_DELETE_LIMIT):
+            start = time.perf_counter()
+            try:
+                response, retries = self.request('DELETE', f"{self.url}/storage/v1/object/{bucket}",
+                                                 json={'prefixes': paths[start_index:start_index + BULK_DELETE_LIMIT]})
+            except StorageError:
+                self.metrics.record('delete_many', time.perf_counter() - start, ok=False)
+                raise
+            ok = response.status_code == 200
+            self.metrics.record('delete_many', time.perf_counter() - start, ok=ok, retries=retries)
+            if not ok:
+                raise StorageError(f"Bulk delete failed ({response.status_code}): {response.text}")
+
+    def list(self, bucket, prefix='', page_size=LIST_PAGE_SIZE):
+        # Yields {'name', 'folder', 'created_at'} for each entry directly inside the folder `prefix`, in name order.
+        # Pages are fetched as the caller iterates, so a large bucket is never held in memory
+        offset = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response, retries = self.request('POST', f"{self.url}/storage/v1/object/list/{bucket}", json={
+                    'prefix': prefix,
+                    'limit': page_size,
+                    'offset': offset,
+                    'sortBy': {'column': 'name', 'order': 'asc'},
+                })
+            except StorageError:
+                self.metrics.record('list', time.perf_counter() - start, ok=False)
+                raise
+            ok = response.status_code == 200
+            self.metrics.record('list', time.perf_counter() - start, ok=ok, retries=retries)
+            if not ok:
+                raise StorageError(f"Listing {bucket}/{prefix} failed ({response.status_code}): {response.text}")
+            page = response.json()
+            for item in page:
+                # Folders are listed without an id
+                yield {'name': item['name'], 'folder': item.get('id') is None, 'created_at': parse_timestamp(item.get('created_at'))}
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+class LocalStorage:
+    name = 'local'
+
+    def __init__(self, base_dir, buckets=None):
+        self.base_dir = os.path.abspath(base_dir)
+        self.buckets = set(buckets) if buckets is not None else None # None allows any plain folder name
+        self.metrics = StorageMetrics()
+
+    def bucket_dir(self, bucket):
+        # The bucket comes from the URL in media_file, so it must never reach outside base_dir
+        if (self.buckets is not None and bucket not in self.buckets) or \
+                bucket in ('', '.', '..') or '/' in bucket or os.sep in bucket:
+            raise StorageError(f"Unknown bucket: {bucket}")
+        return os.path.join(self.base_dir, bucket)
+
+    def file_path(self, bucket, path):
+        full_path = os.path.abspath(os.path.join(self.bucket_dir(bucket), *path.split('/')))
+        if not full_path.startswith(self.bucket_dir(bucket) + os.sep):
+            raise StorageError(f"Invalid object path: {path}")
+        return full_path
+
+    def public_url(self, bucket, path):
+        return url_for('main.media_file', bucket=bucket, path=path)
+
+    def upload(self, bucket, path, stream, content_type='application/octet-stream', upsert=False):
+        start = time.perf_counter()
+        target = self.file_path(bucket, path)
+        if not upsert and os.path.exists(target):
+            self.metrics.record('upload', time.perf_counter() - start, ok=False)
+            raise StorageError(f"{bucket}/{path} already exists")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Written to a temporary file and renamed, so readers never see a half-written object
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(stream, f, UPLOAD_CHUNK_SIZE)
+            os.replace(temp_path, target)
+        except OSError as e:
+            os.unlink(temp_path)
+            self.metrics.record('upload', time.perf_counter() - start, ok=False)
+            raise StorageError(f"Could not write {bucket}/{path}: {e}")
+        self.metrics.record('upload', time.perf_counter() - start)
+
+    def delete(self, bucket, path):
+        start = time.perf_counter()
+        try:
+            os.remove(self.file_path(bucket, path))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.metrics.record('delete', time.perf_counter() - start, ok=False)
+            raise StorageError(f"Could not delete {bucket}/{path}: {e}")
+        self.metrics.record('delete', time.perf_counter() - start)
+
+    def delete_many(self, bucket, paths):
+        for path in paths:
+            self.delete(bucket, path)
+
+    def list(self, bucket, prefix='', page_size=LIST_PAGE_SIZE):
+        directory = self.file_path(bucket, prefix) if prefix else self.bucket_dir(bucket)
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'): # Temporary files of uploads in progress
+                continue
+            created_at = datetime.datetime.fromtimestamp(entry.stat().st_mtime, datetime.timezone.utc)
+            yield {'name': entry.name, 'folder': entry.is_dir(), 'created_at': None if entry.is_dir() else created_at}
+
+def tus_metadata(**values):
+    return ','.join(f"{key} {base64.b64encode(value.encode('utf-8')).decode('ascii')}" for key, value in values.items())
+
+def create_storage(config):
+    # STORAGE_BACKEND picks the backend; without it Supabase is used when it is configured
+    backend = config.get('STORAGE_BACKEND') or ('supabase' if config.get('SUPABASE_URL') else 'local')
+    if backend == 'supabase':
+        return SupabaseStorage(
+            config['SUPABASE_URL'], config['SUPABASE_API_KEY'],
+            timeout=config['STORAGE_TIMEOUT'],
+            retries=config['STORAGE_RETRIES'],
+            backoff=config['STORAGE_RETRY_BACKOFF'],
+            pool_size=config['STORAGE_POOL_SIZE']
+        )
+    if backend == 'local':
+        from .media_jobs import MEDIA_BUCKETS # media_jobs imports this module
+        return LocalStorage(config['UPLOADS_BASE_DIR'], buckets=MEDIA_BUCKETS.values())
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'")
+
+def init_storage(app):
+    app.extensions['storage'] = create_storage(app.config)
+
+def get_storage():
+    return current_app.extensions['storage']
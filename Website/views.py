@@ -1,20 +1,34 @@
 # Routes for the application; the app.py file
 
-from flask import render_template, Blueprint, redirect, url_for, flash, request, session, current_app, send_from_directory
+from flask import render_template, Blueprint, redirect, url_for, flash, request, session, current_app, send_from_directory, jsonify, abort, Response, stream_with_context
 from flask_wtf import FlaskForm
 from .models import User, ExerciseLog, WeightLog, Photo, Session, ExerciseMedia, Note, Challenge, UserChallenge
-from .forms import LoginForm, RegisterForm, WorkoutLog, WeightLogForm, PhotoUploadForm, SessionForm, ExerciseMediaForm, ChallengeForm, AnalyticsFilterForm
+from .forms import LoginForm, RegisterForm, WorkoutLog, WeightLogForm, PhotoUploadForm, SessionForm, ExerciseMediaForm, ChallengeForm, AnalyticsFilterForm, ImportForm, BatchWorkoutLog
 from wtforms.validators import DataRequired
 from wtforms import IntegerField, SubmitField
-from . import db, bcrypt
+from . import db
+from .pagination import session_page, weight_log_page, photo_page, exercise_media_page, SESSIONS_PAGE_SIZE
+from .series import lttb
+from . import rollups
+from .cache import analytics_cache, bump_data_version, invalidate_user, current_data_version
+from .passwords import hash_password, check_password, needs_rehash, PasswordHashBusy
+from .analytics import build_analytics_data, RANGE_DAYS
+from .export import export_records, export_stream, parquet_available, EXPORT_FORMATS
+from .importer import import_file
+from .storage import get_storage, stream_size, LocalStorage
+from .media_jobs import queue_upload, queue_delete, media_urls, MEDIA_MODELS, MEDIA_BUCKETS
+from .metrics import render_metrics
 from flask_login import login_user, login_required, logout_user, current_user
-import os, time, requests
+import os, time
 from werkzeug.utils import secure_filename
 import datetime 
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, text
+from sqlalchemy.orm import selectinload, joinedload, contains_eager, load_only
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+import hmac
 
-SUPABASE_API_KEY = os.getenv('SUPABASE_API_KEY')
-SUPABASE_URL = os.getenv('SUPABASE_URL')
+WEIGHT_SERIES_POINTS = 200 # Default number of points sent to the weight chart
+MAX_WEIGHT_SERIES_POINTS = 1000
 
 main = Blueprint("main", __name__) # Create blueprint for main routes; we can access app
 
@@ -22,17 +36,49 @@ main = Blueprint("main", __name__) # Create blueprint for main routes; we can ac
 def main_blueprint():
     return render_template('home.html')
 
+# Liveness: the process is up and serving requests (no database, no templates)
+@main.route('/healthz')
+def healthz():
+    return Response('ok\n', mimetype='text/plain')
+
+# Readiness: the database answers too; Railway's deploy health check waits for this
+@main.route('/readyz')
+def readyz():
+    try:
+        db.session.execute(text('SELECT 1'))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.warning("Readiness check failed: %s", e)
+        return Response('database unavailable\n', status=503, mimetype='text/plain')
+    return Response('ready\n', mimetype='text/plain')
+
+@main.route('/metrics')
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 @main.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
-            login_user(user)
-            return redirect(url_for('main.dashboard')) # Redirect to home 
-        else:
-            flash("Your username or password may be incorrect.", "danger")
+        try:
+            if user and check_password(user.password, form.password.data):
+                if needs_rehash(user.password): # Stored with an older BCRYPT_LOG_ROUNDS
+                    user.password = hash_password(form.password.data)
+                    db.session.commit()
+                    invalidate_user(user.id)
+                login_user(user)
+                return redirect(url_for('main.dashboard')) # Redirect to home 
+            else:
+                flash("Your username or password may be incorrect.", "danger")
+        except PasswordHashBusy:
+            flash("The server is busy, please try logging in again in a moment.", "warning")
+            return render_template('login.html', form=form), 503
         
     return render_template('login.html', form=form)
 
@@ -43,23 +89,25 @@ def register():
     if request.method == 'GET':
         session.pop('_flashes', None)
     
-    if form.validate_on_submit(): #Whenever user fills in form, we hash password
+    try:
+        validated = form.validate_on_submit()
+    except PasswordHashBusy: # RegisterForm.validate_username checks the password of an existing account
+        flash("The server is busy, please try again in a moment.", "warning")
+        return render_template('register.html', form=form), 503
+
+    if validated: #Whenever user fills in form, we hash password
         print("Form validated!") #DEBUG STATEMENT
         
-        existing_user = db.session.execute(db.select(User).filter_by(username=form.username.data)).scalar()
-        #Case #1 - user exists and password matches username 
-        if existing_user and bcrypt.check_password_hash(existing_user.password, form.password.data):
-            print("User already exists and password inputted matches, redirecting to login page!") #DEBUG STATEMENT
+        # RegisterForm.validate_username already looked up the username and checked the password against it,
+        # so neither is repeated here; a name taken since then fails the unique constraint below
+        if form.existing_user is not None: # User exists and password matches username 
             return redirect(url_for('main.login')) # Redirect user to login page if account already exists 
-        
-        #Case #2 - user exists, password does not match 
-        elif existing_user: 
-            flash("That username already exists. Please try again.", "danger")
-            print("Username already exists, password is incorrect!") #DEBUG STATEMENT
-            return render_template('register.html', form=form)
-        
-        #Case #3 - need to add user to database
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8') #Decode the hash
+
+        try:
+            hashed_password = hash_password(form.password.data)
+        except PasswordHashBusy:
+            flash("The server is busy, please try again in a moment.", "warning")
+            return render_template('register.html', form=form), 503
         new_user = User(
             username=form.username.data,
             email=form.email.data, 
@@ -74,6 +122,9 @@ def register():
             flash("Account created successfully! Please log in.", "success")
             print("User successfully added!") #DEBUG STATEMENT
             return redirect(url_for('main.login')) # Redirect user to Login
+        except IntegrityError:
+            db.session.rollback()
+            flash("That username already exists. Please try again.", "danger")
         except Exception as e:
             print("Database error:", str(e))
             db.session.rollback()
@@ -98,18 +149,43 @@ def dashboard():
             user_id=current_user.id
         )
         db.session.add(new_session)
+        db.session.flush() # Fills in the default date
+        rollups.record_session(new_session)
         db.session.commit()
         flash('New session created', 'success')
         return(redirect(url_for('main.dashboard')))
     
-    sessions = Session.query.filter_by(user_id=current_user.id,).order_by(Session.date.desc()).all()
+    sessions, next_cursor = session_page(current_user.id) # Only the first page; the rest is fetched from /api/sessions
     now = datetime.datetime.now()
-    return render_template('dashboard.html', sessions=sessions, form=form, now=now)
+    return render_template('dashboard.html', sessions=sessions, next_cursor=next_cursor, form=form, now=now)
+
+@main.route('/api/sessions')
+@login_required
+def api_sessions():
+    after = request.args.get('after')
+    limit = request.args.get('limit', SESSIONS_PAGE_SIZE, type=int)
+    try:
+        sessions, next_cursor = session_page(current_user.id, after=after, limit=limit)
+    except ValueError:
+        abort(400)
+
+    return jsonify({
+        'sessions': [
+            {
+                'id': s.id,
+                'title': s.title,
+                'date': s.date.isoformat() if s.date else None,
+                'url': url_for('main.session_details', session_id=s.id)
+            } for s in sessions
+        ],
+        'next': next_cursor
+    })
 
 @main.route('/session_details/<int:session_id>', methods=['GET', 'POST'])
 @login_required
 def session_details(session_id):
-    session = Session.query.get_or_404(session_id)
+    # Session, exercises and linked notes in three queries, however many rows there are
+    session = Session.query.options(selectinload(Session.exercises), selectinload(Session.linked_notes)).get_or_404(session_id)
     
     if session.user_id != current_user.id:
         flash("You do not have permission to view this session.", "danger")
@@ -127,14 +203,55 @@ def session_details(session_id):
             weight=form.weight.data,
             rpe=form.rpe.data if form.rpe.data else None)
         db.session.add(new_exercise)
+        rollups.record_exercise(new_exercise, session)
         db.session.commit()
         flash("Exercise logged successfully!", "success")
         return redirect(url_for('main.session_details', session_id=session_id))
     else:
         print("Form did not validate!", form.errors)
     
-    exercises = ExerciseLog.query.filter_by(session_id=session_id).all()
-    return render_template('session_details.html', form=form, session=session, exercises=exercises)
+    return render_template('session_details.html', form=form, batch_form=BatchWorkoutLog(), session=session, exercises=session.exercises)
+
+@main.route('/session_details/<int:session_id>/batch', methods=['POST'])
+@login_required
+def log_exercises(session_id):
+    # Logs every row of a workout in one transaction and returns just the updated exercise table
+    session = Session.query.get_or_404(session_id)
+    wants_fragment = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    
+    if session.user_id != current_user.id:
+        if wants_fragment:
+            abort(403)
+        flash("You do not have permission to modify this session.", "danger")
+        return redirect(url_for('main.dashboard'))
+    
+    form = BatchWorkoutLog()
+    if not form.validate_on_submit():
+        if wants_fragment:
+            return jsonify({'errors': form.errors}), 400
+        flash("Some exercises were not valid; nothing was logged.", "danger")
+        return redirect(url_for('main.session_details', session_id=session_id))
+    
+    new_exercises = [
+        ExerciseLog(
+            session_id=session_id,
+            exercise=row.exercise.data,
+            exercise_type=row.exercise_type.data,
+            sets=row.sets.data,
+            reps=row.reps.data,
+            weight=row.weight.data,
+            rpe=row.rpe.data
+        ) for row in form.exercises
+    ]
+    db.session.add_all(new_exercises)
+    rollups.record_exercises(new_exercises, session)
+    db.session.commit()
+    
+    if wants_fragment:
+        exercises = ExerciseLog.query.filter_by(session_id=session_id).all()
+        return render_template('exercise_table.html', session=session, exercises=exercises)
+    flash(f"{len(new_exercises)} exercises logged successfully!", "success")
+    return redirect(url_for('main.session_details', session_id=session_id))
 
 @main.route('/update_session_notes/<int:session_id>', methods=['POST'])
 def update_session_notes(session_id):
@@ -156,7 +273,7 @@ def update_feeling_after(session_id):
 @main.route('/delete_exercise/<int:exercise_id>/<int:session_id>', methods=['POST'])
 @login_required
 def delete_exercise(exercise_id, session_id):
-    exercise = ExerciseLog.query.get_or_404(exercise_id)
+    exercise = ExerciseLog.query.options(selectinload(ExerciseLog.media)).get_or_404(exercise_id)
     session = Session.query.get_or_404(session_id)
     
     if session.user_id != current_user.id:
@@ -167,6 +284,10 @@ def delete_exercise(exercise_id, session_id):
         flash("Invalid request", "danger")
         return redirect(url_for('main.session_details', session_id=session_id))
     
+    rollups.record_exercise(exercise, session, sign=-1)
+    for media in exercise.media: # Goes with the exercise; the stored files are removed in the background
+        queue_delete('exercise', media)
+        db.session.delete(media)
     db.session.delete(exercise)
     db.session.commit()
     
@@ -176,8 +297,8 @@ def delete_exercise(exercise_id, session_id):
 @main.route('/exercise_details/<exercise_id>', methods=['GET', 'POST'])
 @login_required
 def exercise_details(exercise_id):
-    exercise = ExerciseLog.query.get_or_404(exercise_id)
-    session = Session.query.get_or_404(exercise.session_id)
+    exercise = ExerciseLog.query.options(joinedload(ExerciseLog.session)).get_or_404(exercise_id) # Its session comes with it
+    session = exercise.session
     
     if session.user_id != current_user.id:
         flash("You do not have permission to view this exercise.", "danger")
@@ -187,46 +308,56 @@ def exercise_details(exercise_id):
     if form.validate_on_submit():
         media = form.media.data 
         filename = secure_filename(f"{exercise_id}_{int(time.time())}_{media.filename}")
-        bucketExercise = 'exercise-media' # Bucket for exercise media 
         
         # Determine the media type 
-        media_data = media.read()
         media_type = 'photo' if media.filename.lower().endswith(('jpg', 'jpeg', 'png')) else 'video'
-        
-        headers = {
-            "apikey": SUPABASE_API_KEY,
-            "Authorization": f"Bearer {SUPABASE_API_KEY}",
-            "Content-Type": "application/octet-stream"
-        }
-        
-        upload_url = f"{SUPABASE_URL}/storage/v1/object/{bucketExercise}/user_{current_user.id}/{filename}"
-        response = requests.post(upload_url, headers=headers, data=media_data)
-        
-        if response.status_code in (200, 201):
-            new_media = ExerciseMedia(
-                exercise_id=exercise_id,
-                filename=filename,
-                media_type=media_type,
-                notes=form.notes.data
-            )
-            db.session.add(new_media)
-            db.session.commit()
+        limit = current_app.config['MAX_PHOTO_SIZE'] if media_type == 'photo' else current_app.config['MAX_MEDIA_SIZE']
+        if stream_size(media.stream) > limit: # The upload is spooled to disk, so this does not read it
+            flash(f"That file is too large (limit {limit // (1024 * 1024)} MB).", "danger")
+            return redirect(url_for('main.exercise_details', exercise_id=exercise_id))
+        
+        new_media = ExerciseMedia(
+            exercise_id=exercise_id,
+            filename=filename,
+            media_type=media_type,
+            notes=form.notes.data,
+            status='pending'
+        )
+        db.session.add(new_media)
+        db.session.commit()
+        try:
+            # Staged to disk and sent to storage by a background worker; the page polls for the result
+            queue_upload('exercise', new_media, media.stream, media.mimetype or 'application/octet-stream')
             # flash("Media uploaded successfully!", "success")
-        else:
-            # flash('Failed to upload media to Supabase.', 'danger')
-            print(response.text)
-            print("Upload Error Code:", response.status_code)
+        except OSError:
+            current_app.logger.exception("Could not stage media upload %s", filename)
+            db.session.delete(new_media)
+            db.session.commit()
+            flash('Failed to upload media.', 'danger')
         
         return redirect(url_for('main.exercise_details', exercise_id=exercise_id))
     
-    media_files = ExerciseMedia.query.filter_by(exercise_id=exercise_id).order_by(ExerciseMedia.upload_date.desc()).all()
-    return render_template('exercise_details.html', form=form, exercise=exercise, media_files=media_files)
+    after = request.args.get('after')
+    try:
+        media_files, next_cursor = exercise_media_page(exercise_id, after=after)
+    except ValueError:
+        abort(400)
+    return render_template('exercise_details.html', form=form, exercise=exercise, media_files=media_files, next_cursor=next_cursor, is_first_page=not after)
 
 # @main.route('/exercise_media/<filename>')
 # @login_required
 # def exercise_media(filename):
 #     return send_from_directory(os.path.join(current_app.config['UPLOADED_EXERCISES_DEST'], f'user_{current_user.id}'), filename)
 
+@main.route('/media/<bucket>/<path:path>')
+@login_required
+def media_file(bucket, path):
+    # Serves objects for the local storage backend; send_from_directory uses the server's file wrapper (sendfile) where available
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage) or bucket not in MEDIA_BUCKETS.values():
+        abort(404)
+    return send_from_directory(storage.bucket_dir(bucket), path, max_age=86400)
+
 @main.route('/delete_media/<int:media_id>/<int:exercise_id>', methods=['POST'])
 @login_required
 def delete_media(media_id, exercise_id):
@@ -239,22 +370,7 @@ def delete_media(media_id, exercise_id):
         return redirect(url_for('main.dashboard'))
     
     try:
-        supabase_url = os.getenv('SUPABASE_URL')
-        supabase_api_key = os.getenv('SUPABASE_API_KEY')
-        bucket = "exercise-media"
-        
-        delete_url = f"{supabase_url}/storage/v1/object/{bucket}/user_{current_user.id}/{media.filename}"
-        
-        headers = {
-            "apikey": supabase_api_key,
-            "Authorization": f"Bearer {supabase_api_key}",
-        }
-        
-        response = requests.delete(delete_url, headers=headers)
-        
-        if response.status_code not in (200, 204):
-            print(f"Failed to delete file from Supabase: {response.text}")
-            
+        queue_delete('exercise', media) # The stored file is removed in the background
         db.session.delete(media)
         db.session.commit()
         flash("Media deleted successfully!", "success")
@@ -273,22 +389,68 @@ def logout():
 @login_required
 def settings():
     if request.method == 'POST':
+        user = db.session.get(User, current_user.id) # current_user is a cached read-only snapshot
         theme = request.form.get('theme') # Get the form data
         if theme in ['light', 'dark']:
-            current_user.theme = theme # Update user settings depending on selected theme
+            user.theme = theme # Update user settings depending on selected theme
             
         notification_email = 'notification_email' in request.form 
-        current_user.notification_email = notification_email 
+        user.notification_email = notification_email 
         
         display_name = request.form.get('display_name')
         if display_name:
-            current_user.display_name = display_name 
+            user.display_name = display_name 
             
         db.session.commit()
+        invalidate_user(user.id)
         flash('Settings updated successfully!', 'success')
         return redirect(url_for('main.settings'))
     
-    return render_template('settings.html')
+    return render_template('settings.html', import_form=ImportForm())
+
+@main.route('/import', methods=['POST'])
+@login_required
+def import_data():
+    form = ImportForm()
+    if not form.validate_on_submit():
+        for error in form.data_file.errors:
+            flash(error, "danger")
+        return redirect(url_for('main.settings'))
+    
+    data_file = form.data_file.data
+    result = import_file(current_user.id, data_file.stream, data_file.filename)
+    
+    flash(f"Imported {result.sessions} sessions, {result.exercises} exercises and {result.weights} weigh-ins.", "success")
+    if result.duplicates:
+        flash(f"{result.duplicates} rows were already imported and were skipped.", "info")
+    if result.error_count:
+        shown = '; '.join(f"row {row}: {message}" for row, message in result.errors[:10])
+        flash(f"{result.error_count} rows were skipped. {shown}", "warning")
+    return redirect(url_for('main.settings'))
+
+@main.route('/export')
+@login_required
+def export():
+    # Streams the user's whole history; nothing is loaded into memory up front
+    export_format = request.args.get('format', 'csv')
+    compress = request.args.get('compress', 'gzip') == 'gzip'
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    if export_format == 'parquet' and not parquet_available():
+        flash("Parquet export is not available on this server.", "danger")
+        return redirect(url_for('main.settings'))
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    if compress and export_format != 'parquet':
+        mimetype, extension = 'application/gzip', extension + '.gz'
+    filename = f"fitness_export_{datetime.date.today().isoformat()}.{extension}"
+    
+    chunks = export_stream(export_records(current_user.id), export_format, compress)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
     
 
 @main.route('/weightlog', methods=['GET', 'POST'])
@@ -307,10 +469,37 @@ def weightlog():
         db.session.commit()
         return redirect(url_for('main.weightlog'))
     
-    # Filters WeightLog table and retrieves records where user_id matches current_user.id
-    # .all() finds ALL entries associated with x user; logs will reflect these in the .html page
-    logs = WeightLog.query.filter_by(user_id=current_user.id).order_by(WeightLog.date.desc()).all()
-    return render_template('weight_log.html', form=form, logs=logs)
+    # Only one page of logs is rendered; older pages are reached through the cursor in ?after=
+    after = request.args.get('after')
+    try:
+        logs, next_cursor, next_log = weight_log_page(current_user.id, after=after)
+    except ValueError:
+        abort(400)
+    return render_template('weight_log.html', form=form, logs=logs, next_log=next_log, next_cursor=next_cursor, is_first_page=not after)
+
+@main.route('/api/weight_series')
+@login_required
+def weight_series():
+    # Weight history for the chart, downsampled so the payload size does not grow with history length
+    date_range = request.args.get('range', '90d')
+    points = request.args.get('points', WEIGHT_SERIES_POINTS, type=int)
+    points = max(3, min(points, MAX_WEIGHT_SERIES_POINTS))
+
+    query = db.select(WeightLog.date, WeightLog.weight).filter(WeightLog.user_id == current_user.id)
+    if date_range in RANGE_DAYS:
+        start_date = datetime.datetime.now() - datetime.timedelta(days=RANGE_DAYS[date_range])
+        query = query.filter(WeightLog.date >= start_date)
+    elif date_range != 'all':
+        abort(400)
+
+    rows = db.session.execute(query.order_by(WeightLog.date, WeightLog.id)).all()
+    series = lttb([(date.timestamp(), weight) for date, weight in rows], points)
+
+    return jsonify({
+        'range': date_range,
+        'total': len(rows),
+        'points': [[datetime.datetime.fromtimestamp(x).isoformat(), y] for x, y in series]
+    })
 
 @main.route('/progressphotos', methods=['GET', 'POST'])
 @login_required
@@ -320,32 +509,38 @@ def progressphotos():
     if form.validate_on_submit():
         photo = form.photo.data # Getting the photo data from the form
         filename = secure_filename(f"user_{current_user.id}_{int(time.time())}_{photo.filename}") # Generate file name based on user_id, time, photo.filename
-        bucketStore = 'progress-photos' # Supabase bucket 
-        
-        photo_data = photo.read() # Read the photo as bytes 
         
-        headers = {
-            "apikey": SUPABASE_API_KEY,
-            "Authorization": f"Bearer {SUPABASE_API_KEY}",
-            "Content-Type": "application/octet-stream"
-        }
-        
-        upload_url = f"{SUPABASE_URL}/storage/v1/object/{bucketStore}/user_{current_user.id}/{filename}"
-        response = requests.put(upload_url, headers=headers, data=photo_data)
+        if stream_size(photo.stream) > current_app.config['MAX_PHOTO_SIZE']:
+            flash(f"That photo is too large (limit {current_app.config['MAX_PHOTO_SIZE'] // (1024 * 1024)} MB).", 'danger')
+            return redirect(url_for('main.progressphotos'))
         
-        if response.status_code in (200, 201):
-            new_photo = Photo(user_id=current_user.id, filename=filename)
-            db.session.add(new_photo)
-            db.session.commit()
+        new_photo = Photo(user_id=current_user.id, filename=filename, status='pending')
+        db.session.add(new_photo)
+        db.session.commit()
+        try:
+            queue_upload('photo', new_photo, photo.stream, photo.mimetype or 'application/octet-stream')
             flash('Photo uploaded successfully!', 'success')
-        else:
-            flash('Failed to upload photot to Supabase.', 'danger')
-            print(response.text)
+        except OSError:
+            current_app.logger.exception("Could not stage photo upload %s", filename)
+            db.session.delete(new_photo)
+            db.session.commit()
+            flash('Failed to upload photo.', 'danger')
         
         return redirect(url_for('main.progressphotos'))
     
-    photos_list = Photo.query.filter_by(user_id=current_user.id).all()
-    return render_template('progress_photos.html', form=form, photos=photos_list)
+    # One page of thumbnails at a time; older photos are reached through the cursor in ?after=
+    after = request.args.get('after')
+    try:
+        photos_list, next_cursor = photo_page(current_user.id, after=after)
+    except ValueError:
+        abort(400)
+    return render_template('progress_photos.html', form=form, photos=photos_list, next_cursor=next_cursor, is_first_page=not after)
+
+@main.app_errorhandler(413)
+def file_too_large(e):
+    # MAX_CONTENT_LENGTH is checked from the request headers, before any of the body is read
+    flash(f"That file is too large (limit {current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB).", 'danger')
+    return redirect(request.referrer or url_for('main.dashboard'))
 
 @main.route('/delete_photo/<int:photo_id>', methods=['POST'])
 @login_required
@@ -357,33 +552,42 @@ def delete_photo(photo_id):
         return redirect(url_for('main.progressphotos'))
     
     try:
-        supabase_url = os.getenv('SUPABASE_URL')
-        supabase_api_key = os.getenv('SUPABASE_API_KEY')
-        bucket = 'progress-photos'
-        
-        delete_url = f"{supabase_url}/storage/v1/object/{bucket}/user_{current_user.id}/{photo.filename}" # Create the delete URL
-        headers = {
-            "apikey": supabase_api_key,
-            "Authorization": f"Bearer {supabase_api_key}",
-        }
-        
-        response = requests.delete(delete_url, headers=headers)
-        
-        if response.status_code not in (200, 204):
-            print(f"Failed to delete file from Supabase: {response.text}")
-            flash('Failed to delete photo from storage.', 'danger')
-            return redirect(url_for('main.progressphotos'))
-        
+        queue_delete('photo', photo) # The stored file is removed in the background
         db.session.delete(photo)
         db.session.commit()
         
     except Exception as e:
         # Catch and log any unexpected errors
-        print(f"An error occurred: {str(e)}")
+        current_app.logger.exception("Could not delete photo %s", photo_id)
         flash(f'An error occurred: {str(e)}', 'danger')
     
     return redirect(url_for('main.progressphotos'))
 
+@main.route('/api/media_status/<kind>')
+@login_required
+def media_status(kind):
+    # Polled by the photo and exercise pages while uploads are pending: ?ids=1,2,3
+    if kind not in MEDIA_MODELS:
+        abort(404)
+    try:
+        ids = [int(value) for value in request.args.get('ids', '').split(',') if value][:100]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of integers'}), 400
+    
+    if kind == 'photo':
+        records = Photo.query.filter(Photo.id.in_(ids), Photo.user_id == current_user.id).all()
+    else:
+        records = ExerciseMedia.query.join(ExerciseLog).join(Session).\
+            filter(ExerciseMedia.id.in_(ids), Session.user_id == current_user.id).all()
+    
+    empty = {'url': None, 'thumbnail': None, 'srcset': None}
+    return jsonify({'media': {
+        str(record.id): {
+            'status': record.status,
+            **(media_urls(kind, record, current_user.id) if record.status == 'stored' else empty)
+        } for record in records
+    }})
+
 # @main.route('/uploaded_photo/<filename>')
 # def uploaded_photo(filename):
 #     # Serve the photo from the UPLOADED_PHOTOS_DEST folder (static/uploads)
@@ -392,8 +596,10 @@ def delete_photo(photo_id):
 @main.route('/notes', methods=['GET', 'POST'])
 @login_required
 def notes():
-    notes = Note.query.filter_by(user_id=current_user.id).order_by(Note.updated_at.desc()).all()
-    sessions = Session.query.filter_by(user_id=current_user.id).order_by(Session.date.desc()).all()
+    notes = Note.query.filter_by(user_id=current_user.id).options(joinedload(Note.session)).order_by(Note.updated_at.desc()).all()
+    # The session pickers only show the title and date
+    sessions = Session.query.filter_by(user_id=current_user.id).options(load_only(Session.id, Session.title, Session.date)).\
+        order_by(Session.date.desc()).all()
     
     all_tags = set() # Need to extract unique tags from user's notes
     for note in notes:
@@ -443,7 +649,8 @@ def edit_note(note_id):
         flash("Note updated successfully", "success")
         return redirect(url_for('main.notes'))
     
-    sessions = Session.query.filter_by(user_id=current_user.id).order_by(Session.date.desc()).all()
+    sessions = Session.query.filter_by(user_id=current_user.id).options(load_only(Session.id, Session.title, Session.date)).\
+        order_by(Session.date.desc()).all()
     return render_template('edit_note.html', note=note, sessions=sessions)
 
 @main.route('/delete_note/<int:note_id>')
@@ -520,6 +727,8 @@ def join_challenge(challenge_id):
             completed=False,
         )
         db.session.add(user_challenge)
+        db.session.flush() # Fills in created_at
+        rollups.record_challenge_join(user_challenge)
         db.session.commit()
         flash(f'You have jointed the "{challenge.title}" challenge!', "success")
         
@@ -558,7 +767,7 @@ def update_challenge(user_challenge_id):
     user_challenge = UserChallenge.query.filter_by(
         id=user_challenge_id, 
         user_id=current_user.id
-    ).first_or_404()
+    ).options(joinedload(UserChallenge.challenge)).first_or_404()
     
     challenge = user_challenge.challenge # Get corresponding challenge meant to update 
     class UpdateForm(FlaskForm): # Implement update form to update challenge 
@@ -568,12 +777,13 @@ def update_challenge(user_challenge_id):
     form = UpdateForm()
     
     if form.validate_on_submit():
-        user_challenge.current_value = form.current_value.data # Set user's current challenge value to new form value 
+        user_challenge.update_progress(form.current_value.data) # Set user's current challenge value and recalculate tier/points
+        bump_data_version(current_user.id)
         if user_challenge.current_value >= challenge.goal_value and not user_challenge.completed:
             user_challenge.completed = True # Raise flag to True indicated challenge has been completed
-            user_challenge.completed_date = datetime.now() # Record current time
-            current_user.points = current_user.points + challenge.points # Update the point system mechanics 
-            flash(f'Congratulations! You have completed the challenge and earned {challenge.points} points!', 'success')
+            user_challenge.completed_date = datetime.datetime.now() # Record current time
+            rollups.record_challenge_completion(user_challenge)
+            flash(f'Congratulations! You have completed the challenge and earned {user_challenge.earned_points} points!', 'success')
             
         db.session.commit()
         return redirect(url_for('main.my_challenges'))
@@ -584,7 +794,9 @@ def update_challenge(user_challenge_id):
 @main.route('/my_challenges')
 @login_required
 def my_challenges():
-    user_challenges = UserChallenge.query.filter_by(user_id=current_user.id).join(Challenge).all()
+    # The join fills in user_challenge.challenge, so the cards do not load their challenge one by one
+    user_challenges = UserChallenge.query.filter_by(user_id=current_user.id).join(Challenge).\
+        options(contains_eager(UserChallenge.challenge)).all()
     return render_template('my_challenges.html', user_challenges=user_challenges)
 
 @main.route('/analytics', methods=['GET', 'POST'])
@@ -594,129 +806,14 @@ def analytics():
         form = AnalyticsFilterForm()
         # Get the filter parameters
         date_range = request.args.get('date_range', '30d')
-        exercise_type = request.args.get('exercise_type', 'all')
-        challenge_status = request.args.get('challenge_status', 'all')
-        
-        # Calculate the date range
-        end_date = datetime.datetime.now()
-        if date_range == '7d':
-            start_date = end_date - datetime.timedelta(days=7)
-        elif date_range == '30d':
-            start_date = end_date - datetime.timedelta(days=30)
-        elif date_range == '90d':
-            start_date = end_date - datetime.timedelta(days=90)
-        else:
-            start_date = end_date - datetime.timedelta(days=365)
-            
-        # Get user growth data
-        user_growth = db.session.query(
-            db.func.date(User.created_at).label('date'),
-            db.func.count(User.id).label('count')
-        ).filter(
-            User.created_at.between(start_date, end_date)
-        ).group_by(
-            db.func.date(User.created_at)
-        ).all()
-        
-        # Get workout frequency data - FIX: Use extract instead of strftime
-        # This query extracts the day of week (0-6) from the date
-        # PostgreSQL uses EXTRACT(DOW FROM date), SQLite would use strftime
-        # We'll use a database-agnostic approach
-        
-        if db.engine.dialect.name == 'sqlite':
-            # SQLite approach
-            workout_frequency = db.session.query(
-                db.func.strftime('%w', Session.date).label('day'),
-                db.func.count(Session.id).label('count')
-            ).filter(
-                Session.date.between(start_date, end_date),
-                Session.user_id == current_user.id
-            ).group_by(
-                db.func.strftime('%w', Session.date)
-            ).all()
-        elif db.engine.dialect.name == 'postgresql':
-            # PostgreSQL approach
-            workout_frequency = db.session.query(
-                db.func.extract('dow', Session.date).label('day'),
-                db.func.count(Session.id).label('count')
-            ).filter(
-                Session.date.between(start_date, end_date),
-                Session.user_id == current_user.id
-            ).group_by(
-                db.func.extract('dow', Session.date)
-            ).all()
-        else:
-            # Fallback for other databases - using date_part or similar might work
-            # For simplicity, we'll initialize with empty data
-            workout_frequency = []
-            
-        # Get challenge completion data
-        challenge_completion = db.session.query(
-            UserChallenge.completed,
-            db.func.count(UserChallenge.id).label('count')
-        ).filter(
-            UserChallenge.user_id == current_user.id,
-            UserChallenge.created_at.between(start_date, end_date)
-        ).group_by(
-            UserChallenge.completed
-        ).all()
-        
-        # Get exercise distribution data
-        exercise_distribution = db.session.query(
-            ExerciseLog.exercise_type,
-            db.func.count(ExerciseLog.id).label('count')
-        ).join(
-            Session
-        ).filter(
-            Session.user_id == current_user.id,
-            Session.date.between(start_date, end_date)
-        ).group_by(
-            ExerciseLog.exercise_type
-        ).all()
         
-        # Format the data for the charts
-        analytics_data = {
-            'user_growth': {
-                'labels': [str(date) for date, count in user_growth],
-                'data': [count for date, count in user_growth]
-            },
-            'workout_frequency': {
-                'labels': ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'],
-                'data': [0] * 7  # Initialize with zeros
-            },
-            'challenge_completion': {
-                'labels': ['Completed', 'In Progress', 'Not Started'],
-                'data': [0, 0, 0]  # Initialize with zeros
-            },
-            'exercise_distribution': {
-                'labels': ['Strength', 'Cardio', 'Flexibility', 'HIIT'],
-                'data': [0, 0, 0, 0]  # Initialize with zeros
-            }
-        }
-        
-        # Update the workout frequency data
-        for day, count in workout_frequency:
-            day_index = int(day) if day is not None else 0
-            analytics_data['workout_frequency']['data'][day_index] = count
-            
-        # Update challenge completion data
-        for completed, count in challenge_completion:
-            if completed:
-                analytics_data['challenge_completion']['data'][0] = count
-            else:
-                analytics_data['challenge_completion']['data'][1] = count
-                
-        # Update exercise distribution data
-        for exercise_type, count in exercise_distribution:
-            if exercise_type == 'strength':
-                analytics_data['exercise_distribution']['data'][0] = count
-            elif exercise_type == 'cardio':
-                analytics_data['exercise_distribution']['data'][1] = count
-            elif exercise_type == 'flexibility':
-                analytics_data['exercise_distribution']['data'][2] = count
-            elif exercise_type == 'hiit':
-                analytics_data['exercise_distribution']['data'][3] = count
-                
+        # Reloads of the same range are served from the cache until the user's data changes. The exercise type and
+        # challenge status filters do not change what build_analytics_data returns, so they are not part of the key
+        cache_key = (current_user.id, date_range)
+        analytics_data = analytics_cache.get_or_compute(
+            cache_key, current_data_version(current_user.id),
+            lambda: build_analytics_data(current_user.id, date_range)
+        )
         return render_template('analytics.html', form=form, analytics_data=analytics_data)
         
     except Exception as e:
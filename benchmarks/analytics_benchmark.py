@@ -0,0 +1,93 @@
+# Compares the analytics engine (one UNION ALL over daily rollups) with the original four-query path
+# Usage: python benchmarks/analytics_benchmark.py [--sessions 20000] [--runs 50]
+
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from Website import create_app, db, rollups
+from Website.models import User, Session, ExerciseLog, Challenge, UserChallenge
+from Website.analytics import build_analytics_data, date_window
+
+def seed(sessions, exercises_per_session=5, users=10, seed_value=42):
+    rng = random.Random(seed_value)
+    now = datetime.datetime.now()
+    db.session.execute(db.insert(User), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x', 'created_at': now - datetime.timedelta(days=rng.randint(0, 365))}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(db.insert(Session), [
+        {'id': i, 'user_id': (i % users) + 1, 'title': f'Session {i}', 'feeling_before': 5,
+         'date': now - datetime.timedelta(days=rng.randint(0, 730), minutes=rng.randint(0, 1440))}
+        for i in range(1, sessions + 1)
+    ])
+    db.session.execute(db.insert(ExerciseLog), [
+        {'session_id': (i // exercises_per_session) + 1, 'exercise': 'Squat',
+         'exercise_type': rng.choice(rollups.EXERCISE_TYPES), 'sets': 3, 'reps': 8, 'weight': rng.randint(45, 315), 'rpe': 8}
+        for i in range(sessions * exercises_per_session)
+    ])
+    db.session.execute(db.insert(Challenge), [{
+        'id': 1, 'title': 'Consistency', 'description': 'Train daily', 'type': 'daily', 'goal_value': 30,
+        'end_date': now + datetime.timedelta(days=30), 'badge_name': 'Streak', 'badge_image': '⭐', 'base_points': 100
+    }])
+    db.session.execute(db.insert(UserChallenge), [
+        {'user_id': i, 'challenge_id': 1, 'completed': i % 2 == 0, 'created_at': now - datetime.timedelta(days=i)}
+        for i in range(1, users + 1)
+    ])
+    db.session.commit()
+    rollups.backfill()
+
+def four_query_path(user_id, date_range):
+    # The analytics() queries as they were before the rollups (SQLite branch)
+    start_date, end_date = date_window(date_range)
+    db.session.query(db.func.date(User.created_at), db.func.count(User.id)).\
+        filter(User.created_at.between(start_date, end_date)).group_by(db.func.date(User.created_at)).all()
+    db.session.query(db.func.strftime('%w', Session.date), db.func.count(Session.id)).\
+        filter(Session.date.between(start_date, end_date), Session.user_id == user_id).\
+        group_by(db.func.strftime('%w', Session.date)).all()
+    db.session.query(UserChallenge.completed, db.func.count(UserChallenge.id)).\
+        filter(UserChallenge.user_id == user_id, UserChallenge.created_at.between(start_date, end_date)).\
+        group_by(UserChallenge.completed).all()
+    db.session.query(ExerciseLog.exercise_type, db.func.count(ExerciseLog.id)).join(Session).\
+        filter(Session.user_id == user_id, Session.date.between(start_date, end_date)).\
+        group_by(ExerciseLog.exercise_type).all()
+
+def measure(function, runs):
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    timings = []
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            function(1, '1y')
+            timings.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return statistics.median(timings), len(statements) // runs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'SECRET_KEY': 'benchmark'})
+    with app.app_context():
+        print(f"Seeding {args.sessions} sessions...")
+        seed(args.sessions)
+
+        for name, function in [('four queries (raw tables)', four_query_path), ('analytics engine (rollups)', build_analytics_data)]:
+            median, queries = measure(function, args.runs)
+            print(f"{name:<28} median {median:8.2f} ms  {queries} queries")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Cost of each BCRYPT_LOG_ROUNDS setting, to pick one that keeps a login around 250 ms on the production machine
+# Also shows how many logins per second one process sustains through the bounded hashing pool
+# Usage: python benchmarks/bcrypt_benchmark.py [--rounds 10 11 12 13] [--runs 5] [--workers 2] [--logins 20]
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Website import create_app, bcrypt
+from Website.passwords import hash_password, check_password
+
+def time_hashes(rounds, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        bcrypt.generate_password_hash('benchmark1', rounds)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def login_throughput(app, logins):
+    # Many request threads checking passwords at once; the pool only ever runs PASSWORD_HASH_WORKERS of them
+    with app.app_context():
+        stored = hash_password('benchmark1')
+
+    def login():
+        with app.app_context():
+            check_password(stored, 'benchmark1')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=logins) as requests:
+        for future in [requests.submit(login) for _ in range(logins)]:
+            future.result()
+    return logins / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--logins', type=int, default=20)
+    args = parser.parse_args()
+
+    for rounds in args.rounds:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'SECRET_KEY': 'benchmark',
+            'BCRYPT_LOG_ROUNDS': rounds,
+            'PASSWORD_HASH_WORKERS': args.workers,
+            'PASSWORD_HASH_QUEUE': args.logins,
+        })
+        median = time_hashes(rounds, args.runs)
+        throughput = login_throughput(app, args.logins)
+        print(f"rounds {rounds:>2}  hash median {median:8.1f} ms  {throughput:6.1f} logins/s with {args.workers} hashing threads")
+
+if __name__ == '__main__':
+    main()
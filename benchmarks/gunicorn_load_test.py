@@ -0,0 +1,163 @@
+# Throughput of the app under gunicorn's defaults (one sync worker, no preload) against gunicorn.conf.py
+# Starts each configuration on a local port, logs in --clients users concurrently and has them browse for --duration
+# seconds. Uses a temporary SQLite database unless --database-url points at a (disposable) Postgres database.
+# A local SQLite file answers instantly, unlike Postgres across the network, so --db-latency-ms adds that round trip
+# to every statement the servers run (through a sitecustomize module only the gunicorn processes load).
+# Usage: python benchmarks/gunicorn_load_test.py [--clients 16] [--duration 15] [--db-latency-ms 3] [--database-url ...]
+
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = ['/dashboard', '/weightlog', '/notes', '/progressphotos', '/my_challenges']
+PASSWORD = 'loadtest1'
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+LATENCY_HOOK = '''
+import os, time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+delay = float(os.environ['LOADTEST_DB_LATENCY_MS']) / 1000
+event.listen(Engine, 'before_cursor_execute', lambda *args: time.sleep(delay))
+'''
+
+def add_latency(env, directory, latency_ms):
+    # Python imports sitecustomize from the path at startup; only the server processes get this directory
+    hook_dir = os.path.join(directory, 'latency')
+    os.makedirs(hook_dir, exist_ok=True)
+    with open(os.path.join(hook_dir, 'sitecustomize.py'), 'w') as f:
+        f.write(LATENCY_HOOK)
+    return dict(env, LOADTEST_DB_LATENCY_MS=str(latency_ms),
+                PYTHONPATH=os.pathsep.join(filter(None, [hook_dir, env.get('PYTHONPATH')])))
+
+def app_environment(directory, database_url):
+    return dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        FLASK_SECRET_KEY='load-test',
+        STORAGE_BACKEND='local',
+        UPLOADS_BASE_DIR=os.path.join(directory, 'uploads'),
+        BCRYPT_LOG_ROUNDS='4', # Logins are not what is being measured here
+        SCHEMA_MANAGEMENT='migrations', # seed() created the tables
+    )
+
+def seed(env, users):
+    # Creates the schema and users loadtest0..N in a separate process, the way `flask init-schema` would
+    script = (
+        "from Website import create_app, db\n"
+        "from Website.models import User\n"
+        "from Website.passwords import hash_password\n"
+        "app = create_app()\n"
+        "with app.app_context():\n"
+        "    db.create_all()\n"
+        f"    password = hash_password({PASSWORD!r})\n"
+        f"    for i in range({users}):\n"
+        "        if not User.query.filter_by(username=f'loadtest{i}').first():\n"
+        "            db.session.add(User(username=f'loadtest{i}', email=f'loadtest{i}@example.com', password=password))\n"
+        "    db.session.commit()\n"
+    )
+    subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True)
+
+def start_gunicorn(args, env, port, timeout=30):
+    process = subprocess.Popen(['gunicorn', *args, '--bind', f'127.0.0.1:{port}', 'wsgi:app'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/login', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn {' '.join(args)} did not start")
+
+def stop_gunicorn(process):
+    process.terminate()
+    process.wait(timeout=30)
+
+def login(base_url, username):
+    client = requests.Session()
+    page = client.get(f'{base_url}/login').text
+    csrf_token = re.search(r'name="csrf_token" type="hidden" value="(.+?)"', page).group(1)
+    client.post(f'{base_url}/login', data={'username': username, 'password': PASSWORD, 'csrf_token': csrf_token})
+    return client
+
+def browse(base_url, clients, duration):
+    # Each client logs in, then requests pages back to back until the time is up; returns (latencies ms, errors)
+    sessions = [login(base_url, f'loadtest{i}') for i in range(clients)]
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def run(client, offset):
+        i = offset
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = client.get(base_url + PAGES[i % len(PAGES)], timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += 0 if ok else 1
+            i += 1
+
+    threads = [threading.Thread(target=run, args=(client, i)) for i, client in enumerate(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--db-latency-ms', type=float, default=3, help='Simulated database round trip (0 for none).')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = app_environment(directory, args.database_url or f"sqlite:///{os.path.join(directory, 'load.db')}")
+        seed(env, args.clients)
+        if args.db_latency_ms:
+            env = add_latency(env, directory, args.db_latency_ms)
+        defaults = os.path.join(directory, 'defaults.py')
+        open(defaults, 'w').close() # An empty config file, so gunicorn does not pick up gunicorn.conf.py
+
+        results = []
+        for name, gunicorn_args in [('gunicorn defaults', ['-c', defaults]), ('gunicorn.conf.py', ['-c', 'gunicorn.conf.py'])]:
+            port = free_port()
+            process = start_gunicorn(gunicorn_args, dict(env, PORT=str(port)), port)
+            try:
+                latencies, errors = browse(f'http://127.0.0.1:{port}', args.clients, args.duration)
+            finally:
+                stop_gunicorn(process)
+            throughput = len(latencies) / args.duration
+            results.append(throughput)
+            print(f"{name:<18} {throughput:7.1f} req/s  p50 {statistics.median(latencies):7.1f} ms  "
+                  f"p95 {percentile(latencies, 0.95):7.1f} ms  errors {errors}")
+        print(f"Throughput gain: {results[1] / results[0]:.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+# Load test: virtual users running scripted journeys against the app under gunicorn, entirely offline
+# Starts a fake Supabase Storage server (tests/fake_storage.py), seeds a temporary SQLite database with `flask seed`
+# (or uses --database-url, e.g. a disposable local Postgres), starts gunicorn with gunicorn.conf.py and runs
+# virtual users that log in once and then repeat a journey: dashboard, create a session, open it, log exercises,
+# view analytics, open progress photos and upload a photo. The number of active users follows --profile.
+# Reports throughput, latency percentiles and errors per step, a timeline, and worker saturation: requests in flight
+# (from /metrics) against the workers x threads gunicorn can serve at once.
+# Usage: python benchmarks/load_test.py [--users 20] [--duration 60] [--profile constant|ramp|step|spike]
+#        [--ramp 20] [--workers 2] [--threads 4] [--think-ms 0] [--db-latency-ms 0] [--database-url ...] [--json out.json]
+
+import argparse
+import io
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gunicorn_load_test import free_port, add_latency, start_gunicorn, stop_gunicorn, percentile
+from tests.fake_storage import FakeStorageServer
+from Website.seed import SEED_PASSWORD, username
+
+STEPS = ['login', 'dashboard', 'create_session', 'session_details', 'log_exercises', 'analytics', 'progress_photos',
+         'upload_photo']
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="(.+?)"')
+EXERCISES = [('Squat', 'strength'), ('Bench Press', 'strength'), ('Deadlift', 'strength'), ('Rowing', 'cardio')]
+
+def profiles(users, duration, ramp):
+    # Active virtual users wanted t seconds into the run
+    return {
+        'constant': lambda t: users,
+        'ramp': lambda t: max(1, min(users, math.ceil(users * t / ramp))) if ramp else users, # Then hold
+        'step': lambda t: max(1, math.ceil(users * min(4, int(t / (duration / 4)) + 1) / 4)), # Four equal steps
+        'spike': lambda t: users if 0.4 * duration <= t < 0.6 * duration else max(1, users // 4),
+    }
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = [] # (seconds since start, step, latency ms, ok)
+        self.journeys = 0
+        self.saturation = [] # (seconds since start, active users, requests in flight, pooled connections in use)
+        self.started = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def add(self, step, latency, ok):
+        with self.lock:
+            self.samples.append((self.elapsed(), step, latency, ok))
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, number, recorder, photo, think, timeout=30):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.number = number
+        self.recorder = recorder
+        self.photo = photo
+        self.think = think
+        self.timeout = timeout
+        self.stopping = threading.Event()
+        self.rng = random.Random(number)
+        self.http = requests.Session()
+
+    def call(self, step, method, path, expect=200, **kwargs):
+        # Sends one request and records it; returns the response, or None when it failed
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=self.timeout, allow_redirects=False, **kwargs)
+            ok = response.status_code == expect
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.add(step, (time.perf_counter() - start) * 1000, ok)
+        if self.think:
+            self.stopping.wait(self.think * self.rng.uniform(0.5, 1.5))
+        return response if ok else None
+
+    def csrf_token(self, response):
+        match = CSRF_TOKEN.search(response.text)
+        return match.group(1) if match else ''
+
+    def login(self):
+        page = self.http.get(self.base_url + '/login', timeout=self.timeout)
+        response = self.call('login', 'POST', '/login', expect=302, data={
+            'username': username(self.number), 'password': SEED_PASSWORD, 'csrf_token': self.csrf_token(page)})
+        return response is not None
+
+    def journey(self):
+        # Each step needs the one before it; a failed step ends this round of the journey
+        page = self.call('dashboard', 'GET', '/dashboard')
+        if page is None or self.stopping.is_set():
+            return
+        token = self.csrf_token(page)
+        if not self.call('create_session', 'POST', '/dashboard', expect=302, data={
+                'title': 'Load test session', 'feeling_before': self.rng.randint(3, 9), 'notes': '', 'csrf_token': token}):
+            return
+        sessions = self.http.get(self.base_url + '/api/sessions?limit=1', timeout=self.timeout).json()['sessions']
+        session_id = sessions[0]['id']
+
+        page = self.call('session_details', 'GET', f'/session_details/{session_id}')
+        if page is None or self.stopping.is_set():
+            return
+        data = {'csrf_token': self.csrf_token(page)}
+        for i, (exercise, exercise_type) in enumerate(self.rng.sample(EXERCISES, 3)):
+            data |= {f'exercises-{i}-exercise': exercise, f'exercises-{i}-exercise_type': exercise_type,
+                     f'exercises-{i}-sets': 3, f'exercises-{i}-reps': self.rng.randint(5, 12),
+                     f'exercises-{i}-weight': self.rng.randint(45, 225), f'exercises-{i}-rpe': self.rng.randint(6, 9)}
+        if not self.call('log_exercises', 'POST', f'/session_details/{session_id}/batch', data=data,
+                         headers={'X-Requested-With': 'XMLHttpRequest'}):
+            return
+        if not self.call('analytics', 'GET', '/analytics?date_range=90d') or self.stopping.is_set():
+            return
+
+        page = self.call('progress_photos', 'GET', '/progressphotos')
+        if page is None:
+            return
+        if self.call('upload_photo', 'POST', '/progressphotos', expect=302, data={'csrf_token': self.csrf_token(page)},
+                     files={'photo': (f'progress_{self.number}.jpg', self.photo, 'image/jpeg')}):
+            with self.recorder.lock:
+                self.recorder.journeys += 1
+
+    def run(self):
+        if not self.login():
+            return
+        while not self.stopping.is_set():
+            self.journey()
+
+def sample_metrics(base_url, recorder, active_users, stop, interval):
+    # Requests in flight summed over every worker (the scrape itself counts as one) and pooled connections in use
+    while not stop.wait(interval):
+        try:
+            text = requests.get(base_url + '/metrics', timeout=5).text
+        except requests.RequestException:
+            continue
+        in_flight = sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if line.startswith('http_requests_in_progress{'))
+        pooled = sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if line.startswith('db_pool_checked_out '))
+        with recorder.lock:
+            recorder.saturation.append((recorder.elapsed(), active_users(), max(0, in_flight - 1), pooled))
+
+def run_load(base_url, args, recorder, photo):
+    target = profiles(args.users, args.duration, args.ramp)[args.profile]
+    active = []
+    stop_sampling = threading.Event()
+    sampler = threading.Thread(target=sample_metrics, daemon=True,
+                               args=(base_url, recorder, lambda: len(active), stop_sampling, args.sample_interval))
+    sampler.start()
+    retired = []
+    while recorder.elapsed() < args.duration:
+        wanted = target(recorder.elapsed())
+        while len(active) < wanted:
+            user = VirtualUser(base_url, len(active) + 1, recorder, photo, args.think_ms / 1000)
+            user.start()
+            active.append(user)
+        while len(active) > wanted:
+            user = active.pop()
+            user.stopping.set()
+            retired.append(user)
+        time.sleep(0.1)
+    for user in active + retired:
+        user.stopping.set()
+    for user in active + retired:
+        user.join(timeout=60)
+    stop_sampling.set()
+    sampler.join()
+
+def summarize(recorder, args, capacity, bucket=5):
+    samples = recorder.samples
+    duration = args.duration
+    report = {'profile': args.profile, 'users': args.users, 'duration': duration, 'workers': args.workers,
+              'threads': args.threads, 'requests': len(samples), 'journeys': recorder.journeys, 'steps': {}, 'timeline': []}
+    errors = sum(1 for sample in samples if not sample[3])
+    report['throughput'] = len(samples) / duration
+    report['error_rate'] = errors / len(samples) if samples else 0
+    for step in STEPS:
+        latencies = [latency for _, name, latency, _ in samples if name == step]
+        if latencies:
+            failed = sum(1 for _, name, _, ok in samples if name == step and not ok)
+            report['steps'][step] = {'requests': len(latencies), 'errors': failed, 'error_rate': failed / len(latencies),
+                                     **{f'p{int(p * 100)}': percentile(latencies, p) for p in (0.5, 0.9, 0.95, 0.99)},
+                                     'max': max(latencies)}
+    for start in range(0, int(math.ceil(duration)), bucket):
+        window = [sample for sample in samples if start <= sample[0] < start + bucket]
+        gauges = [sample for sample in recorder.saturation if start <= sample[0] < start + bucket]
+        report['timeline'].append({
+            'start': start,
+            'users': max((gauge[1] for gauge in gauges), default=0),
+            'throughput': len(window) / bucket,
+            'p95': percentile([sample[2] for sample in window], 0.95) if window else 0,
+            'errors': sum(1 for sample in window if not sample[3]),
+            'saturation': max((gauge[2] for gauge in gauges), default=0) / capacity,
+        })
+    in_flight = [gauge[2] for gauge in recorder.saturation]
+    report['saturation'] = {
+        'capacity': capacity,
+        'mean': sum(in_flight) / len(in_flight) / capacity if in_flight else 0,
+        'max': max(in_flight, default=0) / capacity,
+        'at_capacity': sum(1 for value in in_flight if value >= capacity) / len(in_flight) if in_flight else 0,
+        'max_pooled_connections': max((gauge[3] for gauge in recorder.saturation), default=0),
+    }
+    return report
+
+def print_report(report, database):
+    print(f"\n{report['profile']} profile, up to {report['users']} users for {report['duration']:.0f}s against "
+          f"{report['workers']} workers x {report['threads']} threads ({database})")
+    print(f"{'step':<17}{'requests':>9}{'errors':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for step, stats in report['steps'].items():
+        print(f"{step:<17}{stats['requests']:>9}{stats['errors']:>8}{stats['p50']:>9.1f}{stats['p90']:>9.1f}"
+              f"{stats['p95']:>9.1f}{stats['p99']:>9.1f}{stats['max']:>9.1f}")
+    print(f"\nThroughput {report['throughput']:.1f} req/s, {report['journeys'] / report['duration']:.2f} journeys/s, "
+          f"{report['requests']} requests, error rate {report['error_rate']:.2%}")
+    print(f"\n{'t (s)':>6}{'users':>7}{'req/s':>9}{'p95 ms':>9}{'errors':>8}{'busy':>7}")
+    for row in report['timeline']:
+        print(f"{row['start']:>6}{row['users']:>7}{row['throughput']:>9.1f}{row['p95']:>9.1f}{row['errors']:>8}"
+              f"{row['saturation']:>7.0%}")
+    saturation = report['saturation']
+    print(f"\nWorker saturation: mean {saturation['mean']:.0%}, max {saturation['max']:.0%} of {saturation['capacity']} "
+          f"request slots, at capacity in {saturation['at_capacity']:.0%} of samples; "
+          f"up to {saturation['max_pooled_connections']:.0f} pooled DB connections in use")
+
+def make_photo():
+    image = Image.effect_noise((800, 600), 40).convert('RGB') # Noise, so the JPEG is a realistic size
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20, help='Peak number of virtual users.')
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--profile', choices=['constant', 'ramp', 'step', 'spike'], default='ramp')
+    parser.add_argument('--ramp', type=float, default=20, help='Seconds the ramp profile takes to reach --users.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--think-ms', type=float, default=0, help='Average pause after each request.')
+    parser.add_argument('--db-latency-ms', type=float, default=0, help='Simulated database round trip.')
+    parser.add_argument('--sample-interval', type=float, default=0.5, help='Seconds between /metrics samples.')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--json', default=None, help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = FakeStorageServer(os.path.join(directory, 'storage')).start()
+        database_url = args.database_url or f"sqlite:///{os.path.join(directory, 'load.db')}"
+        env = dict(os.environ, DATABASE_URL=database_url, FLASK_SECRET_KEY='load-test',
+                   SUPABASE_URL=storage.url, SUPABASE_API_KEY=storage.api_key, STORAGE_BACKEND='supabase',
+                   BCRYPT_LOG_ROUNDS='4') # Logins happen once per user and are not what is measured
+        print(f"Seeding {args.users} users...")
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'seed', '--users', str(args.users), '--days', '90'],
+                       cwd=ROOT, env=dict(env, SCHEMA_MANAGEMENT='create_all'), check=True, stdout=subprocess.DEVNULL)
+        env.update(SCHEMA_MANAGEMENT='migrations', # Tables exist now
+                   PROMETHEUS_MULTIPROC_DIR=os.path.join(directory, 'metrics'), # Created by gunicorn.conf.py
+                   WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.threads))
+        if args.db_latency_ms:
+            env = add_latency(env, directory, args.db_latency_ms)
+
+        port = free_port()
+        server = start_gunicorn(['-c', 'gunicorn.conf.py'], dict(env, PORT=str(port)), port)
+        recorder = Recorder()
+        try:
+            run_load(f'http://127.0.0.1:{port}', args, recorder, make_photo())
+        finally:
+            stop_gunicorn(server)
+            storage.stop()
+
+    report = summarize(recorder, args, args.workers * args.threads)
+    print_report(report, 'PostgreSQL' if args.database_url and 'postgres' in args.database_url else 'SQLite')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# Response time and query count of the main pages at three data sizes, checked against stored baselines
+# Seeds an in-memory SQLite database per scale (users x sessions x exercises x notes x challenges), logs in as the
+# first user and requests each route through the Flask test client. Prints median, p95 and queries per request, then
+# compares them with benchmarks/baselines/routes.json: the run exits with status 1 when a route got slower than
+# --threshold (and --min-delta-ms) or runs more queries than its baseline.
+# Usage: python benchmarks/route_benchmark.py [--scale small medium large] [--requests 30] [--threshold 0.5]
+#        python benchmarks/route_benchmark.py --update-baseline   (after an intended change, on the reference machine)
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import g, request_finished
+from Website import create_app, db, rollups
+from Website.cache import analytics_cache
+from Website.models import User, Session, ExerciseLog, Note, Challenge, UserChallenge
+from Website.passwords import hash_password
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baselines', 'routes.json')
+PASSWORD = 'benchpassword'
+
+# users, sessions per user, exercises per session, notes per user, challenges (every user joins all of them)
+SCALES = {
+    'small': (5, 20, 4, 10, 5),
+    'medium': (20, 200, 6, 100, 20),
+    'large': (50, 1000, 8, 500, 50),
+}
+
+EXERCISES = [('Squat', 'strength'), ('Bench Press', 'strength'), ('Deadlift', 'strength'), ('Running', 'cardio'),
+             ('Rowing', 'cardio'), ('Yoga', 'flexibility'), ('Burpees', 'hiit'), ('Overhead Press', 'strength')]
+TAGS = ['legs', 'push', 'pull', 'cardio', 'recovery', 'pr', 'form']
+
+def seed(users, sessions, exercises, notes, challenges, seed_value=42):
+    # Bulk Core inserts with fixed ids, so every run (and every scale's baseline) sees the same rows
+    rng = random.Random(seed_value)
+    now = datetime.datetime.now().replace(microsecond=0)
+    password = hash_password(PASSWORD)
+    db.session.execute(db.insert(User), [
+        {'id': u, 'username': f'bench{u}', 'email': f'bench{u}@example.com', 'password': password,
+         'created_at': now - datetime.timedelta(days=365)}
+        for u in range(1, users + 1)
+    ])
+    session_rows, exercise_rows = [], []
+    for u in range(1, users + 1):
+        for s in range(sessions):
+            session_id = (u - 1) * sessions + s + 1
+            session_rows.append({'id': session_id, 'user_id': u, 'title': f'Session {s + 1}',
+                                 'date': now - datetime.timedelta(days=s * 365 / sessions, hours=rng.randint(0, 12)),
+                                 'feeling_before': rng.randint(3, 9), 'feeling_after': rng.randint(3, 10)})
+            for e in range(exercises):
+                name, exercise_type = EXERCISES[e % len(EXERCISES)]
+                exercise_rows.append({'session_id': session_id, 'exercise': name, 'exercise_type': exercise_type,
+                                      'sets': rng.randint(2, 5), 'reps': rng.randint(3, 12),
+                                      'weight': float(rng.randint(20, 200)), 'rpe': rng.randint(5, 10),
+                                      'date': session_rows[-1]['date']})
+    db.session.execute(db.insert(Session), session_rows)
+    db.session.execute(db.insert(ExerciseLog), exercise_rows)
+    db.session.execute(db.insert(Note), [
+        {'user_id': u, 'title': f'Note {n + 1}', 'content': 'Felt strong today. ' * rng.randint(1, 10),
+         'tags': ','.join(rng.sample(TAGS, 2)), 'created_at': now - datetime.timedelta(days=n),
+         'updated_at': now - datetime.timedelta(days=n),
+         'session_id': (u - 1) * sessions + (n % sessions) + 1 if n % 2 == 0 else None}
+        for u in range(1, users + 1) for n in range(notes)
+    ])
+    db.session.execute(db.insert(Challenge), [
+        {'id': c, 'title': f'Challenge {c}', 'description': 'Hit the goal before the end date', 'type': 'weekly',
+         'category': 'Strength', 'goal_value': 100, 'metric': 'reps', 'start_date': now - datetime.timedelta(days=30),
+         'end_date': now + datetime.timedelta(days=30), 'difficulty': 'Beginner', 'badge_name': f'Badge {c}',
+         'badge_image': '🏆', 'base_points': 100}
+        for c in range(1, challenges + 1)
+    ])
+    db.session.execute(db.insert(UserChallenge), [
+        {'user_id': u, 'challenge_id': c, 'current_value': rng.randint(0, 100), 'completed': c % 3 == 0,
+         'completed_date': now - datetime.timedelta(days=c) if c % 3 == 0 else None,
+         'created_at': now - datetime.timedelta(days=c)}
+        for u in range(1, users + 1) for c in range(1, challenges + 1)
+    ])
+    db.session.commit()
+    rollups.backfill()
+
+def make_app(directory, scale):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'benchmark',
+        'BCRYPT_LOG_ROUNDS': 4, # Logins are not what is being measured
+        'SCHEMA_MANAGEMENT': 'migrations', # Tables are created below
+        'STORAGE_BACKEND': 'local',
+        'UPLOADS_BASE_DIR': os.path.join(directory, 'uploads'),
+        'MEDIA_STAGING_DIR': os.path.join(directory, 'staging'),
+        'MEDIA_WORKERS': 0,
+        'N_PLUS_ONE_THRESHOLD': sys.maxsize, # Query counts are reported below instead of logged on every request
+    })
+    with app.app_context():
+        db.create_all()
+        seed(*SCALES[scale])
+    return app
+
+def routes(sessions):
+    # (name, url, prepare); the analytics cache is cleared so every request builds the page
+    return [
+        ('dashboard', '/dashboard', None),
+        ('session_details', f'/session_details/{1 + sessions // 2}', None),
+        ('notes', '/notes', None),
+        ('challenges', '/challenges', None),
+        ('my_challenges', '/my_challenges', None),
+        ('analytics', '/analytics?date_range=1y', analytics_cache.clear),
+    ]
+
+def login(client):
+    csrf_token = re.search(b'name="csrf_token" type="hidden" value="(.+?)"', client.get('/login').data).group(1).decode()
+    client.post('/login', data={'username': 'bench1', 'password': PASSWORD, 'csrf_token': csrf_token})
+
+def measure(app, url, prepare, requests, warmup=3):
+    # Returns (median ms, p95 ms, queries per request) using the app's per-request SQL statistics
+    client = app.test_client()
+    login(client)
+    counts = []
+    def finished(sender, response, **extra):
+        counts.append(g.sql_stats.count)
+    timings = []
+    with request_finished.connected_to(finished, app), contextlib.redirect_stdout(io.StringIO()): # Routes print debug lines
+        for i in range(warmup + requests):
+            if prepare:
+                prepare()
+            start = time.perf_counter()
+            response = client.get(url)
+            elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+            if i >= warmup:
+                timings.append(elapsed)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))], max(counts[warmup:])
+
+def compare(results, baseline, threshold, min_delta_ms):
+    # Returns a list of regressions; routes or scales without a baseline are skipped
+    regressions = []
+    for scale, scale_results in results.items():
+        for route, current in scale_results.items():
+            previous = baseline.get(scale, {}).get(route)
+            if not previous:
+                continue
+            if current['queries'] > previous['queries']:
+                regressions.append(f"{scale}/{route}: {current['queries']} queries (baseline {previous['queries']})")
+            for metric in ['median_ms', 'p95_ms']:
+                limit = previous[metric] * (1 + threshold)
+                if current[metric] > limit and current[metric] - previous[metric] > min_delta_ms:
+                    regressions.append(f"{scale}/{route}: {metric} {current[metric]:.1f} (baseline {previous[metric]:.1f})")
+    return regressions
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)['scales']
+
+def save_baseline(path, results):
+    baseline = load_baseline(path)
+    baseline.update(results) # Scales not run this time keep their previous numbers
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'machine': f"{platform.machine()} {platform.python_implementation()} {platform.python_version()}",
+                   'recorded': datetime.date.today().isoformat(), 'scales': baseline}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--requests', type=int, default=30, help='Timed requests per route, after 3 warm-up requests.')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Allowed slowdown over the baseline (0.5 = 50%%).')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='Slowdowns smaller than this never fail.')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scale:
+            start = time.perf_counter()
+            app = make_app(directory, scale)
+            users, sessions = SCALES[scale][:2]
+            print(f"{scale}: {' x '.join(map(str, SCALES[scale]))} seeded in {time.perf_counter() - start:.1f}s")
+            results[scale] = {}
+            for name, url, prepare in routes(sessions):
+                median, p95, queries = measure(app, url, prepare, args.requests)
+                results[scale][name] = {'median_ms': round(median, 2), 'p95_ms': round(p95, 2), 'queries': queries}
+                print(f"  {name:<16} median {median:8.2f} ms  p95 {p95:8.2f} ms  {queries:4d} queries")
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Baseline written to {os.path.relpath(args.baseline)}")
+        return
+    regressions = compare(results, load_baseline(args.baseline), args.threshold, args.min_delta_ms)
+    if regressions:
+        print("Regressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+if __name__ == '__main__':
+    main()
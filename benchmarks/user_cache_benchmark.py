@@ -0,0 +1,77 @@
+# Queries per request for a logged-in user with the user cache off (the old per-request User query), on, and with
+# the signed-cookie snapshot
+# Usage: python benchmarks/user_cache_benchmark.py [--requests 200]
+
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from Website import create_app, db, bcrypt
+from Website.models import User
+
+PAGES = ['/dashboard', '/settings', '/weightlog', '/notes', '/api/media_status/photo?ids=1']
+
+MODES = [
+    ('no cache (before)', {'USER_CACHE_TTL': 0}),
+    ('user cache', {}),
+    ('signed-cookie snapshot', {'USER_SNAPSHOT_COOKIE': True}),
+]
+
+def make_app(overrides, directory):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'benchmark',
+        'STORAGE_BACKEND': 'local',
+        'UPLOADS_BASE_DIR': os.path.join(directory, 'uploads'),
+        'MEDIA_STAGING_DIR': os.path.join(directory, 'staging'),
+        'MEDIA_WORKERS': 0,
+        **overrides
+    })
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.password = bcrypt.generate_password_hash('benchpassword').decode('utf-8')
+        db.session.add(user)
+        db.session.commit()
+        engine = db.engine
+    return app, engine
+
+def measure(app, engine, requests):
+    client = app.test_client()
+    csrf_token = re.search(b'name="csrf_token" type="hidden" value="(.+?)"', client.get('/login').data).group(1).decode()
+    client.post('/login', data={'username': 'bench', 'password': 'benchpassword', 'csrf_token': csrf_token})
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    timings = []
+    try:
+        for i in range(requests):
+            start = time.perf_counter()
+            client.get(PAGES[i % len(PAGES)])
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    user_statements = [statement for statement in statements if 'FROM user' in statement]
+    return len(statements) / requests, len(user_statements) / requests, statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, overrides in MODES:
+            app, engine = make_app(overrides, directory)
+            queries, user_queries, median = measure(app, engine, args.requests)
+            print(f"{name:<24} {queries:5.2f} queries/request  {user_queries:5.2f} user queries/request  median {median:6.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Gunicorn settings (Procfile, start.sh and railway.json run `gunicorn -c gunicorn.conf.py wsgi:app`)
+# Each value can be overridden with the environment variable read next to it.
+
+import glob
+import multiprocessing
+import os
+import tempfile
+
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Requests mostly wait on Postgres and Supabase, so each worker runs several threads (gthread) and there are two
+# processes per CPU for the CPU-bound parts (templates, bcrypt). gevent is used only when asked for and installed,
+# since psycopg2 blocks the whole worker unless it is patched for gevent.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    try:
+        import gevent # noqa: F401
+    except ImportError:
+        worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', min(max(2, cpus * 2), 8)))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100)) # gevent only
+
+# One pooled database connection per thread; workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay under the
+# database's connection limit
+os.environ.setdefault('DB_POOL_SIZE', str(threads if worker_class == 'gthread' else 10))
+
+# The app is imported once in the master and shared copy-on-write by the workers (faster restarts, less memory)
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5 # Behind Railway's proxy, which reuses connections
+max_requests = 2000 # Recycle workers now and then so slow leaks cannot grow without bound
+max_requests_jitter = 200
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm' # Heartbeat file on tmpfs; a slow container disk can otherwise get workers killed
+
+# Workers write their Prometheus metrics to files in this directory and /metrics adds them up (see
+# Website/metrics.py). It has to be set before the app is imported; files left by an earlier run are removed.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'fitness-tracker-metrics'))
+os.makedirs(metrics_dir, exist_ok=True)
+for stale in glob.glob(os.path.join(metrics_dir, '*.db')):
+    os.remove(stale)
+
+def post_fork(server, worker):
+    # A preloaded app created its engine in the master; each worker must open its own connections
+    if preload_app:
+        from wsgi import app
+        from Website.engine import dispose_engines
+        dispose_engines(app)
+
+def child_exit(server, worker):
+    # Drops the in-flight gauges of a worker that exited, so they no longer count
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,61 @@
+"""Fill in missing session, photo and exercise media dates and make them NOT NULL
+
+Revision ID: 151d0c9a54c5
+Revises: c52e8a6b0d19
+Create Date: 2026-10-18 21:40:12.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '151d0c9a54c5'
+down_revision = 'c52e8a6b0d19'
+branch_labels = None
+depends_on = None
+
+# Keyset pages are ordered and filtered on these dates, so a NULL one could never be reached (or turned into a cursor)
+user = sa.table('user', sa.column('id'), sa.column('created_at'))
+session = sa.table('session', sa.column('id'), sa.column('user_id'), sa.column('date'))
+exercise_log = sa.table('exercise_log', sa.column('id'), sa.column('session_id'), sa.column('date'))
+photo = sa.table('photo', sa.column('user_id'), sa.column('uploaded_at'))
+exercise_media = sa.table('exercise_media', sa.column('exercise_id'), sa.column('upload_date'))
+
+
+def upgrade():
+    # Best guess for each missing date: the first exercise of a session, the exercise a clip belongs to, the
+    # user's sign-up; the time of the migration when nothing else is known
+    op.execute(session.update().where(session.c.date.is_(None)).values(date=sa.func.coalesce(
+        sa.select(sa.func.min(exercise_log.c.date)).where(exercise_log.c.session_id == session.c.id).scalar_subquery(),
+        sa.select(user.c.created_at).where(user.c.id == session.c.user_id).scalar_subquery(),
+        sa.func.current_timestamp()
+    )))
+    op.execute(photo.update().where(photo.c.uploaded_at.is_(None)).values(uploaded_at=sa.func.coalesce(
+        sa.select(user.c.created_at).where(user.c.id == photo.c.user_id).scalar_subquery(),
+        sa.func.current_timestamp()
+    )))
+    op.execute(exercise_media.update().where(exercise_media.c.upload_date.is_(None)).values(upload_date=sa.func.coalesce(
+        sa.select(exercise_log.c.date).where(exercise_log.c.id == exercise_media.c.exercise_id).scalar_subquery(),
+        sa.func.current_timestamp()
+    )))
+
+    with op.batch_alter_table('session', schema=None) as batch_op:
+        batch_op.alter_column('date', existing_type=sa.DateTime(), nullable=False)
+
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.alter_column('uploaded_at', existing_type=sa.DateTime(), nullable=False)
+
+    with op.batch_alter_table('exercise_media', schema=None) as batch_op:
+        batch_op.alter_column('upload_date', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('exercise_media', schema=None) as batch_op:
+        batch_op.alter_column('upload_date', existing_type=sa.DateTime(), nullable=True)
+
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.alter_column('uploaded_at', existing_type=sa.DateTime(), nullable=True)
+
+    with op.batch_alter_table('session', schema=None) as batch_op:
+        batch_op.alter_column('date', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,46 @@
+"""Add indexes for per-user queries
+
+Revision ID: 443da4164857
+Revises: 50332ba23f0f
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '443da4164857'
+down_revision = '50332ba23f0f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_session_user_id_date', 'session', ['user_id', 'date'], unique=False)
+    op.create_index(op.f('ix_exercise_log_session_id'), 'exercise_log', ['session_id'], unique=False)
+    op.create_index('ix_weight_log_user_id_date', 'weight_log', ['user_id', 'date'], unique=False)
+    op.create_index('ix_note_user_id_updated_at', 'note', ['user_id', 'updated_at'], unique=False)
+    op.create_index(op.f('ix_photo_user_id'), 'photo', ['user_id'], unique=False)
+    op.create_index(op.f('ix_exercise_media_exercise_id'), 'exercise_media', ['exercise_id'], unique=False)
+
+    # join_challenge() only guarded against duplicates in Python, so drop any extra rows
+    # (keeping the first join) before the unique constraint is added
+    op.execute(
+        "DELETE FROM user_challenge WHERE id NOT IN "
+        "(SELECT MIN(id) FROM user_challenge GROUP BY user_id, challenge_id)"
+    )
+    with op.batch_alter_table('user_challenge', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_user_challenge_user_id_challenge_id', ['user_id', 'challenge_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('user_challenge', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_user_challenge_user_id_challenge_id', type_='unique')
+
+    op.drop_index(op.f('ix_exercise_media_exercise_id'), table_name='exercise_media')
+    op.drop_index(op.f('ix_photo_user_id'), table_name='photo')
+    op.drop_index('ix_note_user_id_updated_at', table_name='note')
+    op.drop_index('ix_weight_log_user_id_date', table_name='weight_log')
+    op.drop_index(op.f('ix_exercise_log_session_id'), table_name='exercise_log')
+    op.drop_index('ix_session_user_id_date', table_name='session')
@@ -0,0 +1,40 @@
+"""Add daily_rollup table
+
+Revision ID: 88213dcaf4be
+Revises: 443da4164857
+Create Date: 2026-10-18 13:40:05.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '88213dcaf4be'
+down_revision = '443da4164857'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('session_count', sa.Integer(), nullable=False),
+    sa.Column('strength_count', sa.Integer(), nullable=False),
+    sa.Column('cardio_count', sa.Integer(), nullable=False),
+    sa.Column('flexibility_count', sa.Integer(), nullable=False),
+    sa.Column('hiit_count', sa.Integer(), nullable=False),
+    sa.Column('total_volume', sa.Float(), nullable=False),
+    sa.Column('challenges_joined', sa.Integer(), nullable=False),
+    sa.Column('challenges_completed', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'day', name='uq_daily_rollup_user_id_day')
+    )
+    # Existing data is loaded with `flask backfill-rollups`
+
+
+def downgrade():
+    op.drop_table('daily_rollup')
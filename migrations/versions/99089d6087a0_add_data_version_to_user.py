@@ -0,0 +1,26 @@
+"""Add data_version to user
+
+Revision ID: 99089d6087a0
+Revises: 88213dcaf4be
+Create Date: 2026-10-18 15:02:47.560913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '99089d6087a0'
+down_revision = '88213dcaf4be'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
@@ -0,0 +1,32 @@
+"""Add upload status to photo and exercise_media
+
+Revision ID: a3c1f07e52d4
+Revises: 99089d6087a0
+Create Date: 2026-10-18 17:21:09.114382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1f07e52d4'
+down_revision = '99089d6087a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=10), server_default='stored', nullable=False))
+
+    with op.batch_alter_table('exercise_media', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=10), server_default='stored', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('exercise_media', schema=None) as batch_op:
+        batch_op.drop_column('status')
+
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.drop_column('status')
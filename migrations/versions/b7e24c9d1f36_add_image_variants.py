@@ -0,0 +1,44 @@
+"""Add image dimensions and thumbnail variants to photo and exercise_media
+
+Revision ID: b7e24c9d1f36
+Revises: a3c1f07e52d4
+Create Date: 2026-10-18 18:04:51.273640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e24c9d1f36'
+down_revision = 'a3c1f07e52d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('variants', sa.JSON(), nullable=True))
+        batch_op.drop_index('ix_photo_user_id')
+        batch_op.create_index('ix_photo_user_id_uploaded_at', ['user_id', 'uploaded_at'], unique=False)
+
+    with op.batch_alter_table('exercise_media', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('exercise_media', schema=None) as batch_op:
+        batch_op.drop_column('variants')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
+
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.drop_index('ix_photo_user_id_uploaded_at')
+        batch_op.create_index('ix_photo_user_id', ['user_id'], unique=False)
+        batch_op.drop_column('variants')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
@@ -0,0 +1,48 @@
+"""Add media_object table and content hashes for upload deduplication
+
+Revision ID: c52e8a6b0d19
+Revises: b7e24c9d1f36
+Create Date: 2026-10-18 19:12:30.482215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e8a6b0d19'
+down_revision = 'b7e24c9d1f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media_object',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.String(length=50), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('filename', sa.String(length=120), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'content_hash', 'bucket', name='uq_media_object_user_id_content_hash_bucket')
+    )
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index('ix_photo_user_id_content_hash', ['user_id', 'content_hash'], unique=False)
+
+    with op.batch_alter_table('exercise_media', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('exercise_media', schema=None) as batch_op:
+        batch_op.drop_column('content_hash')
+
+    with op.batch_alter_table('photo', schema=None) as batch_op:
+        batch_op.drop_index('ix_photo_user_id_content_hash')
+        batch_op.drop_column('content_hash')
+
+    op.drop_table('media_object')
@@ -1,3 +1,7 @@
 #!/bin/bash
 echo "Starting Fitness Tracker application..."
-gunicorn --bind 0.0.0.0:$PORT wsgi:app 
\ No newline at end of file
+# With SCHEMA_MANAGEMENT=migrations the workers never touch the schema, so it is brought up to date once here
+if [ "$SCHEMA_MANAGEMENT" = "migrations" ]; then
+    flask --app wsgi init-schema && flask --app wsgi db upgrade || exit 1
+fi
+exec gunicorn -c gunicorn.conf.py wsgi:app
@@ -4,14 +4,20 @@ from Website.models import User
 import re
 import os
 from unittest.mock import patch
-from flask import Flask
+from flask import Flask, g, request_finished
 
 @pytest.fixture
-def client():
+def client(tmp_path):
     app = create_app({
         'TESTING': True,
         'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
-        'SECRET_KEY': 'test-secret-key'
+        'SECRET_KEY': 'test-secret-key',
+        'BCRYPT_LOG_ROUNDS': 4, # Cheapest cost bcrypt allows, to keep the suite fast
+        'SCHEMA_MANAGEMENT': 'migrations', # The fixture creates the tables itself
+        'STORAGE_BACKEND': 'local', # Uploads go to a temporary directory instead of Supabase
+        'UPLOADS_BASE_DIR': str(tmp_path / 'uploads'),
+        'MEDIA_STAGING_DIR': str(tmp_path / 'staging'),
+        'MEDIA_WORKERS': 0 # Uploads finish inside the request
     })
     
     # Mock the render_template function to avoid template loading
@@ -69,4 +75,18 @@ def get_csrf_token(response):
         match = re.search(b'name="csrf_token" type="hidden" value="(.+?)"', response.data)
         if match:
             csrf_token = match.group(1).decode('utf-8')
-    return csrf_token
\ No newline at end of file
+    return csrf_token
+
+# Fails the test when serving url runs more than max_queries SQL statements; returns the response.
+# The count comes from the app's own per-request statistics (Website/sql_stats.py).
+def assert_max_queries(client, url, max_queries, method='GET', **kwargs):
+    served = []
+    def finished(sender, response, **extra):
+        served.append(g.sql_stats)
+    with request_finished.connected_to(finished, client.application):
+        response = client.open(url, method=method, **kwargs)
+    assert len(served) == 1, f"expected one request for {url}, got {len(served)}"
+    stats = served[0]
+    breakdown = '\n'.join(f"  {count} x {statement}" for statement, count in stats.fingerprints.most_common())
+    assert stats.count <= max_queries, f"{method} {url} ran {stats.count} queries (max {max_queries}):\n{breakdown}"
+    return response
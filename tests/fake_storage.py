@@ -0,0 +1,239 @@
+# Local stand-in for the Supabase Storage API used by the upload tests
+# Objects are written to a directory as they arrive, so the server itself holds no file in memory
+
+import base64
+import datetime
+import itertools
+import json
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+READ_SIZE = 64 * 1024
+
+class FakeStorageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        if data:
+            self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def copy_body(self, target):
+        # Reads the request body in small pieces straight into the target file
+        remaining = int(self.headers.get('Content-Length', 0))
+        received = 0
+        while remaining > 0:
+            data = self.rfile.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            target.write(data)
+            remaining -= len(data)
+            received += len(data)
+        return received
+
+    def discard_body(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            data = self.rfile.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def authorized(self):
+        self.server.connections.add(self.client_address)
+        return self.headers.get('Authorization') == f"Bearer {self.server.api_key}"
+
+    def object_key(self):
+        prefix = '/storage/v1/object/'
+        if not self.path.startswith(prefix):
+            return None
+        return self.path[len(prefix):]
+
+    def do_POST(self):
+        if not self.authorized():
+            self.discard_body()
+            return self.reply(401, {'error': 'Unauthorized'})
+        if self.path == '/storage/v1/upload/resumable':
+            return self.create_upload()
+        if self.path.startswith('/storage/v1/object/list/'):
+            return self.list_objects(self.path[len('/storage/v1/object/list/'):])
+        self.store_object(replace=False)
+
+    def do_PUT(self):
+        if not self.authorized():
+            self.discard_body()
+            return self.reply(401, {'error': 'Unauthorized'})
+        self.store_object(replace=True)
+
+    def do_DELETE(self):
+        key = self.object_key()
+        if key is None or not self.authorized():
+            self.discard_body()
+            return self.reply(401, {'error': 'Unauthorized'})
+        if '/' not in key: # Bulk delete: DELETE /storage/v1/object/{bucket} with {"prefixes": [...]}
+            return self.delete_objects(key)
+        path = self.server.path_for(key)
+        if not os.path.exists(path):
+            return self.reply(404, {'error': 'not_found'})
+        os.remove(path)
+        self.reply(200, {'message': 'Successfully deleted'})
+
+    def store_object(self, replace):
+        key = self.object_key()
+        self.server.gate.wait() # Tests can hold uploads to observe the pending state
+        if self.server.fail_requests > 0: # Simulates an overloaded storage API
+            self.server.fail_requests -= 1
+            self.discard_body()
+            return self.reply(503, {'error': 'simulated failure'})
+        path = self.server.path_for(key)
+        if os.path.exists(path) and not replace:
+            self.discard_body()
+            return self.reply(409, {'error': 'Duplicate', 'message': 'The resource already exists'})
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as target:
+            self.copy_body(target)
+        self.server.requests.append((self.command, key))
+        self.reply(200, {'Key': key})
+
+    def list_objects(self, bucket):
+        # One folder level, sorted by name and paged with limit/offset like Supabase's list endpoint
+        body = self.read_json()
+        self.server.listings.append((bucket, body.get('prefix', ''), body.get('offset', 0)))
+        directory = self.server.path_for('/'.join(part for part in (bucket, body.get('prefix', '').strip('/')) if part))
+        names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+        offset, limit = body.get('offset', 0), body.get('limit', 100)
+        items = []
+        for name in names[offset:offset + limit]:
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                items.append({'name': name, 'id': None, 'created_at': None, 'metadata': None})
+            else:
+                created_at = datetime.datetime.fromtimestamp(os.path.getmtime(path), datetime.timezone.utc)
+                items.append({'name': name, 'id': name, 'created_at': created_at.isoformat().replace('+00:00', 'Z'),
+                              'metadata': {'size': os.path.getsize(path)}})
+        self.reply(200, items)
+
+    def delete_objects(self, bucket):
+        prefixes = self.read_json().get('prefixes', [])
+        self.server.bulk_deletes.append(prefixes)
+        deleted = []
+        for name in prefixes:
+            path = self.server.path_for(f"{bucket}/{name}")
+            if os.path.isfile(path):
+                os.remove(path)
+                deleted.append({'name': name, 'bucket_id': bucket})
+                # Folders are only name prefixes: one disappears with its last object
+                folder = os.path.dirname(path)
+                while folder != self.server.path_for(bucket) and not os.listdir(folder):
+                    os.rmdir(folder)
+                    folder = os.path.dirname(folder)
+        self.reply(200, deleted)
+
+    # Resumable (TUS) uploads
+
+    def create_upload(self):
+        metadata = {}
+        for item in self.headers.get('Upload-Metadata', '').split(','):
+            if ' ' in item:
+                name, value = item.split(' ', 1)
+                metadata[name] = base64.b64decode(value).decode('utf-8')
+        upload_id = str(next(self.server.upload_ids))
+        self.server.uploads[upload_id] = {
+            'key': f"{metadata['bucketName']}/{metadata['objectName']}",
+            'length': int(self.headers['Upload-Length']),
+            'offset': 0,
+        }
+        open(self.server.path_for(f".uploads/{upload_id}"), 'wb').close()
+        location = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/storage/v1/upload/resumable/{upload_id}"
+        self.reply(201, headers={'Location': location, 'Tus-Resumable': '1.0.0'})
+
+    def upload_for_path(self):
+        upload_id = self.path.rsplit('/', 1)[-1]
+        return upload_id, self.server.uploads.get(upload_id)
+
+    def do_HEAD(self):
+        upload_id, upload = self.upload_for_path()
+        if upload is None:
+            return self.reply(404)
+        self.reply(200, headers={'Upload-Offset': str(upload['offset']), 'Upload-Length': str(upload['length'])})
+
+    def do_PATCH(self):
+        upload_id, upload = self.upload_for_path()
+        if upload is None or not self.authorized():
+            self.discard_body()
+            return self.reply(404)
+        if int(self.headers['Upload-Offset']) != upload['offset']:
+            self.discard_body()
+            return self.reply(409, {'error': 'offset mismatch'})
+        if self.server.fail_patches > 0: # Simulates a dropped chunk
+            self.server.fail_patches -= 1
+            self.discard_body()
+            return self.reply(500, {'error': 'simulated failure'})
+
+        part = self.server.path_for(f".uploads/{upload_id}")
+        with open(part, 'ab') as target:
+            upload['offset'] += self.copy_body(target)
+        self.server.patch_sizes.append(int(self.headers.get('Content-Length', 0)))
+        if upload['offset'] >= upload['length']:
+            path = self.server.path_for(upload['key'])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.move(part, path)
+            self.server.requests.append(('TUS', upload['key']))
+        self.reply(204, headers={'Upload-Offset': str(upload['offset']), 'Tus-Resumable': '1.0.0'})
+
+class FakeStorageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root, api_key='test-key'):
+        super().__init__(('127.0.0.1', 0), FakeStorageHandler)
+        self.root = root
+        self.api_key = api_key
+        self.uploads = {}
+        self.upload_ids = itertools.count(1)
+        self.requests = [] # (method, key) for every stored object
+        self.patch_sizes = []
+        self.fail_patches = 0
+        self.fail_requests = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self.connections = set() # Client (host, port) pairs seen, one per TCP connection
+        self.listings = [] # (bucket, prefix, offset) for every list request
+        self.bulk_deletes = [] # Object names sent in each bulk delete
+        os.makedirs(os.path.join(root, '.uploads'), exist_ok=True)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def path_for(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def has_object(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def object_size(self, key):
+        return os.path.getsize(self.path_for(key))
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,140 @@
+import pytest
+import datetime
+from Website.models import Session, ExerciseLog, DailyRollup
+from Website import db, rollups
+from Website.cache import analytics_cache, ResultCache
+from Website.analytics import build_analytics_data
+from sqlalchemy import event
+from tests.conftest import get_csrf_token
+
+def rollup_rows(app):
+    with app.app_context():
+        return [
+            {name: getattr(row, name) for name in ['day'] + rollups.COUNTERS}
+            for row in DailyRollup.query.filter_by(user_id=1).order_by(DailyRollup.day).all()
+        ]
+
+def test_rollups_follow_writes(client, auth):
+    auth.login()
+    csrf_token = get_csrf_token(client.get('/dashboard'))
+    client.post('/dashboard', data={'title': 'Leg Day', 'feeling_before': 6, 'csrf_token': csrf_token})
+    
+    with client.application.app_context():
+        session_id = Session.query.filter_by(title='Leg Day').first().id
+    
+    for weight in (100, 200):
+        client.post(f'/session_details/{session_id}', data={
+            'exercise': 'Squat', 'exercise_type': 'strength', 'sets': 3, 'reps': 5, 'weight': weight, 'rpe': 8,
+            'csrf_token': csrf_token
+        })
+    
+    rows = rollup_rows(client.application)
+    assert len(rows) == 1
+    assert rows[0]['session_count'] == 1
+    assert rows[0]['strength_count'] == 2
+    assert rows[0]['total_volume'] == 4500
+    
+    with client.application.app_context():
+        exercise_id = ExerciseLog.query.filter_by(weight=200).first().id
+    client.post(f'/delete_exercise/{exercise_id}/{session_id}')
+    
+    rows = rollup_rows(client.application)
+    assert rows[0]['strength_count'] == 1
+    assert rows[0]['total_volume'] == 1500
+    
+    # A rebuild from the raw tables must agree with the incremental updates
+    with client.application.app_context():
+        rollups.backfill()
+    assert rollup_rows(client.application) == rows
+
+def test_backfill_command_and_analytics_page(client, auth):
+    auth.login()
+    
+    with client.application.app_context():
+        today = datetime.datetime.now()
+        for days_ago in range(10):
+            session = Session(title=f'Run {days_ago}', feeling_before=5, user_id=1, date=today - datetime.timedelta(days=days_ago))
+            db.session.add(session)
+            db.session.flush()
+            db.session.add(ExerciseLog(session_id=session.id, exercise='Run', exercise_type='cardio', sets=1, reps=1, weight=0, rpe=6))
+        db.session.commit()
+    
+    result = client.application.test_cli_runner().invoke(args=['backfill-rollups'])
+    assert result.exit_code == 0
+    assert 'Wrote 10 daily rollup rows' in result.output
+    
+    response = client.get('/analytics?date_range=7d')
+    assert response.status_code == 200
+    assert b'"exercise_distribution": {"data": [0, 8, 0, 0]' in response.data
+
+def test_analytics_cache_is_invalidated_by_writes(client, auth):
+    auth.login()
+    analytics_cache.clear()
+    
+    client.get('/analytics?date_range=30d')
+    client.get('/analytics?date_range=30d')
+    assert analytics_cache.stats()['hits'] == 1
+    assert analytics_cache.stats()['misses'] == 1
+    
+    csrf_token = get_csrf_token(client.get('/dashboard'))
+    client.post('/dashboard', data={'title': 'Evening Run', 'feeling_before': 7, 'csrf_token': csrf_token})
+    
+    response = client.get('/analytics?date_range=30d')
+    assert analytics_cache.stats()['misses'] == 2 # The new session bumped the user's data version
+    assert b'"workout_frequency": {"data": [0, 0, 0, 0, 0, 0, 0]' not in response.data
+
+def test_analytics_filters_share_a_cache_entry(client, auth):
+    auth.login()
+    analytics_cache.clear()
+    
+    client.get('/analytics?date_range=30d')
+    client.get('/analytics?date_range=30d&exercise_type=cardio&challenge_status=completed')
+    assert analytics_cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+def test_result_cache_discard_only_affects_its_key():
+    cache = ResultCache(max_entries=10, ttl=60)
+    def compute_while_discarding(key):
+        def compute():
+            cache.discard(key) # Another request changes this key's data while the value is being computed
+            return 'value'
+        return compute
+    
+    cache.get_or_compute('a', 0, compute_while_discarding('b')) # Someone else's write
+    assert cache.get_or_compute('a', 0, lambda: 'recomputed') == 'value'
+    cache.get_or_compute('b', 0, compute_while_discarding('b')) # A write to this key: the stale value is not kept
+    assert cache.get_or_compute('b', 0, lambda: 'recomputed') == 'recomputed'
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, ttl=60)
+    cache.get_or_compute('a', 0, lambda: 1)
+    cache.get_or_compute('b', 0, lambda: 2)
+    cache.get_or_compute('a', 0, lambda: 1)
+    cache.get_or_compute('c', 0, lambda: 3) # Evicts 'b'
+    
+    assert cache.get_or_compute('a', 0, lambda: 'recomputed') == 1
+    assert cache.get_or_compute('b', 0, lambda: 'recomputed') == 'recomputed'
+    assert cache.get_or_compute('a', 1, lambda: 'new version') == 'new version'
+
+def test_analytics_engine_is_one_round_trip(client):
+    app = client.application
+    with app.app_context():
+        session = Session(title='Bench', feeling_before=5, user_id=1)
+        db.session.add(session)
+        db.session.flush()
+        db.session.add(ExerciseLog(session_id=session.id, exercise='Bench', exercise_type='strength', sets=5, reps=5, weight=100, rpe=8))
+        db.session.commit()
+        rollups.backfill()
+        
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            data = build_analytics_data(1, '30d')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    
+    assert len(statements) == 1
+    assert data['exercise_distribution']['data'] == [1, 0, 0, 0]
+    assert data['volume']['data'] == [2500]
+    assert sum(data['workout_frequency']['data']) == 1
+    assert sum(data['user_growth']['data']) == 1
@@ -1,7 +1,9 @@
 import pytest
+import threading
 from Website.models import User
-from Website import db
-from tests.conftest import get_csrf_token
+from Website import db, bcrypt
+from Website.passwords import password_hasher, hash_rounds
+from tests.conftest import get_csrf_token, AuthActions
 
 def test_login_success(client):
     response = client.get('/login')
@@ -37,4 +39,62 @@ def test_login_failure(client):
 
 def test_protected_route(client):
     response = client.get('/dashboard', follow_redirects=False)
-    assert response.status_code == 302  # should redirect to login page
\ No newline at end of file
+    assert response.status_code == 302  # should redirect to login page
+
+def count_hashes(monkeypatch):
+    calls = []
+    run = password_hasher.run
+    def counting_run(function, *args):
+        calls.append(function.__name__)
+        return run(function, *args)
+    monkeypatch.setattr(password_hasher, 'run', counting_run)
+    return calls
+
+def test_login_upgrades_hash_to_configured_cost(client):
+    user = db.session.get(User, 1)
+    user.password = bcrypt.generate_password_hash('testpassword', 5).decode('utf-8')
+    db.session.commit()
+
+    response = AuthActions(client).login()
+    assert b'Dashboard' in response.data
+    db.session.expire_all()
+    assert hash_rounds(db.session.get(User, 1).password) == 4
+    assert bcrypt.check_password_hash(db.session.get(User, 1).password, 'testpassword')
+
+def test_login_keeps_hash_at_current_cost(client, monkeypatch):
+    stored = db.session.get(User, 1).password
+    calls = count_hashes(monkeypatch)
+    AuthActions(client).login()
+    assert calls == ['check_password_hash']
+    db.session.expire_all()
+    assert db.session.get(User, 1).password == stored
+
+def register(client, username, password='newpass1'):
+    csrf_token = get_csrf_token(client.get('/register'))
+    return client.post('/register', data={
+        'username': username, 'email': f'{username}@example.com', 'password': password,
+        'confirmPassword': password, 'csrf_token': csrf_token
+    })
+
+def test_registration_hashes_once(client, monkeypatch):
+    calls = count_hashes(monkeypatch)
+    response = register(client, 'newuser')
+    assert response.status_code == 302
+    assert calls == ['generate_password_hash']
+    assert hash_rounds(User.query.filter_by(username='newuser').one().password) == 4
+
+    calls.clear()
+    response = register(client, 'newuser') # Already registered with this password
+    assert response.location.endswith('/login')
+    assert calls == ['check_password_hash']
+    assert User.query.filter_by(username='newuser').count() == 1
+
+def test_busy_hashing_pool_turns_logins_away(client, monkeypatch):
+    monkeypatch.setattr(password_hasher, 'slots', threading.BoundedSemaphore(1))
+    password_hasher.slots.acquire() # Every hashing slot is taken
+    response = AuthActions(client).login()
+    assert response.status_code == 503
+    assert b'busy' in response.data
+
+    password_hasher.slots.release()
+    assert b'Dashboard' in AuthActions(client).login().data
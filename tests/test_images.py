@@ -0,0 +1,116 @@
+import io
+import logging
+import os
+import datetime
+from PIL import Image
+from Website import db
+from Website.models import Photo
+from Website import media_jobs
+from Website.images import process_image, THUMBNAIL_WIDTHS
+from tests.conftest import get_csrf_token
+
+def jpeg_with_exif(width=1600, height=1200, orientation=6):
+    # Landscape pixels with an EXIF tag saying the camera was rotated, plus a GPS tag that must not survive
+    image = Image.new('RGB', (width, height), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = orientation # Orientation
+    exif[0x010F] = 'PhoneCam' # Make
+    exif[0x8825] = {1: 'N', 2: (51.0, 30.0, 0.0)} # GPSInfo
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+def test_process_image_fixes_orientation_and_strips_metadata(tmp_path):
+    path = str(tmp_path / 'photo')
+    with open(path, 'wb') as f:
+        f.write(jpeg_with_exif())
+
+    width, height, thumbnails = process_image(path)
+    assert (width, height) == (1200, 1600) # Rotated upright
+    with Image.open(path) as image:
+        assert image.size == (1200, 1600)
+        assert not image.getexif() # No orientation, camera or GPS tags left
+    assert sorted(thumbnails) == list(THUMBNAIL_WIDTHS[:2]) # 1280 would be an upscale
+    for thumbnail_width, thumbnail_path in thumbnails.items():
+        with Image.open(thumbnail_path) as thumbnail:
+            assert thumbnail.format == 'WEBP'
+            assert thumbnail.width == thumbnail_width
+            assert thumbnail.height > thumbnail.width
+
+    # A retry reuses the thumbnails instead of re-encoding the original again
+    before = os.path.getmtime(path)
+    assert process_image(path) == (width, height, thumbnails)
+    assert os.path.getmtime(path) == before
+
+def test_small_and_non_image_files(tmp_path):
+    small = str(tmp_path / 'small')
+    Image.new('RGBA', (100, 80)).save(small, 'PNG')
+    assert sorted(process_image(small)[2]) == [100] # One WebP copy at its own size
+
+    text = str(tmp_path / 'notes')
+    with open(text, 'wb') as f:
+        f.write(b'not an image')
+    assert process_image(text) is None
+
+def upload(client, content, filename='front.jpg'):
+    csrf_token = get_csrf_token(client.get('/progressphotos'))
+    return client.post('/progressphotos', data={
+        'photo': (io.BytesIO(content), filename),
+        'csrf_token': csrf_token
+    }, content_type='multipart/form-data', follow_redirects=True)
+
+def test_gallery_renders_thumbnails(client, auth):
+    auth.login()
+    response = upload(client, jpeg_with_exif())
+    assert b'Photo uploaded successfully' in response.data
+
+    with client.application.app_context():
+        photo = db.session.scalars(db.select(Photo)).one()
+        assert photo.status == 'stored'
+        assert (photo.width, photo.height) == (1200, 1600)
+        assert set(photo.variants) == {'320', '640'}
+        user_dir = os.path.join(client.application.config['UPLOADS_BASE_DIR'], 'progress-photos', 'user_1')
+        assert sorted(os.listdir(user_dir)) == sorted([photo.filename] + list(photo.variants.values()))
+
+    page = client.get('/progressphotos').data.decode()
+    assert 'srcset="' in page and ' 320w, ' in page and ' 640w"' in page
+    assert 'loading="lazy"' in page
+    assert f'href="/media/progress-photos/user_1/{photo.filename}"' in page # The original only opens on click
+
+    # Deleting the photo removes the thumbnails too
+    client.post(f'/delete_photo/{photo.id}')
+    assert os.listdir(user_dir) == []
+
+def test_broken_image_is_stored_without_thumbnails(client, auth, monkeypatch, caplog):
+    def broken(path):
+        raise OSError('truncated image')
+    monkeypatch.setattr(media_jobs, 'process_image', broken)
+    auth.login()
+    with caplog.at_level(logging.WARNING, logger=client.application.logger.name):
+        upload(client, jpeg_with_exif())
+
+    with client.application.app_context():
+        photo = db.session.scalars(db.select(Photo)).one()
+        assert photo.status == 'stored' and photo.variants is None
+    warning = next(record for record in caplog.records if record.message.startswith('Could not make thumbnails'))
+    assert f'progress-photos/user_1/{photo.filename}' in warning.message
+    assert warning.exc_info[1].args == ('truncated image',)
+
+def test_gallery_is_paginated(client, auth):
+    auth.login()
+    with client.application.app_context():
+        start = datetime.datetime(2024, 1, 1)
+        db.session.add_all([
+            Photo(user_id=1, filename=f'photo_{i}.jpg', uploaded_at=start + datetime.timedelta(days=i)) for i in range(30)
+        ])
+        db.session.commit()
+
+    first = client.get('/progressphotos').data.decode()
+    assert first.count('class="photo-item"') == 24
+    assert 'photo_29.jpg' in first and 'photo_5.jpg' not in first
+    cursor = first.split('/progressphotos?after=')[1].split('"')[0]
+
+    second = client.get(f'/progressphotos?after={cursor}').data.decode()
+    assert second.count('class="photo-item"') == 6
+    assert 'photo_5.jpg' in second and 'Older' not in second
+    assert client.get('/progressphotos?after=garbage').status_code == 400
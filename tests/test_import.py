@@ -0,0 +1,105 @@
+import pytest
+import io
+import json
+import time
+from Website.models import Session, ExerciseLog, WeightLog, DailyRollup
+from Website import db, importer, rollups
+from Website.importer import import_file
+from tests.conftest import get_csrf_token
+
+CSV_DATA = """record_type,date,title,exercise,exercise_type,sets,reps,weight,rpe,unit
+session,2024-03-01T07:00:00,Leg Day,,,,,,,
+exercise,2024-03-01T07:10:00,Leg Day,Squat,strength,5,5,225,8,
+exercise,2024-03-01T07:30:00,Leg Day,Lunge,strength,3,10,50,7,
+exercise,2024-03-02T18:00:00,,Run,cardio,1,1,0,6,
+exercise,2024-03-03,,,strength,3,10,50,7,
+weight,2024-03-01,,,,,,80,,kg
+weight,not-a-date,,,,,,180,,
+"""
+
+def test_import_csv_upload(client, auth):
+    auth.login()
+    csrf_token = get_csrf_token(client.get('/settings'))
+    
+    response = client.post('/import', data={
+        'data_file': (io.BytesIO(CSV_DATA.encode('utf-8')), 'history.csv'),
+        'csrf_token': csrf_token
+    }, content_type='multipart/form-data', follow_redirects=True)
+    
+    assert b'Imported 2 sessions, 3 exercises and 1 weigh-ins.' in response.data
+    assert b'2 rows were skipped' in response.data
+    assert b'row 5: exercise is required' in response.data
+    
+    with client.application.app_context():
+        leg_day = Session.query.filter_by(title='Leg Day').one()
+        assert ExerciseLog.query.filter_by(session_id=leg_day.id).count() == 2
+        assert Session.query.filter_by(title='Imported Workout').count() == 1
+        assert WeightLog.query.one().weight == 176.4 # 80 kg stored in lbs
+        assert DailyRollup.query.filter_by(user_id=1).count() == 2
+
+def test_import_100k_rows(client):
+    rows = []
+    for i in range(100_000):
+        if i % 10 == 0:
+            rows.append({'record_type': 'weight', 'date': f"{2000 + i // 10000}-01-01", 'weight': 180})
+        else:
+            rows.append({'date': f"{2000 + i // 10000}-{1 + (i // 1000) % 12:02d}-{1 + (i // 40) % 28:02d}",
+                         'exercise': 'Deadlift', 'sets': 3, 'reps': 5, 'weight': 315, 'rpe': 9})
+    data = '\n'.join(json.dumps(row) for row in rows).encode('utf-8')
+    
+    with client.application.app_context():
+        start = time.perf_counter()
+        result = import_file(1, io.BytesIO(data), 'history.ndjson')
+        elapsed = time.perf_counter() - start
+        
+        assert result.error_count == 0
+        assert result.exercises == 90_000
+        assert result.weights == 10_000
+        assert ExerciseLog.query.count() == 90_000
+    assert elapsed < 60
+
+def test_importing_twice_adds_nothing(client):
+    with client.application.app_context():
+        first = import_file(1, io.BytesIO(CSV_DATA.encode('utf-8')), 'history.csv')
+        second = import_file(1, io.BytesIO(CSV_DATA.encode('utf-8')), 'history.csv')
+        
+        assert (first.sessions, first.exercises, first.weights, first.duplicates) == (2, 3, 1, 0)
+        assert (second.sessions, second.exercises, second.weights) == (0, 0, 0)
+        assert second.duplicates == 5 # The session row, three exercises and the weigh-in
+        assert Session.query.count() == 2
+        assert ExerciseLog.query.count() == 3
+        assert WeightLog.query.count() == 1
+        
+        # A new exercise in a session that already exists goes into that session
+        extra = 'record_type,date,title,exercise,sets,reps,weight\nexercise,2024-03-01T07:50:00,Leg Day,Calf Raise,3,15,90\n'
+        result = import_file(1, io.BytesIO(extra.encode('utf-8')), 'more.csv')
+        assert (result.sessions, result.exercises) == (0, 1)
+        leg_day = Session.query.filter_by(title='Leg Day').one()
+        assert ExerciseLog.query.filter_by(session_id=leg_day.id).count() == 3
+
+def test_session_row_after_its_exercises(client, monkeypatch):
+    monkeypatch.setattr(importer, 'CHUNK_ROWS', 2) # The session row arrives in a later chunk than its exercises
+    rows = [
+        {'record_type': 'exercise', 'date': '2024-03-01T07:10:00', 'title': 'Leg Day', 'exercise': 'Squat', 'sets': 5, 'reps': 5},
+        {'record_type': 'exercise', 'date': '2024-03-01T07:30:00', 'title': 'Leg Day', 'exercise': 'Lunge', 'sets': 3, 'reps': 10},
+        {'record_type': 'session', 'date': '2024-03-01T07:00:00', 'title': 'Leg Day', 'feeling_before': 6, 'notes': 'Heavy'},
+        {'record_type': 'session', 'date': '2024-03-01T07:05:00', 'title': 'Leg Day', 'notes': 'Again'},
+    ]
+    with client.application.app_context():
+        result = importer.import_rows(1, rows)
+        
+        assert (result.sessions, result.exercises) == (1, 2)
+        assert result.errors == [(4, "duplicate session 'Leg Day' on 2024-03-01")]
+        leg_day = Session.query.one()
+        assert (leg_day.feeling_before, leg_day.notes, leg_day.date.hour) == (6, 'Heavy', 7)
+
+def test_rollup_failure_rolls_back_the_import(client, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('rollup rebuild failed')
+    monkeypatch.setattr(rollups, 'backfill', broken)
+    with client.application.app_context():
+        with pytest.raises(RuntimeError):
+            import_file(1, io.BytesIO(CSV_DATA.encode('utf-8')), 'history.csv')
+        assert Session.query.count() == 0
+        assert ExerciseLog.query.count() == 0
+        assert WeightLog.query.count() == 0
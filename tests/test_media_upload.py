@@ -0,0 +1,432 @@
+import io
+import logging
+import os
+import threading
+import time
+import pytest
+from Website import create_app, db, bcrypt
+from Website.models import User, Session, ExerciseLog, ExerciseMedia, Photo, MediaObject
+from Website.media_jobs import media_jobs
+from Website.storage import get_storage, StorageError, LocalStorage, RESUMABLE_CHUNK_SIZE
+from tests.conftest import AuthActions, get_csrf_token
+from tests.fake_storage import FakeStorageServer
+
+@pytest.fixture
+def storage(tmp_path):
+    server = FakeStorageServer(str(tmp_path / 'storage')).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def app(storage):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key',
+        'BCRYPT_LOG_ROUNDS': 4, # Cheapest cost bcrypt allows, to keep the suite fast
+        'SUPABASE_URL': storage.url,
+        'SUPABASE_API_KEY': storage.api_key,
+        'STORAGE_RETRY_BACKOFF': 0,
+        'MEDIA_STAGING_DIR': str(storage.root + '-staging'),
+        'MEDIA_WORKERS': 0,
+        'MEDIA_JOB_BACKOFF': 0
+    })
+    with app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com')
+        user.password = bcrypt.generate_password_hash('testpassword').decode('utf-8')
+        db.session.add(user)
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    AuthActions(client).login()
+    return client
+
+@pytest.fixture
+def local_client(tmp_path):
+    # Logged in, with files kept under tmp_path/uploads by the local backend
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key',
+        'BCRYPT_LOG_ROUNDS': 4,
+        'STORAGE_BACKEND': 'local',
+        'UPLOADS_BASE_DIR': str(tmp_path / 'uploads'),
+        'MEDIA_STAGING_DIR': str(tmp_path / 'staging')
+    })
+    with app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com', password=bcrypt.generate_password_hash('testpassword').decode('utf-8'))
+        db.session.add(user)
+        db.session.commit()
+        client = app.test_client()
+        AuthActions(client).login()
+        yield client
+        db.drop_all()
+
+def make_file(path, size):
+    # Sparse file of the given size; reading it back costs no memory
+    with open(path, 'wb') as f:
+        f.truncate(size)
+    return str(path)
+
+def current_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def peak_rss_during(function):
+    # Samples RSS in a background thread while function runs; returns the growth over the starting RSS
+    baseline = current_rss()
+    peak = [baseline]
+    done = threading.Event()
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], current_rss())
+            time.sleep(0.002)
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        function()
+    finally:
+        done.set()
+        sampler.join()
+    return peak[0] - baseline
+
+def test_photo_upload_is_streamed_to_storage(client, storage):
+    csrf_token = get_csrf_token(client.get('/progressphotos'))
+    response = client.post('/progressphotos', data={
+        'photo': (io.BytesIO(b'\xff\xd8' + b'x' * 200_000), 'front.jpg'),
+        'csrf_token': csrf_token
+    }, content_type='multipart/form-data', follow_redirects=True)
+
+    assert b'Photo uploaded successfully' in response.data
+    photo = Photo.query.one()
+    key = f"progress-photos/user_1/{photo.filename}"
+    assert ('POST', key) in storage.requests
+    assert storage.object_size(key) == 200_002
+
+def test_oversized_files_are_rejected_before_upload(app, client, storage):
+    app.config['MAX_PHOTO_SIZE'] = 1024
+    csrf_token = get_csrf_token(client.get('/progressphotos'))
+    response = client.post('/progressphotos', data={
+        'photo': (io.BytesIO(b'x' * 4096), 'big.jpg'),
+        'csrf_token': csrf_token
+    }, content_type='multipart/form-data', follow_redirects=True)
+    assert b'too large' in response.data
+    assert Photo.query.count() == 0
+    assert storage.requests == []
+
+    # Anything over MAX_CONTENT_LENGTH is refused from the headers alone
+    app.config['MAX_CONTENT_LENGTH'] = 2048
+    response = client.post('/progressphotos', data={
+        'photo': (io.BytesIO(b'x' * 4096), 'big.jpg'),
+        'csrf_token': csrf_token
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert storage.requests == []
+
+def test_large_video_uses_resumable_upload(app, client, storage, tmp_path):
+    session = Session(user_id=1, title='Leg Day')
+    db.session.add(session)
+    db.session.flush()
+    exercise = ExerciseLog(session_id=session.id, exercise='Squat', exercise_type='strength', sets=3, reps=5, weight=225, rpe=8)
+    db.session.add(exercise)
+    db.session.commit()
+
+    size = 2 * RESUMABLE_CHUNK_SIZE + 12345
+    csrf_token = get_csrf_token(client.get(f'/exercise_details/{exercise.id}'))
+    with open(make_file(tmp_path / 'squat.mp4', size), 'rb') as video:
+        client.post(f'/exercise_details/{exercise.id}', data={
+            'media': (video, 'squat.mp4'),
+            'csrf_token': csrf_token
+        }, content_type='multipart/form-data')
+
+    media = ExerciseMedia.query.one()
+    key = f"exercise-media/user_1/{media.filename}"
+    assert ('TUS', key) in storage.requests
+    assert storage.object_size(key) == size
+    assert storage.patch_sizes == [RESUMABLE_CHUNK_SIZE, RESUMABLE_CHUNK_SIZE, 12345]
+
+def test_resumable_upload_recovers_from_failed_chunk(app, storage, tmp_path):
+    storage.fail_patches = 2
+    size = RESUMABLE_CHUNK_SIZE + 100
+    with open(make_file(tmp_path / 'clip.mp4', size), 'rb') as f:
+        get_storage().upload('exercise-media', 'user_1/clip.mp4', f, 'video/mp4')
+    assert storage.object_size('exercise-media/user_1/clip.mp4') == size
+
+    storage.fail_patches = 100
+    with open(make_file(tmp_path / 'clip2.mp4', size), 'rb') as f:
+        with pytest.raises(StorageError):
+            get_storage().upload('exercise-media', 'user_1/clip2.mp4', f, 'video/mp4')
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason='needs /proc to read RSS')
+def test_upload_memory_is_flat(app, storage, tmp_path):
+    # Peak RSS while uploading should not depend on the file size
+    growth = {}
+    for size in (8 * 1024 * 1024, 96 * 1024 * 1024):
+        path = make_file(tmp_path / f'upload_{size}.bin', size)
+        with open(path, 'rb') as f:
+            growth[size] = peak_rss_during(lambda: get_storage().upload('exercise-media', f'user_1/{size}.bin', f))
+        assert storage.object_size(f'exercise-media/user_1/{size}.bin') == size
+
+    assert growth[96 * 1024 * 1024] < 32 * 1024 * 1024
+    assert growth[96 * 1024 * 1024] - growth[8 * 1024 * 1024] < 16 * 1024 * 1024
+
+def test_storage_retries_and_reuses_connections(app, storage):
+    backend = get_storage()
+    storage.fail_requests = 2
+    backend.upload('progress-photos', 'user_1/a.jpg', io.BytesIO(b'a' * 1000))
+    backend.upload('progress-photos', 'user_1/b.jpg', io.BytesIO(b'b' * 1000))
+    backend.delete('progress-photos', 'user_1/a.jpg')
+    backend.delete('progress-photos', 'user_1/missing.jpg') # Already gone counts as deleted
+
+    assert storage.object_size('progress-photos/user_1/b.jpg') == 1000
+    assert not storage.has_object('progress-photos/user_1/a.jpg')
+    assert len(storage.connections) == 1 # Every call went over the same pooled keep-alive connection
+    metrics = backend.metrics.snapshot()
+    assert metrics['upload'] == {'calls': 2, 'errors': 0, 'retries': 2, 'seconds': metrics['upload']['seconds']}
+    assert metrics['delete']['calls'] == 2
+
+    storage.fail_requests = 10
+    with pytest.raises(StorageError):
+        backend.upload('progress-photos', 'user_1/c.jpg', io.BytesIO(b'c'))
+    assert backend.metrics.snapshot()['upload']['errors'] == 1
+
+def test_local_backend_stores_and_serves_files(local_client):
+    client = local_client
+    app = client.application
+    with app.test_request_context():
+        backend = get_storage()
+        assert isinstance(backend, LocalStorage)
+        backend.upload('exercise-media', 'user_1/squat.mp4', io.BytesIO(b'video'))
+        with pytest.raises(StorageError):
+            backend.upload('exercise-media', 'user_1/squat.mp4', io.BytesIO(b'again'))
+        with pytest.raises(StorageError):
+            backend.upload('exercise-media', '../escape.txt', io.BytesIO(b'nope'))
+        url = backend.public_url('exercise-media', 'user_1/squat.mp4')
+
+    response = client.get(url)
+    assert response.data == b'video'
+
+    with app.app_context():
+        get_storage().delete('exercise-media', 'user_1/squat.mp4')
+    assert client.get(url).status_code == 404
+
+def test_media_route_stays_inside_buckets(local_client, tmp_path):
+    client = local_client
+    # UPLOADS_BASE_DIR is tmp_path/uploads; the secret sits next to it
+    (tmp_path / '.env').write_text('FLASK_SECRET_KEY=do-not-serve')
+    (tmp_path / 'uploads' / 'other').mkdir(parents=True)
+    (tmp_path / 'uploads' / 'other' / 'file.txt').write_text('not a media bucket')
+    for url in ['/media/..%2F.env', '/media/../.env', '/media/..%2F..%2F.env', '/media/other/file.txt']:
+        response = client.get(url)
+        assert response.status_code == 404, url
+        assert b'do-not-serve' not in response.data and b'not a media bucket' not in response.data
+
+    storage = get_storage()
+    for bucket in ['..', 'other', '../uploads']:
+        with pytest.raises(StorageError):
+            storage.bucket_dir(bucket)
+        with pytest.raises(StorageError):
+            storage.file_path(bucket, '.env')
+
+def test_media_route_requires_login(local_client):
+    local_client.get('/logout')
+    assert local_client.get('/media/progress-photos/user_1/a.jpg').status_code == 302
+
+def upload_photo(client, content=b'\xff\xd8photo'):
+    csrf_token = get_csrf_token(client.get('/progressphotos'))
+    return client.post('/progressphotos', data={
+        'photo': (io.BytesIO(content), 'side.jpg'),
+        'csrf_token': csrf_token
+    }, content_type='multipart/form-data')
+
+def test_uploads_finish_in_the_background(app, client, storage):
+    app.config['MEDIA_WORKERS'] = 2
+    media_jobs.init_app(app)
+    storage.gate.clear() # Storage does not answer until the gate opens
+    try:
+        response = upload_photo(client)
+        assert response.status_code == 302 # The request did not wait for storage
+
+        photo = Photo.query.one()
+        assert photo.status == 'pending'
+        status = client.get(f'/api/media_status/photo?ids={photo.id}').get_json()
+        assert status['media'][str(photo.id)] == {'status': 'pending', 'url': None, 'thumbnail': None, 'srcset': None}
+        assert b'Uploading...' in client.get('/progressphotos').data
+    finally:
+        storage.gate.set()
+        media_jobs.wait(timeout=10)
+    db.session.expire_all() # The worker updated the row through its own session
+
+    status = client.get(f'/api/media_status/photo?ids={photo.id}').get_json()
+    assert status['media'][str(photo.id)]['status'] == 'stored'
+    assert status['media'][str(photo.id)]['url'].endswith(f'/progress-photos/user_1/{photo.filename}')
+    assert not os.listdir(app.config['MEDIA_STAGING_DIR']) # Staging copy is cleaned up
+
+def test_failed_uploads_are_marked_and_can_be_retried(app, client, storage, caplog):
+    storage.fail_requests = 100
+    with caplog.at_level(logging.ERROR, logger=app.logger.name):
+        upload_photo(client)
+    db.session.expire_all()
+    photo = Photo.query.one()
+    assert photo.status == 'failed'
+    assert storage.requests == []
+    assert f'Upload of progress-photos/user_1/{photo.filename} failed' in caplog.text
+
+    storage.fail_requests = 0
+    result = app.test_cli_runner().invoke(args=['retry-media'])
+    assert 'Requeued 1 photo uploads' in result.output
+    db.session.expire_all()
+    assert Photo.query.one().status == 'stored'
+    assert storage.has_object(f'progress-photos/user_1/{photo.filename}')
+
+def test_media_status_only_shows_own_uploads(app, client):
+    other = User(username='other', email='other@example.com', password='x')
+    db.session.add(other)
+    db.session.flush()
+    db.session.add(Photo(user_id=other.id, filename='theirs.jpg'))
+    db.session.commit()
+    photo_id = Photo.query.one().id
+
+    assert client.get(f'/api/media_status/photo?ids={photo_id}').get_json() == {'media': {}}
+    assert client.get('/api/media_status/photo?ids=abc').status_code == 400
+    assert client.get('/api/media_status/nothing?ids=1').status_code == 404
+
+def test_reuploads_share_one_stored_object(app, client, storage):
+    photo_bytes = b'\xff\xd8same photo' * 100
+    upload_photo(client, photo_bytes)
+    upload_photo(client, photo_bytes)
+    upload_photo(client, b'\xff\xd8another photo')
+
+    first, second, third = Photo.query.order_by(Photo.id).all()
+    assert first.content_hash == second.content_hash != third.content_hash
+    assert second.filename == first.filename and second.status == 'stored'
+    assert len(storage.requests) == 2 # The second copy was never sent
+    media_object = MediaObject.query.filter_by(content_hash=first.content_hash).one()
+    assert media_object.ref_count == 2
+
+    # The object stays until its last reference is deleted
+    key = f"progress-photos/user_1/{first.filename}"
+    client.post(f'/delete_photo/{first.id}')
+    assert storage.has_object(key)
+    assert MediaObject.query.filter_by(content_hash=second.content_hash).one().ref_count == 1
+    client.post(f'/delete_photo/{second.id}')
+    assert not storage.has_object(key)
+    assert MediaObject.query.filter_by(content_hash=second.content_hash).count() == 0
+
+def test_duplicate_of_pending_upload_finishes_with_it(app, client, storage):
+    app.config['MEDIA_WORKERS'] = 2
+    media_jobs.init_app(app)
+    storage.gate.clear()
+    try:
+        upload_photo(client, b'\xff\xd8pending photo')
+        upload_photo(client, b'\xff\xd8pending photo')
+        assert [photo.status for photo in Photo.query.all()] == ['pending', 'pending']
+    finally:
+        storage.gate.set()
+        media_jobs.wait(timeout=10)
+    db.session.expire_all()
+
+    assert [photo.status for photo in Photo.query.all()] == ['stored', 'stored']
+    assert len(storage.requests) == 1
+
+def test_same_file_from_different_users_is_stored_twice(app, client, storage):
+    upload_photo(client, b'\xff\xd8shared')
+    other = User(username='other', email='other@example.com')
+    other.password = bcrypt.generate_password_hash('otherpassword').decode('utf-8')
+    db.session.add(other)
+    db.session.commit()
+
+    with app.app_context(): # Fresh context, so the first user's cached login in g is not reused
+        other_client = app.test_client()
+        AuthActions(other_client).login('other', 'otherpassword')
+        upload_photo(other_client, b'\xff\xd8shared')
+
+    assert MediaObject.query.count() == 2
+    assert len(storage.requests) == 2
+
+def put_object(storage, key, content=b'x'):
+    path = storage.path_for(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def test_reconcile_storage_finds_orphans_both_ways(app, client, storage):
+    upload_photo(client, b'\xff\xd8kept')
+    kept = Photo.query.one()
+    db.session.add_all([
+        Photo(user_id=1, filename='gone.jpg', status='stored'), # Row whose object was lost
+        Photo(user_id=1, filename='uploading.jpg', status='pending'),
+    ])
+    db.session.commit()
+    gone_id = Photo.query.filter_by(filename='gone.jpg').one().id
+    for key in ['user_1/orphan-a.jpg', 'user_1/orphan-b.jpg', 'user_7/left-behind.jpg', 'user_7/also.jpg']:
+        put_object(storage, f'progress-photos/{key}')
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['reconcile-storage', '--dry-run', '--min-age', '0'])
+    assert 'progress-photos: 5 objects, 4 orphaned, 1 rows missing their file' in result.output
+    assert '  orphan user_7/left-behind.jpg' in result.output
+    assert f'  missing user_1/gone.jpg (photo {gone_id})' in result.output
+    assert 'exercise-media: 0 objects' in result.output
+    assert storage.has_object('progress-photos/user_1/orphan-a.jpg')
+    assert storage.bulk_deletes == []
+
+    result = runner.invoke(args=['reconcile-storage', '--kind', 'photo', '--min-age', '0', '--batch-size', '3'])
+    assert 'Deleted 4 objects and 0 rows.' in result.output
+    assert 'rerun with --delete-missing-rows' in result.output
+    assert db.session.get(Photo, gone_id) is not None # Rows are only deleted when asked for
+
+    result = runner.invoke(args=['reconcile-storage', '--kind', 'photo', '--min-age', '0', '--delete-missing-rows'])
+    assert 'Deleted 0 objects and 1 rows.' in result.output
+    assert [len(batch) for batch in storage.bulk_deletes] == [3, 1]
+    assert not storage.has_object('progress-photos/user_1/orphan-a.jpg')
+    assert not storage.has_object('progress-photos/user_7/also.jpg')
+    assert storage.has_object(f'progress-photos/user_1/{kept.filename}')
+    db.session.expire_all()
+    assert sorted(photo.filename for photo in Photo.query.all()) == sorted([kept.filename, 'uploading.jpg'])
+
+    result = runner.invoke(args=['reconcile-storage', '--kind', 'photo', '--min-age', '0'])
+    assert 'progress-photos: 1 objects, 0 orphaned, 0 rows missing their file' in result.output
+
+def test_reconcile_storage_visits_every_folder(app, storage, monkeypatch):
+    # Two folders per root page; each folder is emptied (and so stops being listed) before the next page is read
+    for user_id in range(1, 6):
+        put_object(storage, f'progress-photos/user_{user_id}/orphan.jpg')
+    backend = get_storage()
+    list_objects = backend.list
+    monkeypatch.setattr(backend, 'list', lambda bucket, prefix='': list_objects(bucket, prefix, page_size=2))
+
+    result = app.test_cli_runner().invoke(args=['reconcile-storage', '--kind', 'photo', '--min-age', '0', '--batch-size', '1'])
+    assert 'Deleted 5 objects' in result.output
+    assert not any(storage.has_object(f'progress-photos/user_{user_id}/orphan.jpg') for user_id in range(1, 6))
+
+def test_reconcile_storage_skips_new_objects(app, storage):
+    put_object(storage, 'progress-photos/user_1/just-uploaded.jpg')
+    result = app.test_cli_runner().invoke(args=['reconcile-storage', '--kind', 'photo'])
+    assert '0 orphaned, 0 rows missing their file, 1 too new to judge' in result.output
+    assert storage.has_object('progress-photos/user_1/just-uploaded.jpg')
+
+def test_storage_listing_is_paged(app, storage):
+    for name in ['c.jpg', 'a.jpg', 'e.jpg', 'b.jpg', 'd.jpg']:
+        put_object(storage, f'exercise-media/user_1/{name}')
+    entries = list(get_storage().list('exercise-media', 'user_1', page_size=2))
+    assert [entry['name'] for entry in entries] == ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg', 'e.jpg']
+    assert all(not entry['folder'] and entry['created_at'] is not None for entry in entries)
+    assert [offset for _, _, offset in storage.listings] == [0, 2, 4]
+    assert [entry['name'] for entry in get_storage().list('exercise-media')] == ['user_1']
+
+def test_local_backend_lists_and_bulk_deletes(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    for name in ['b.jpg', 'a.jpg']:
+        storage.upload('bucket', f'user_1/{name}', io.BytesIO(b'data'))
+    assert [entry['name'] for entry in storage.list('bucket')] == ['user_1']
+    assert [entry['name'] for entry in storage.list('bucket', 'user_1')] == ['a.jpg', 'b.jpg']
+    storage.delete_many('bucket', ['user_1/a.jpg', 'user_1/missing.jpg'])
+    assert [entry['name'] for entry in storage.list('bucket', 'user_1')] == ['b.jpg']
+    assert list(storage.list('empty-bucket')) == []
@@ -0,0 +1,91 @@
+import io
+import os
+import subprocess
+import sys
+from prometheus_client import REGISTRY
+from sqlalchemy.exc import OperationalError
+from Website import db
+from Website.storage import SupabaseStorage
+from tests.conftest import assert_max_queries
+from tests.fake_storage import FakeStorageServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+def test_health_checks_skip_templates(client):
+    response = assert_max_queries(client, '/healthz', 0)
+    assert response.status_code == 200 and response.data == b'ok\n'
+
+    response = assert_max_queries(client, '/readyz', 1)
+    assert response.status_code == 200 and response.data == b'ready\n'
+
+def test_readyz_fails_without_database(client, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise OperationalError('SELECT 1', {}, Exception('connection refused'))
+    monkeypatch.setattr(db.session, 'execute', unavailable)
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert client.get('/healthz').status_code == 200 # Liveness does not depend on the database
+
+def test_request_and_pool_metrics(client):
+    labels = {'method': 'GET', 'endpoint': 'main.readyz'}
+    served = sample('http_requests_total', status='200', **labels)
+    timed = sample('http_request_duration_seconds_count', **labels)
+    checkouts = sample('db_pool_checkouts_total')
+    checked_out = sample('db_pool_checked_out')
+
+    client.get('/readyz')
+    client.get('/no-such-page')
+
+    assert sample('http_requests_total', status='200', **labels) == served + 1
+    assert sample('http_request_duration_seconds_count', **labels) == timed + 1
+    assert sample('http_requests_in_progress', endpoint='main.readyz') == 0
+    assert sample('http_requests_total', method='GET', endpoint='unmatched', status='404') >= 1
+    assert sample('db_pool_checkouts_total') > checkouts
+    db.session.remove() # What the end of each request's app context does outside the test fixture
+    assert sample('db_pool_checked_out') == checked_out
+
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.content_type.startswith('text/plain')
+    assert b'http_request_duration_seconds_bucket{endpoint="main.readyz"' in response.data
+
+def test_metrics_token(client):
+    client.application.config['METRICS_TOKEN'] = 'scrape-secret'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+def test_storage_calls_are_timed(tmp_path):
+    server = FakeStorageServer(str(tmp_path / 'storage')).start()
+    try:
+        storage = SupabaseStorage(server.url, server.api_key, backoff=0)
+        uploads = sample('storage_request_duration_seconds_count', operation='upload', outcome='ok')
+        storage.upload('progress-photos', 'user_1/a.jpg', io.BytesIO(b'photo'), 'image/jpeg')
+    finally:
+        server.stop()
+    assert sample('storage_request_duration_seconds_count', operation='upload', outcome='ok') == uploads + 1
+
+SERVE_ONE_REQUEST = '''
+from Website import create_app
+app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'SECRET_KEY': 'test',
+                  'STORAGE_BACKEND': 'local', 'UPLOADS_BASE_DIR': %(uploads)r, 'MEDIA_STAGING_DIR': %(staging)r})
+response = app.test_client().get(%(url)r)
+if %(url)r == '/metrics':
+    print(response.data.decode())
+'''
+
+def test_workers_share_metrics_directory(tmp_path):
+    # Each process stands in for a gunicorn worker; the last one serves the scrape
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path / 'metrics'))
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'])
+    def serve(url):
+        script = SERVE_ONE_REQUEST % {'url': url, 'uploads': str(tmp_path / 'uploads'), 'staging': str(tmp_path / 'staging')}
+        return subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, capture_output=True, text=True,
+                              check=True).stdout
+
+    serve('/healthz')
+    serve('/healthz')
+    output = serve('/metrics')
+    assert 'http_requests_total{endpoint="main.healthz",method="GET",status="200"} 2.0' in output
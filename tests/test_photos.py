@@ -1,6 +1,9 @@
 import pytest
+import io
+import logging
 import os
-from unittest.mock import patch, Mock
+from Website import views
+from Website.models import Photo
 from tests.conftest import get_csrf_token
 
 def test_upload_progress_photo(client, auth):
@@ -27,12 +30,29 @@ def test_upload_progress_photo(client, auth):
         if csrf_token:
             data['csrf_token'] = csrf_token
             
-        with patch('Website.views.requests.put') as mock_put:
-            mock_put.return_value = Mock(status_code=201)
-            response = client.post('/progressphotos', 
-                                   data=data, 
-                                   follow_redirects=True, 
-                                   content_type='multipart/form-data')
+        response = client.post('/progressphotos', 
+                               data=data, 
+                               follow_redirects=True, 
+                               content_type='multipart/form-data')
     
     assert response.status_code == 200
-    assert b'Photo uploaded successfully' in response.data
\ No newline at end of file
+    assert b'Photo uploaded successfully' in response.data
+    
+    # The local storage backend keeps the file under UPLOADS_BASE_DIR
+    uploads = os.path.join(client.application.config['UPLOADS_BASE_DIR'], 'progress-photos', 'user_1')
+    assert [name for name in os.listdir(uploads) if name.endswith('test_image.jpg')]
+
+def test_failed_staging_is_logged(client, auth, monkeypatch, caplog):
+    def disk_full(*args):
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(views, 'queue_upload', disk_full)
+    auth.login()
+    csrf_token = get_csrf_token(client.get('/progressphotos'))
+    with caplog.at_level(logging.ERROR, logger=client.application.logger.name):
+        response = client.post('/progressphotos', data={'photo': (io.BytesIO(b'\xff\xd8photo'), 'side.jpg'), 'csrf_token': csrf_token},
+                               content_type='multipart/form-data', follow_redirects=True)
+
+    assert b'Failed to upload photo.' in response.data
+    assert Photo.query.count() == 0
+    record = next(record for record in caplog.records if record.message.startswith('Could not stage photo upload'))
+    assert record.exc_info[1].strerror == 'No space left on device'
@@ -0,0 +1,106 @@
+import pytest
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from Website import db
+from Website.models import Session, ExerciseLog, ExerciseMedia, Note, Challenge, UserChallenge
+from Website.commands import explain_queries_command
+from tests.conftest import AuthActions, assert_max_queries, get_csrf_token
+import datetime
+
+def test_explain_queries_uses_indexes(client):
+    runner = client.application.test_cli_runner()
+    result = runner.invoke(explain_queries_command, ['--user-id', '1'])
+
+    assert result.exit_code == 0
+    assert 'ix_session_user_id_date' in result.output
+    assert 'ix_weight_log_user_id_date' in result.output
+    assert 'ix_note_user_id_updated_at' in result.output
+    assert 'ix_exercise_log_session_id' in result.output
+    assert 'media_object USING INDEX sqlite_autoindex_media_object_1 (user_id=? AND content_hash=?' in result.output
+    assert 'ix_photo_user_id_content_hash (user_id=? AND content_hash=?)' in result.output
+    assert 'exercise_media USING INDEX ix_exercise_media_exercise_id' in result.output # Reached through the user's sessions
+
+def test_user_challenge_is_unique(client):
+    with client.application.app_context():
+        challenge = Challenge(
+            title='Push-ups',
+            description='100 push-ups',
+            type='daily',
+            goal_value=100,
+            end_date=datetime.datetime.today() + datetime.timedelta(days=7),
+            badge_name='Pusher',
+            badge_image='💪',
+            base_points=100
+        )
+        db.session.add(challenge)
+        db.session.commit()
+
+        db.session.add(UserChallenge(user_id=1, challenge_id=challenge.id))
+        db.session.commit()
+        db.session.add(UserChallenge(user_id=1, challenge_id=challenge.id))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+def add_history(user_id, rows):
+    # rows sessions of two exercises, rows notes (every other one linked to a session) and rows joined challenges;
+    # returns the ids of the first session, exercise and user challenge
+    now = datetime.datetime.now()
+    sessions = [Session(user_id=user_id, title=f'Workout {i}', date=now - datetime.timedelta(days=i), feeling_before=5)
+                for i in range(rows)]
+    challenges = [Challenge(title=f'Challenge {i}', description='Hit the goal', type='weekly', goal_value=100,
+                            metric='reps', end_date=now + datetime.timedelta(days=30), badge_name=f'Badge {i}',
+                            badge_image='🏆', base_points=100) for i in range(rows)]
+    db.session.add_all(sessions + challenges)
+    db.session.flush()
+    exercises = [ExerciseLog(session_id=session.id, exercise=name, exercise_type='strength', sets=3, reps=8, rpe=7,
+                             weight=100, date=session.date) for session in sessions for name in ['Squat', 'Bench Press']]
+    user_challenges = [UserChallenge(user_id=user_id, challenge_id=challenge.id, current_value=10) for challenge in challenges]
+    db.session.add_all(exercises + user_challenges)
+    db.session.add_all([Note(user_id=user_id, title=f'Note {i}', content='Felt strong', tags='legs,pr',
+                             session_id=session.id if i % 2 == 0 else None) for i, session in enumerate(sessions)])
+    db.session.commit()
+    return sessions[0].id, exercises[0].id, user_challenges[0].id
+
+# Queries per page, which must not grow with the number of rows on it (the logged-in user comes from the user cache)
+PAGE_QUERIES = [
+    ('/dashboard', 1),
+    ('/session_details/{session_id}', 3), # session, exercises, linked notes
+    ('/exercise_details/{exercise_id}', 2), # exercise with its session, media page
+    ('/notes', 2), # notes with their sessions, session picker
+    ('/challenges', 2), # active, completed
+    ('/my_challenges', 1),
+    ('/update_challenge/{user_challenge_id}', 1),
+]
+
+@pytest.mark.parametrize('url, max_queries', PAGE_QUERIES)
+def test_page_queries_do_not_grow_with_rows(client, url, max_queries):
+    AuthActions(client).login()
+    for rows in [1, 25]:
+        with client.application.app_context():
+            session_id, exercise_id, user_challenge_id = add_history(1, rows)
+        page = url.format(session_id=session_id, exercise_id=exercise_id, user_challenge_id=user_challenge_id)
+        response = assert_max_queries(client, page, max_queries)
+        assert response.status_code == 200
+
+def test_unloaded_relationships_raise(client):
+    session_id, exercise_id, user_challenge_id = add_history(1, 2)
+    db.session.expunge_all()
+    user_challenge = db.session.get(UserChallenge, user_challenge_id)
+    with pytest.raises(InvalidRequestError):
+        user_challenge.challenge # Would be one query per card on my_challenges
+    with pytest.raises(InvalidRequestError):
+        db.session.get(Session, session_id).exercises
+
+def test_delete_exercise_deletes_media(client):
+    AuthActions(client).login()
+    with client.application.app_context():
+        session_id, exercise_id, user_challenge_id = add_history(1, 1)
+        media = ExerciseMedia(exercise_id=exercise_id, filename='squat.jpg', media_type='photo', status='ready')
+        db.session.add(media)
+        db.session.commit()
+        media_id = media.id
+
+    response = client.get(f'/session_details/{session_id}')
+    client.post(f'/delete_exercise/{exercise_id}/{session_id}', data={'csrf_token': get_csrf_token(response)})
+    assert db.session.get(ExerciseLog, exercise_id) is None
+    assert db.session.get(ExerciseMedia, media_id) is None
@@ -0,0 +1,55 @@
+import datetime
+from Website import create_app, db
+from Website.models import User, Session, ExerciseLog, WeightLog, Note, DailyRollup
+from Website.seed import seed
+from tests.conftest import AuthActions
+
+LAST_DAY = datetime.datetime(2026, 6, 30)
+
+def make_app(tmp_path, name):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / name}",
+        'SECRET_KEY': 'test-secret-key',
+        'BCRYPT_LOG_ROUNDS': 4,
+        'STORAGE_BACKEND': 'local',
+        'UPLOADS_BASE_DIR': str(tmp_path / 'uploads'),
+        'MEDIA_STAGING_DIR': str(tmp_path / 'staging'),
+    })
+
+def history(username):
+    user = User.query.filter_by(username=username).one()
+    rows = db.session.execute(db.select(Session.date, ExerciseLog.exercise, ExerciseLog.sets, ExerciseLog.reps, ExerciseLog.weight).
+                              join(ExerciseLog, ExerciseLog.session_id == Session.id).
+                              where(Session.user_id == user.id).order_by(ExerciseLog.id)).all()
+    weights = db.session.execute(db.select(WeightLog.date, WeightLog.weight).filter_by(user_id=user.id).order_by(WeightLog.id)).all()
+    return rows, weights
+
+def test_seed_is_deterministic_and_tops_up(tmp_path):
+    whole = make_app(tmp_path, 'whole.db')
+    with whole.app_context():
+        result = seed(users=4, days=60, last_day=LAST_DAY)
+        assert result.rows['users'] == 4
+        assert result.rows['sessions'] == Session.query.count() > 0
+        assert ExerciseLog.query.count() > result.rows['sessions']
+        assert WeightLog.query.count() and Note.query.filter(Note.session_id.isnot(None)).count()
+        assert DailyRollup.query.count() == result.rows['rollups'] > 0
+        expected = history('seed000003')
+
+    topped_up = make_app(tmp_path, 'topped_up.db')
+    with topped_up.app_context():
+        seed(users=2, days=60, last_day=LAST_DAY)
+        result = seed(users=4, days=60, last_day=LAST_DAY, batch_users=1)
+        assert result.rows['users'] == 2 # Only the missing users
+        assert seed(users=4, days=60, last_day=LAST_DAY).total == 0
+        assert history('seed000003') == expected
+
+def test_seed_command_and_login(client):
+    result = client.application.test_cli_runner().invoke(args=['seed', '--users', '2', '--days', '30', '--last-day', '2026-06-30'])
+    assert result.exit_code == 0, result.output
+    assert 'Added 2 users' in result.output and 'seed000001' in result.output
+
+    weights = [row.weight for row in ExerciseLog.query.filter_by(exercise_type='strength').filter(ExerciseLog.weight > 0)]
+    assert weights and all(weight % 2.5 == 0 for weight in weights) # Plate-loadable weights
+
+    assert b'Dashboard' in AuthActions(client).login('seed000001', 'seedpassword').data
@@ -1,7 +1,9 @@
 import pytest
-from Website.models import Session
+from sqlalchemy.exc import IntegrityError
+from Website.models import Session, ExerciseLog
 from Website import db
 from tests.conftest import get_csrf_token
+import datetime
 
 def test_create_session(client, auth):
     auth.login()
@@ -76,4 +78,97 @@ def test_log_exercise(client, auth):
     
     assert response.status_code == 200
     assert b'Exercise logged successfully' in response.data
-    assert b'Bench Press' in response.data
\ No newline at end of file
+    assert b'Bench Press' in response.data
+
+def test_session_feed_pagination(client, auth):
+    auth.login()
+    
+    with client.application.app_context():
+        start = datetime.datetime(2024, 1, 1)
+        for i in range(45):
+            db.session.add(Session(
+                title=f'Workout {i}',
+                feeling_before=5,
+                user_id=1,
+                date=start + datetime.timedelta(days=i // 2) # Two sessions per day to exercise the id tie-break
+            ))
+        db.session.commit()
+    
+    response = client.get('/dashboard')
+    assert b'Workout 44' in response.data
+    assert b'Workout 0<' not in response.data
+    assert b'load-more-sessions' in response.data
+    
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/sessions' + (f'?after={cursor}' if cursor else '')
+        page = client.get(url).get_json()
+        seen.extend(s['title'] for s in page['sessions'])
+        cursor = page['next']
+        if not cursor:
+            break
+    
+    assert len(seen) == 45
+    assert len(set(seen)) == 45
+    assert seen[0] == 'Workout 44'
+    assert seen[-1] == 'Workout 0'
+
+def test_session_dates_are_never_null(client, auth):
+    auth.login()
+    
+    with client.application.app_context():
+        # A session without a date gets the default, so the feed can always page past it
+        db.session.add(Session(title='Undated', user_id=1, date=None))
+        db.session.add(Session(title='Dated', user_id=1, date=datetime.datetime(2024, 1, 1)))
+        db.session.commit()
+        
+        # Rows written around the ORM can't store a NULL date either
+        with pytest.raises(IntegrityError):
+            db.session.execute(Session.__table__.insert().values(title='Null date', user_id=1, date=None))
+        db.session.rollback()
+    
+    first = client.get('/api/sessions?limit=1').get_json()
+    second = client.get(f"/api/sessions?limit=1&after={first['next']}").get_json()
+    assert [s['title'] for s in first['sessions'] + second['sessions']] == ['Undated', 'Dated']
+    assert second['next'] is None
+
+def test_session_feed_rejects_bad_cursor(client, auth):
+    auth.login()
+    response = client.get('/api/sessions?after=not-a-cursor')
+    assert response.status_code == 400
+
+def test_log_exercises_batch(client, auth):
+    auth.login()
+    
+    with client.application.app_context():
+        new_session = Session(title='Push Day', feeling_before=6, user_id=1)
+        db.session.add(new_session)
+        db.session.commit()
+        session_id = new_session.id
+    
+    csrf_token = get_csrf_token(client.get(f'/session_details/{session_id}'))
+    data = {'csrf_token': csrf_token}
+    for index, (exercise, reps) in enumerate([('Bench Press', 8), ('Bench Press', 6), ('Bench Press', 5), ('Dips', 12)]):
+        data.update({
+            f'exercises-{index}-exercise': exercise,
+            f'exercises-{index}-exercise_type': 'strength',
+            f'exercises-{index}-sets': 1,
+            f'exercises-{index}-reps': reps,
+            f'exercises-{index}-weight': 185,
+            f'exercises-{index}-rpe': 8
+        })
+    
+    response = client.post(f'/session_details/{session_id}/batch', data=data, headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert response.status_code == 200
+    assert b'<html' not in response.data # Only the table fragment comes back
+    assert response.data.count(b'clickable-row') == 4
+    
+    # One invalid row rejects the whole batch
+    data['exercises-3-reps'] = ''
+    response = client.post(f'/session_details/{session_id}/batch', data=data, headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert response.status_code == 400
+    assert 'exercises' in response.get_json()['errors']
+    
+    with client.application.app_context():
+        assert ExerciseLog.query.filter_by(session_id=session_id).count() == 4
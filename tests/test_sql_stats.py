@@ -0,0 +1,53 @@
+import logging
+import pytest
+from Website import db
+from Website.models import User
+from Website.sql_stats import QueryStats, fingerprint
+from tests.conftest import AuthActions, assert_max_queries
+
+def test_fingerprint_folds_values():
+    assert fingerprint("SELECT * FROM note WHERE id = 5 AND title = 'it''s'") == 'SELECT * FROM note WHERE id = ? AND title = ?'
+    assert fingerprint('SELECT * FROM note\n  WHERE id IN (?, ?, ?)') == 'SELECT * FROM note WHERE id IN (?)'
+    assert fingerprint('SELECT anon_1.id FROM user_1 LIMIT %(param_1)s') == 'SELECT anon_1.id FROM user_1 LIMIT %(param_1)s'
+
+    stats = QueryStats()
+    for user_id in range(3):
+        stats.record(f'SELECT * FROM user WHERE id = {user_id}', 0.001)
+    stats.record('SELECT * FROM note', 0.002)
+    assert stats.count == 4 and stats.seconds == pytest.approx(0.005)
+    assert stats.repeated(3) == [('SELECT * FROM user WHERE id = ?', 3)]
+
+def test_server_timing_header(client):
+    AuthActions(client).login()
+    response = client.get('/dashboard')
+    assert response.status_code == 200
+    db_timing, total_timing = response.headers['Server-Timing'].split(', ')
+    assert db_timing.startswith('db;dur=') and 'queries"' in db_timing
+    assert total_timing.startswith('total;dur=')
+
+    client.application.config['SERVER_TIMING'] = False
+    assert 'Server-Timing' not in client.get('/dashboard').headers
+
+def test_repeated_statement_is_logged(client, caplog):
+    app = client.application
+    @app.route('/lazy-loop')
+    def lazy_loop():
+        for _ in range(5):
+            db.session.execute(db.select(User).filter_by(id=1)).scalar_one()
+        return 'ok'
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        assert_max_queries(client, '/lazy-loop', 5)
+    assert 'Possible N+1 query on GET lazy_loop: 5 x SELECT' in caplog.text
+
+    caplog.clear()
+    app.config['N_PLUS_ONE_THRESHOLD'] = 6
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        client.get('/lazy-loop')
+    assert 'N+1' not in caplog.text
+
+def test_assert_max_queries_fails_over_the_limit(client):
+    AuthActions(client).login()
+    assert_max_queries(client, '/notes', 10)
+    with pytest.raises(AssertionError, match=r'GET /notes ran \d+ queries \(max 0\)'):
+        assert_max_queries(client, '/notes', 0)
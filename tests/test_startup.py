@@ -0,0 +1,68 @@
+import click
+import pytest
+from sqlalchemy import inspect
+from Website import create_app, db
+from Website.startup import parse_importtime
+
+def make_app(tmp_path, **config):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+        'SECRET_KEY': 'test-secret-key',
+        'STORAGE_BACKEND': 'local',
+        'UPLOADS_BASE_DIR': str(tmp_path / 'uploads'),
+        'MEDIA_STAGING_DIR': str(tmp_path / 'staging'),
+        **config
+    })
+
+def test_migrations_mode_leaves_the_schema_alone(tmp_path):
+    app = make_app(tmp_path, SCHEMA_MANAGEMENT='migrations')
+    with app.app_context():
+        assert inspect(db.engine).get_table_names() == []
+
+    app = make_app(tmp_path) # create_all is still the default
+    with app.app_context():
+        assert 'user' in inspect(db.engine).get_table_names()
+
+    with pytest.raises(ValueError):
+        make_app(tmp_path, SCHEMA_MANAGEMENT='sometimes')
+
+def test_migrate_is_only_set_up_for_the_flask_command(tmp_path):
+    app = make_app(tmp_path)
+    assert 'migrate' not in app.extensions and 'db' not in app.cli.commands
+
+    with click.Context(click.Command('flask')): # How the flask command builds the app
+        app = make_app(tmp_path)
+    assert 'migrate' in app.extensions and 'db' in app.cli.commands
+
+def test_init_schema_bootstraps_an_empty_database(tmp_path):
+    app = make_app(tmp_path, SCHEMA_MANAGEMENT='migrations')
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['init-schema'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        assert 'user' in tables and 'alembic_version' in tables
+
+    result = runner.invoke(args=['init-schema'])
+    assert 'already managed by migrations' in result.output
+
+def test_startup_profile_reports_each_phase(tmp_path):
+    app = make_app(tmp_path)
+    result = app.test_cli_runner().invoke(args=['startup-profile', '--runs', '1', '--schema', 'migrations'])
+    assert result.exit_code == 0, result.output
+    assert 'Cold start (migrations, median of 1)' in result.output
+    for phase in ['import Website', 'extensions', 'schema', 'views', 'Slowest imports']:
+        assert phase in result.output
+    assert 'flask_migrate' not in result.output # Alembic is not imported by a worker start
+
+def test_parse_importtime_keeps_top_two_levels():
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       100 |        100 |     sqlalchemy.sql',
+        'import time:       200 |        300 |   sqlalchemy',
+        'import time:      1000 |       1500 | Website',
+        'import time:        50 |         50 | Website.cache',
+    ])
+    assert parse_importtime(output) == {'sqlalchemy': 0.0003, 'Website.cache': 0.00005}
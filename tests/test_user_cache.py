@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import event
+from Website import create_app, db, bcrypt
+from Website.models import User
+from Website.cache import user_cache, UserSnapshot
+from tests.conftest import AuthActions
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key',
+        'BCRYPT_LOG_ROUNDS': 4, # Cheapest cost bcrypt allows, to keep the suite fast
+        'STORAGE_BACKEND': 'local',
+        'UPLOADS_BASE_DIR': str(tmp_path / 'uploads'),
+        'MEDIA_STAGING_DIR': str(tmp_path / 'staging'),
+        'MEDIA_WORKERS': 0
+    })
+    with app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com')
+        user.password = bcrypt.generate_password_hash('testpassword').decode('utf-8')
+        db.session.add(user)
+        db.session.commit()
+    # No app context is left pushed, so each request loads its user the way it would in production
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def user_queries(app, client, url):
+    # Statements against the user table issued while serving url
+    with app.app_context():
+        engine = db.engine
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200
+    return [statement for statement in statements if 'FROM user' in statement]
+
+def test_user_is_loaded_once_per_ttl(app):
+    client = app.test_client()
+    AuthActions(client).login()
+    user_cache.clear()
+
+    assert len(user_queries(app, client, '/settings')) == 1
+    assert user_queries(app, client, '/settings') == []
+    assert user_queries(app, client, '/dashboard') == []
+
+    user_cache.ttl = 0 # USER_CACHE_TTL=0 turns the cache off: one user query per request, as before
+    user_cache.clear()
+    assert len(user_queries(app, client, '/settings')) == 1
+    assert len(user_queries(app, client, '/settings')) == 1
+
+def test_settings_change_invalidates_cached_user(app):
+    client = app.test_client()
+    AuthActions(client).login()
+    assert b'Hello testuser!' in client.get('/dashboard').data
+
+    client.post('/settings', data={'theme': 'dark', 'display_name': 'Lifter'})
+    page = client.get('/dashboard').data
+    assert b'Hello Lifter!' in page
+    with app.app_context():
+        assert db.session.get(User, 1).theme == 'dark'
+
+def test_signed_cookie_snapshot_skips_the_database(app):
+    app.config['USER_SNAPSHOT_COOKIE'] = True
+    client = app.test_client()
+    AuthActions(client).login()
+    client.get('/settings') # Stores the snapshot in the session cookie
+    user_cache.clear()
+
+    assert user_queries(app, client, '/settings') == []
+
+    client.post('/settings', data={'theme': 'dark', 'display_name': 'Cookie'})
+    assert b'Hello Cookie!' in client.get('/dashboard').data
+
+def test_snapshot_is_read_only():
+    snapshot = UserSnapshot(id=1, username='testuser', theme='light')
+    assert snapshot.get_id() == '1' and snapshot.is_authenticated
+    with pytest.raises(AttributeError):
+        snapshot.theme = 'dark'
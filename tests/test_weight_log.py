@@ -0,0 +1,43 @@
+import pytest
+import datetime
+from Website.models import WeightLog
+from Website import db
+from Website.series import lttb
+
+def add_daily_weights(app, days):
+    with app.app_context():
+        start = datetime.datetime.now() - datetime.timedelta(days=days)
+        for i in range(days):
+            db.session.add(WeightLog(user_id=1, weight=180 + (i % 10), date=start + datetime.timedelta(days=i)))
+        db.session.commit()
+
+def test_lttb_keeps_endpoints_and_peaks():
+    points = [(i, 0) for i in range(1000)]
+    points[500] = (500, 50) # A single spike must survive downsampling
+    sampled = lttb(points, 50)
+    
+    assert len(sampled) == 50
+    assert sampled[0] == points[0]
+    assert sampled[-1] == points[-1]
+    assert (500, 50) in sampled
+
+def test_weight_series_is_downsampled(client, auth):
+    auth.login()
+    add_daily_weights(client.application, 1000)
+    
+    series = client.get('/api/weight_series?range=all&points=100').get_json()
+    assert series['total'] == 1000
+    assert len(series['points']) == 100
+    
+    series = client.get('/api/weight_series?range=30d').get_json()
+    assert series['total'] <= 31
+    assert len(series['points']) == series['total']
+
+def test_weight_log_table_is_paginated(client, auth):
+    auth.login()
+    add_daily_weights(client.application, 100)
+    
+    response = client.get('/weightlog')
+    assert response.status_code == 200
+    assert response.data.count(b'<li class="weight-log-item">') == 30
+    assert b'Older' in response.data